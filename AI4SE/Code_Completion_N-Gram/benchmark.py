@@ -0,0 +1,259 @@
+# benchmarks for the n-gram pipeline
+# runs on a synthetic Zipf-distributed token corpus by default, pass --csv to use
+# the tokenized java_class_data.csv instead
+#
+#   python3 benchmark.py memory --max-n 5
+#   python3 benchmark.py train
+#   python3 benchmark.py eval
+#   python3 benchmark.py beam
+#   python3 benchmark.py cleansing
+#   python3 benchmark.py extract
+
+import argparse
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from main import (tokenize_java, cleansing, encode_splits, train_ngram_model, train_ngram_models, train_kneser_ney_models,
+                  evaluate_model, generate, generate_batch)
+from ngram_store import NGramTrie
+
+
+# token lists drawn from a Zipf distribution over a fixed vocabulary
+def synthetic_corpus(num_classes=5000, vocab_size=2000, mean_length=80, seed=42):
+    rng = np.random.default_rng(seed)
+    words = np.array([f"tok{i}" for i in range(vocab_size)], dtype=object)
+    lengths = rng.poisson(mean_length, size=num_classes) + 1
+    corpus = []
+    for length in lengths:
+        ranks = np.minimum(rng.zipf(1.3, size=length), vocab_size) - 1
+        corpus.append(words[ranks].tolist())
+    return corpus
+
+
+# train/val/test token lists with <UNK> handling, same split as model.py
+def load_splits(csv_path=None, min_freq=7):
+    from sklearn.model_selection import train_test_split
+
+    if csv_path:
+        java_data = pd.read_csv(csv_path)
+        java_data = java_data[java_data['code_tokens'] <= 100]
+        tokenized = java_data['clean_java_class'].apply(tokenize_java).tolist()
+    else:
+        tokenized = synthetic_corpus()
+
+    tokenized_data = pd.DataFrame({'tokenized_code': tokenized})
+    train, test = train_test_split(tokenized_data, test_size=0.1, random_state=42)
+    train, val = train_test_split(train, test_size=0.2, random_state=42)
+    final_train, final_val, final_test, vocabulary = cleansing(train, val, test, min_freq)
+    vocab = {word: idx for idx, word in enumerate(vocabulary)}
+    return (final_train.iloc[:, 0].tolist(), final_val.iloc[:, 0].tolist(),
+            final_test.iloc[:, 0].tolist(), vocab)
+
+
+# size of an object graph, every object counted once
+# strings are skipped since the vocabulary is shared by every model layout
+def deep_sizeof(obj):
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        if isinstance(item, str):
+            continue
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (tuple, list)):
+            stack.extend(item)
+    return total
+
+
+# bytes per n-gram of the nested-dict model against NGramStore
+def bench_memory(train, vocab, max_n):
+    print(f"{'n':>2} {'n-grams':>10} {'dict B/ngram':>13} {'store B/ngram':>14} {'ratio':>7}")
+    for n in range(1, max_n + 1):
+        nested = train_ngram_model(train, n, vocab)
+        store = train_ngram_model(train, n, vocab, compact=True)
+        dict_bytes = deep_sizeof(nested)
+        num_ngrams = store.num_ngrams
+        print(f"{n:>2} {num_ngrams:>10} {dict_bytes / num_ngrams:>13.1f} "
+              f"{store.nbytes / num_ngrams:>14.1f} {dict_bytes / store.nbytes:>6.1f}x")
+
+
+# per-order training loop against single-pass multi-order training
+def bench_train(train, vocab, max_n):
+    start = time.perf_counter()
+    for n in range(1, max_n + 1):
+        train_ngram_model(train, n, vocab)
+    looped_dict = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for n in range(1, max_n + 1):
+        train_ngram_model(train, n, vocab, compact=True)
+    looped_store = time.perf_counter() - start
+
+    start = time.perf_counter()
+    train_ngram_models(train, max_n, vocab)
+    single_pass = time.perf_counter() - start
+
+    print(f"orders 1..{max_n}")
+    print(f"per-order loop, nested dict: {looped_dict:8.2f}s")
+    print(f"per-order loop, NGramStore:  {looped_store:8.2f}s")
+    print(f"single pass, NGramTrie:      {single_pass:8.2f}s")
+
+
+# per-n-gram perplexity loop over the nested dict against the batched evaluation
+# of NGramStore on the validation split
+def bench_eval(train, val, vocab, max_n):
+    models = train_ngram_models(train, max_n, vocab)
+    print(f"{'n':>2} {'loop s':>8} {'batched s':>10} {'speedup':>8} {'perplexity':>14} {'rel diff':>9}")
+    for n in range(1, max_n + 1):
+        nested = train_ngram_model(train, n, vocab)
+        start = time.perf_counter()
+        expected = evaluate_model(n, val, nested, vocab)
+        looped = time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = evaluate_model(n, val, models[n], vocab, batched=True)
+        batched = time.perf_counter() - start
+
+        print(f"{n:>2} {looped:>8.3f} {batched:>10.3f} {looped / batched:>7.1f}x "
+              f"{actual:>14.2f} {abs(actual - expected) / expected:>9.1e}")
+
+
+# greedy one-prompt-at-a-time generation against batched beam search over every
+# test prefix, in generated tokens per second
+def bench_beam(train, test, vocab, max_n, beam_widths=(1, 4, 8)):
+    prefixes = [tokens[:3] for tokens in test]
+    trie = NGramTrie.from_corpus(train, max_n, vocab)
+    models = train_ngram_models(train, max_n, vocab, trie)
+    kn_models = train_kneser_ney_models(train, max_n, vocab, trie)
+
+    print(f"{len(prefixes)} prefixes")
+    print(f"{'n':>2} {'model':>11} {'decoder':>10} {'tokens':>8} {'tokens/s':>10}")
+    for n in range(2, max_n + 1):
+        for name, model in (('NGramStore', models[n]), ('Kneser-Ney', kn_models[n])):
+            start = time.perf_counter()
+            generated = sum(len(generate(prefix, n, model, vocab)) - len(prefix) for prefix in prefixes)
+            elapsed = time.perf_counter() - start
+            print(f"{n:>2} {name:>11} {'greedy':>10} {generated:>8} {generated / elapsed:>10.0f}")
+
+            for beam_width in beam_widths:
+                start = time.perf_counter()
+                completions = generate_batch(prefixes, n, model, vocab, beam_width=beam_width)
+                elapsed = time.perf_counter() - start
+                generated = sum(len(c) - len(p) for c, p in zip(completions, prefixes))
+                print(f"{n:>2} {name:>11} {f'beam {beam_width}':>10} {generated:>8} {generated / elapsed:>10.0f}")
+
+
+# cleansing (python sets, token lists) against encode_splits (hash table, int arrays)
+def bench_cleansing(min_freq=7):
+    tokenized_data = pd.DataFrame({'tokenized_code': synthetic_corpus(num_classes=20000)})
+    train, val, test = tokenized_data[:16000], tokenized_data[16000:18000], tokenized_data[18000:]
+
+    start = time.perf_counter()
+    cleansing(train, val, test, min_freq)
+    cleansed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    encode_splits(train, val, test, min_freq)
+    encoded = time.perf_counter() - start
+
+    print(f"cleansing:     {cleansed:6.2f}s")
+    print(f"encode_splits: {encoded:6.2f}s ({cleansed / encoded:.1f}x)")
+
+
+# the per-match brace scan extract_java_class used before the single-pass extractor,
+# kept here as the baseline for bench_extract
+def previous_extract_java_class(code):
+    code = re.sub(r'//.*?$|/\*.*?\*/', '', code, flags=re.MULTILINE | re.DOTALL)
+    code = '\n'.join(line.strip() for line in code.split('\n') if line.strip())
+    classes = []
+    for match in re.finditer(r'(?:public\s+|protected\s+|private\s+)?(?:abstract\s+)?class\s+(\w+)'
+                             r'(?:\s+extends\s+\w+)?(?:\s+implements\s+[\w,\s]+)?\s*\{', code):
+        brace_count = 0
+        end_index = match.start()
+        for i, char in enumerate(code[match.start():], start=match.start()):
+            if char == '{':
+                brace_count += 1
+            elif char == '}':
+                brace_count -= 1
+                if brace_count == 0:
+                    end_index = i + 1
+                    break
+        classes.append(code[match.start():end_index].strip())
+    return classes[0] if classes else ''
+
+
+# a java file with num_classes classes nested num_classes deep, so every class body
+# spans the rest of the file; string literals hold braces the extractor has to skip
+def synthetic_java_file(num_classes, fields_per_class=20):
+    lines = []
+    for i in range(num_classes):
+        lines.append(f"public class C{i} extends Base implements Runnable {{")
+        for j in range(fields_per_class):
+            lines.append(f'    private String f{j} = "value {{{j}}}";')
+        lines.append(f"    public void run() {{ if (f0 != null) {{ count += {i}; }} }}")
+    lines.extend('}' for _ in range(num_classes))
+    return '\n'.join(lines)
+
+
+# time per character of both extractors on files of doubling size
+def bench_extract(sizes=(25, 50, 100, 200, 400, 800)):
+    from class_extract import extract_java_class
+
+    print(f"{'classes':>8} {'chars':>10} {'single pass s':>14} {'ns/char':>8} {'previous s':>11} {'ns/char':>8}")
+    for num_classes in sizes:
+        code = synthetic_java_file(num_classes)
+        start = time.perf_counter()
+        extract_java_class(code)
+        single_pass = time.perf_counter() - start
+
+        start = time.perf_counter()
+        previous_extract_java_class(code)
+        previous = time.perf_counter() - start
+
+        print(f"{num_classes:>8} {len(code):>10} {single_pass:>14.4f} {single_pass / len(code) * 1e9:>8.0f} "
+              f"{previous:>11.4f} {previous / len(code) * 1e9:>8.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks for the n-gram code completion model')
+    parser.add_argument('benchmark', choices=['memory', 'train', 'eval', 'beam', 'cleansing', 'extract'])
+    parser.add_argument('--csv', default=None, help='use a java_class_data.csv file instead of synthetic data')
+    parser.add_argument('--max-n', type=int, default=5)
+    args = parser.parse_args()
+
+    # benchmarks with their own inputs
+    if args.benchmark == 'cleansing':
+        bench_cleansing()
+        return
+    if args.benchmark == 'extract':
+        bench_extract()
+        return
+
+    start = time.perf_counter()
+    train, val, test, vocab = load_splits(args.csv)
+    print(f"loaded {len(train)} train / {len(val)} val / {len(test)} test sequences, "
+          f"vocabulary {len(vocab)} in {time.perf_counter() - start:.1f}s\n")
+
+    if args.benchmark == 'memory':
+        bench_memory(train, vocab, args.max_n)
+    elif args.benchmark == 'train':
+        bench_train(train, vocab, args.max_n)
+    elif args.benchmark == 'eval':
+        bench_eval(train, val, vocab, args.max_n)
+    elif args.benchmark == 'beam':
+        bench_beam(train, test, vocab, args.max_n)
+
+
+if __name__ == "__main__":
+    main()
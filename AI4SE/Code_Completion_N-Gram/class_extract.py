@@ -2,12 +2,15 @@
 
 import os
 import re
+import time
+import argparse
 import pandas as pd
 from typing import List, Tuple
 from collections import defaultdict
 import random
 import math
 import json
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 #from pydriller import Repository
 from javalang import parse, tree
 
@@ -30,45 +33,68 @@ def remove_comments(string):
     return regex.sub(_replacer, string)
 
 
-# v2 for extracting and cleaning up java class code
+# v3 for extracting and cleaning up java class code
+# every regex is compiled once and the class bodies are found in a single sweep
+
+# string and char literals (kept) or comments (removed)
+LITERAL = r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\''
+COMMENT_REGEX = re.compile(r'(' + LITERAL + r')|//[^\n]*|/\*.*?\*/', re.DOTALL)
+
+# class header up to and including its opening brace
+CLASS_HEADER = (r'\b(?:public\s+|protected\s+|private\s+)?(?:abstract\s+)?class\s+(\w+)'
+                r'(?:\s+extends\s+\w+)?(?:\s+implements\s+[\w,\s]+)?\s*\{')
+
+# one token per match: a literal (skipped), a class header, or a lone brace
+SCAN_REGEX = re.compile(r'(?:' + LITERAL + r')|(?P<header>' + CLASS_HEADER + r')|(?P<open>\{)|(?P<close>\})')
+
+
+def _strip_comments(match):
+    return match.group(1) or ''
+
+
+# (start, end) of every class in code, in order of appearance
+# braces inside string and char literals don't count; a class whose braces never
+# balance gets end == start
+def java_class_spans(code):
+    starts = []
+    ends = {}
+    # one entry per open brace: the class start it opened, or None for any other block
+    stack = []
+    for match in SCAN_REGEX.finditer(code):
+        if match.group('header') is not None:
+            starts.append(match.start())
+            stack.append(match.start())
+        elif match.group('open') is not None:
+            stack.append(None)
+        elif match.group('close') is not None and stack:
+            class_start = stack.pop()
+            if class_start is not None:
+                ends[class_start] = match.end()
+    return [(start, ends.get(start, start)) for start in starts]
+
 
 def extract_java_class(code):
     # Remove comments
-    code = re.sub(r'//.*?$|/\*.*?\*/', '', code, flags=re.MULTILINE | re.DOTALL)
-    
+    code = COMMENT_REGEX.sub(_strip_comments, code)
+
     # Remove empty lines and leading/trailing whitespace
     code = '\n'.join(line.strip() for line in code.split('\n') if line.strip())
-    
-    # Find all class definitions
-    class_matches = re.finditer(r'(?:public\s+|protected\s+|private\s+)?(?:abstract\s+)?class\s+(\w+)(?:\s+extends\s+\w+)?(?:\s+implements\s+[\w,\s]+)?\s*\{', code)
-    
-    classes = []
-    for match in class_matches:
-        class_name = match.group(1)
-        start_index = match.start()
-        
-        # Find the matching closing brace
-        brace_count = 0
-        end_index = start_index
-        for i, char in enumerate(code[start_index:], start=start_index):
-            if char == '{':
-                brace_count += 1
-            elif char == '}':
-                brace_count -= 1
-                if brace_count == 0:
-                    end_index = i + 1
-                    break
-        
-        # Extract the full class code
-        class_code = code[start_index:end_index].strip()
-        classes.append(class_code)
-    
+
+    # Find all class definitions with their matching closing braces
+    spans = java_class_spans(code)
+
     # Return the first class found, or an empty string if no class was found
-    return classes[0] if classes else ''
+    # (only that one is sliced, nested classes would make copying all of them quadratic)
+    if not spans:
+        return ''
+    start, end = spans[0]
+    return code[start:end].strip()
+
+PUBLIC_REGEX = re.compile(r'^\s*public\s+')
 
 def is_public_class(class_code):
     # Check if the class definition starts with 'public'
-    return bool(re.match(r'^\s*public\s+', class_code))
+    return bool(PUBLIC_REGEX.match(class_code))
 
 # Function to apply the extraction to a DataFrame
 def java_class_column(df, input_column='java_code', output_column='java_class'):
@@ -105,28 +131,180 @@ def has_unbalanced_quotes(string):
     return (double_quotes % 2 != 0) or (single_quotes % 2 != 0)
 
 
-# 
-java_data = pd.read_csv("java_data.csv")
-# Apply the extraction
-java_data['java_code'] = java_data['content'].apply(remove_comments)
-java_class_data = java_class_column(java_data)
+# chunked, resumable pipeline
+# java_data.csv is read in chunks, every chunk runs through all the steps on a process pool
+# and is written to its own Parquet part. The checkpoint file records finished chunks,
+# so a rerun after a crash skips them instead of starting over. It also records the input
+# file (path, size, mtime) and the chunk size the chunk ids refer to; a run with another
+# input or chunk size refuses to resume instead of skipping or repeating rows (--restart).
+
+STAGES = ['remove_comments', 'extract_class', 'url_filter', 'clean_string', 'quote_filter']
+# columns process_chunk adds to the ones of the input csv
+ADDED_COLUMNS = ['java_code', 'java_class', 'clean_java_class']
+
+
+# run all the steps on one chunk: returns the filtered frame and {stage: [rows_in, rows_out, seconds]}
+def process_chunk(java_data):
+    counters = {}
+
+    def timed(stage, rows_in, func):
+        start = time.perf_counter()
+        result = func()
+        counters[stage] = [rows_in, len(result), time.perf_counter() - start]
+        return result
+
+    def strip_comments():
+        java_data['java_code'] = java_data['content'].apply(remove_comments)
+        return java_data
+    timed('remove_comments', len(java_data), strip_comments)
+
+    java_class_data = timed('extract_class', len(java_data), lambda: java_class_column(java_data))
+
+    # remove rows with URLs
+    java_class_data = timed('url_filter', len(java_class_data), lambda: java_class_data[
+        ~java_class_data.java_class.str.contains("https:") &
+        ~java_class_data.java_class.str.contains("http:")].copy())
+
+    # Applying the clean_string function to the 'content' column
+    def clean():
+        java_class_data['clean_java_class'] = java_class_data['java_class'].apply(clean_string)
+        return java_class_data
+    timed('clean_string', len(java_class_data), clean)
+
+    # remove lines with unbalalnced quotes
+    java_class_data = timed('quote_filter', len(java_class_data), lambda: java_class_data[
+        ~java_class_data['clean_java_class'].apply(has_unbalanced_quotes)])
+
+    return java_class_data, counters
+
+
+# process one chunk and write it to <output_dir>/part-<chunk_id>.parquet
+def process_and_write(chunk_id, java_data, output_dir):
+    java_class_data, counters = process_chunk(java_data)
+
+    start = time.perf_counter()
+    path = part_path(output_dir, chunk_id)
+    # write under a temporary name so a crash never leaves a truncated part behind
+    java_class_data.to_parquet(path + '.tmp', index=False)
+    os.replace(path + '.tmp', path)
+    counters['write'] = [len(java_class_data), len(java_class_data), time.perf_counter() - start]
+    return chunk_id, counters
+
+
+# what a checkpoint's chunk ids refer to
+def checkpoint_source(input_csv, chunksize):
+    stat = os.stat(input_csv)
+    return {'input': os.path.abspath(input_csv), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'chunksize': chunksize}
+
+
+def load_checkpoint(checkpoint_path):
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, 'r') as file:
+            return json.load(file)
+    return {'done': [], 'counters': {}}
+
+
+def part_path(output_dir, chunk_id):
+    return os.path.join(output_dir, f"part-{chunk_id:05d}.parquet")
+
+
+def save_checkpoint(checkpoint, checkpoint_path):
+    with open(checkpoint_path + '.tmp', 'w') as file:
+        json.dump(checkpoint, file)
+    os.replace(checkpoint_path + '.tmp', checkpoint_path)
+
+
+def add_counters(total, counters):
+    for stage, (rows_in, rows_out, seconds) in counters.items():
+        rows_in_total, rows_out_total, seconds_total = total.get(stage, [0, 0, 0.0])
+        total[stage] = [rows_in_total + rows_in, rows_out_total + rows_out, seconds_total + seconds]
+
+
+def print_counters(total):
+    print(f"{'stage':<16} {'rows in':>10} {'rows out':>10} {'seconds':>9} {'rows/s':>10}")
+    for stage in STAGES + ['write']:
+        if stage in total:
+            rows_in, rows_out, seconds = total[stage]
+            print(f"{stage:<16} {rows_in:>10} {rows_out:>10} {seconds:>9.2f} {rows_in / max(seconds, 1e-9):>10.0f}")
+
+
+# restart=True drops the checkpoint and the parts it lists and starts from the first chunk
+def run_pipeline(input_csv='java_data.csv', output_dir='java_class_data', chunksize=5000, workers=None,
+                 checkpoint_path=None, restart=False):
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint_path = checkpoint_path or os.path.join(output_dir, '_checkpoint.json')
+    checkpoint = load_checkpoint(checkpoint_path)
+    source = checkpoint_source(input_csv, chunksize)
+    if restart:
+        for chunk_id in checkpoint['done']:
+            if os.path.exists(part_path(output_dir, chunk_id)):
+                os.remove(part_path(output_dir, chunk_id))
+        checkpoint = {'done': [], 'counters': {}}
+    if checkpoint['done'] and checkpoint.get('source') != source:
+        raise ValueError(f"{checkpoint_path} belongs to another run ({checkpoint.get('source')}), "
+                         f"not {source}; rerun with --restart to start over")
+    checkpoint['source'] = source
+    done = set(checkpoint['done'])
+    if done:
+        print(f"Resuming: {len(done)} chunks already finished")
 
-# remove rows with URLs
-java_class_data = java_class_data[~java_class_data.java_class.str.contains("https:", "http:")]
-java_class_data = java_class_data[~java_class_data.java_class.str.contains("http:")]
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for chunk_id, java_data in enumerate(pd.read_csv(input_csv, chunksize=chunksize)):
+            if chunk_id in done:
+                continue
+            # keep at most two chunks per worker in flight to bound memory
+            while len(pending) >= 2 * workers:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    record_chunk(future.result(), checkpoint, checkpoint_path)
+            pending.add(executor.submit(process_and_write, chunk_id, java_data, output_dir))
 
-# Applying the clean_string function to the 'content' column
-java_class_data['clean_java_class'] = java_class_data['java_class'].apply(clean_string)
+        for future in pending:
+            record_chunk(future.result(), checkpoint, checkpoint_path)
 
-# remove lines with unbalalnced quotes
-java_class_data = java_class_data[~java_class_data['clean_java_class'].apply(has_unbalanced_quotes)]
+    print_counters(checkpoint['counters'])
 
-# save the updated and filtered DataFrame
-java_class_data.to_csv('java_class_data.csv', index=False)
 
+def record_chunk(result, checkpoint, checkpoint_path):
+    chunk_id, counters = result
+    checkpoint['done'].append(chunk_id)
+    add_counters(checkpoint['counters'], counters)
+    save_checkpoint(checkpoint, checkpoint_path)
+    print(f"chunk {chunk_id} done ({counters['quote_filter'][1]} classes kept)")
 
 
+# concatenate the Parquet parts of the checkpointed run into the CSV model.py reads
+# parts left in the folder by another run are not part of it and are skipped
+def export_csv(output_dir='java_class_data', output_csv='java_class_data.csv', checkpoint_path=None):
+    checkpoint = load_checkpoint(checkpoint_path or os.path.join(output_dir, '_checkpoint.json'))
+    parts = [part_path(output_dir, chunk_id) for chunk_id in sorted(checkpoint['done'])]
+    if parts:
+        java_class_data = pd.concat([pd.read_parquet(path) for path in parts], ignore_index=True)
+    else:
+        # no finished chunk yet: only the header a finished run would write
+        source = checkpoint.get('source')
+        columns = (list(pd.read_csv(source['input'], nrows=0).columns)
+                   if source and os.path.exists(source['input']) else [])
+        java_class_data = pd.DataFrame(columns=columns + [col for col in ADDED_COLUMNS if col not in columns])
+    java_class_data.to_csv(output_csv, index=False)
 
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Extract public Java classes from java_data.csv')
+    parser.add_argument('--input', default='java_data.csv')
+    parser.add_argument('--output-dir', default='java_class_data', help='folder for the Parquet parts')
+    parser.add_argument('--chunksize', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--no-csv', action='store_true', help='skip writing java_class_data.csv')
+    parser.add_argument('--restart', action='store_true',
+                        help='discard the checkpoint of an earlier run instead of resuming it')
+    args = parser.parse_args()
 
+    run_pipeline(args.input, args.output_dir, args.chunksize, args.workers, restart=args.restart)
 
+    # save the updated and filtered DataFrame
+    if not args.no_csv:
+        export_csv(args.output_dir, 'java_class_data.csv')
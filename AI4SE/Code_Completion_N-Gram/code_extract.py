@@ -1,34 +1,133 @@
 # this file is the first step in data pre-processing
 # we load the json file and filter based on our needs
 # we save the resulting smaller dataset for the next step in preprocessing
+#
+# the dump is streamed line by line instead of loaded whole: every record is filtered
+# as it is read, only the fields the next steps need are kept and matches are appended
+# to the CSV in batches, so memory stays flat however large the dump is.
+# With --workers > 1 the file is split into byte ranges that are filtered in parallel.
+#
+#   python3 code_extract.py --input ../seart_query.jsonl --workers 8
 
 import os
+import shutil
+import argparse
 import pandas as pd
 from typing import List, Tuple
 import json
+from concurrent.futures import ProcessPoolExecutor
+
+# orjson parses several times faster, json is the fallback
+try:
+    import orjson
+    load_json = orjson.loads
+except ImportError:
+    load_json = json.loads
 
 
 file_path ='../seart_query.jsonl'
 
-with open(file_path) as json_file:      
-    full_data = json_file.readlines()
-    # this line below may take at least 5 minutes. 
-    # It converts all strings in list to actual json objects. 
-    full_data = list(map(json.loads, full_data)) 
+# columns written to java_data.csv, class_extract.py needs content and model.py code_tokens
+FIELDS = ['content', 'total_tokens', 'code_tokens']
 
-full_data= pd.DataFrame(full_data)
-full_data= full_data.set_index('id')
 
 # Filter the rows with less than 512 tokens and keep Apache projects
-java_data = full_data[
-    (full_data['total_tokens'] <= 512) &
-    (full_data['repo'].apply(lambda repo: 'license' in repo and 
-                                          ('Apache' in repo['license'] ))) &
-    (full_data['repo'].apply(lambda repo: 'name' in repo and 
-                                          ('apache' in repo['name'] )))
-    ]
+def keep_record(record, max_tokens=512):
+    total_tokens = record.get('total_tokens')
+    repo = record.get('repo') or {}
+    return (total_tokens is not None and total_tokens <= max_tokens and
+            'Apache' in (repo.get('license') or '') and
+            'apache' in (repo.get('name') or ''))
+
+
+# filtered records of lines [start, end) of the file, projected to fields
+def iter_matches(path, fields=FIELDS, max_tokens=512, start=0, end=None):
+    with open(path, 'rb') as json_file:
+        json_file.seek(start)
+        while end is None or json_file.tell() < end:
+            line = json_file.readline()
+            if not line:
+                break
+            # a kept record has both 'Apache' and 'apache' somewhere in its line,
+            # skip parsing the rest (escaped \u sequences in those words aren't expected)
+            if b'apache' not in line or b'Apache' not in line:
+                continue
+            record = load_json(line)
+            if keep_record(record, max_tokens):
+                yield [record.get(field) for field in fields]
+
+
+# append the matches to csv_path batch by batch, returns the number of matches
+def write_matches(matches, csv_path, fields=FIELDS, batch_size=10000, header=True):
+    kept = 0
+    with open(csv_path, 'w', newline='') as csv_file:
+        if header:
+            pd.DataFrame(columns=fields).to_csv(csv_file, index=False)
+        batch = []
+        for row in matches:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                pd.DataFrame(batch, columns=fields).to_csv(csv_file, index=False, header=False)
+                kept += len(batch)
+                batch = []
+        if batch:
+            pd.DataFrame(batch, columns=fields).to_csv(csv_file, index=False, header=False)
+            kept += len(batch)
+    return kept
+
+
+# split the file into about num_ranges byte ranges that start and end on line boundaries
+def line_ranges(path, num_ranges):
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as json_file:
+        for i in range(1, num_ranges):
+            json_file.seek(max(size * i // num_ranges, bounds[-1]))
+            json_file.readline()
+            bounds.append(min(json_file.tell(), size))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+
+def filter_range(path, start, end, part_path, fields, max_tokens):
+    matches = iter_matches(path, fields, max_tokens, start, end)
+    return write_matches(matches, part_path, fields, header=False)
+
+
+def extract_java_data(input_path=file_path, output_csv='java_data.csv', fields=FIELDS, max_tokens=512,
+                      workers=1):
+    if workers <= 1:
+        return write_matches(iter_matches(input_path, fields, max_tokens), output_csv, fields)
+
+    # every range goes to its own part, the parts are concatenated in file order
+    ranges = line_ranges(input_path, workers * 4)
+    parts = [f"{output_csv}.part{i:05d}" for i in range(len(ranges))]
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            kept = sum(executor.map(filter_range, [input_path] * len(ranges), *zip(*ranges), parts,
+                                    [fields] * len(ranges), [max_tokens] * len(ranges)))
+        with open(output_csv, 'w', newline='') as csv_file:
+            pd.DataFrame(columns=fields).to_csv(csv_file, index=False)
+        with open(output_csv, 'ab') as csv_file:
+            for part in parts:
+                with open(part, 'rb') as part_file:
+                    shutil.copyfileobj(part_file, csv_file)
+    finally:
+        for part in parts:
+            if os.path.exists(part):
+                os.remove(part)
+    return kept
 
 
-# save the updated and filtered DataFrame
-java_data.to_csv('java_data.csv', index=False)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Filter the SEART jsonl dump down to java_data.csv')
+    parser.add_argument('--input', default=file_path)
+    parser.add_argument('--output', default='java_data.csv')
+    parser.add_argument('--fields', nargs='+', default=FIELDS, help='record fields to keep as columns')
+    parser.add_argument('--max-tokens', type=int, default=512)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
 
+    # save the filtered records
+    kept = extract_java_data(args.input, args.output, args.fields, args.max_tokens, args.workers)
+    print(f"{kept} records written to {args.output}")
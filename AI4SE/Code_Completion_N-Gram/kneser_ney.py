@@ -0,0 +1,281 @@
+# interpolated Kneser-Ney language model on top of the NGramTrie counts
+#
+#   P(w | h) = max(a(h w) - D, 0) / a(h •) + D * N1+(h •) / a(h •) * P(w | h')
+#
+# a() is the raw count at the highest order and the continuation count N1+(• h w)
+# at lower orders, h' drops the first token of h and unigrams interpolate with a
+# uniform distribution. Discounted probabilities and backoff weights are
+# precomputed at training time, so a query costs one lookup per order.
+#
+# P(w | h) is a sum of non-negative terms, one per seen order of h: the discounted
+# probability of w after that order's context and the unigram, each scaled by the backoff
+# weights above it. The continuations of every context are ranked by discounted probability
+# once at training time and the unigram table once over all ids, so top-k reads these ranked
+# lists in parallel and stops as soon as no unread token can beat the k-th best (Fagin's
+# threshold algorithm), instead of scoring the whole vocabulary.
+
+from collections.abc import Mapping
+
+import numpy as np
+
+from ngram_store import BOS, NGramTrie, drop_last, key_bits, last_ids, pack_keys
+
+
+# absolute discount D = n1 / (n1 + 2 * n2) from the count-of-counts
+def estimate_discount(counts):
+    n1 = int(np.count_nonzero(counts == 1))
+    n2 = int(np.count_nonzero(counts == 2))
+    if n1 == 0 or n2 == 0:
+        return 0.5
+    return n1 / (n1 + 2 * n2)
+
+
+# ids by descending probability, ties by ascending id
+def rank_ids(probabilities):
+    return np.lexsort((np.arange(len(probabilities)), -probabilities))
+
+
+# positions of every context's continuations by descending discounted probability, contexts
+# stay in their blocks (starts as in context_starts)
+def rank_continuations(discounted, starts):
+    context_of = np.repeat(np.arange(len(starts) - 1), np.diff(starts))
+    ranked = np.lexsort((-discounted, context_of))
+    return ranked.astype(np.uint32 if len(ranked) < 2 ** 32 else np.int64)
+
+
+class KneserNeyDistribution(Mapping):
+    """Read-only {token: probability} view of one context of a KneserNeyModel."""
+
+    def __init__(self, model, context_ids):
+        self._model = model
+        self._context_ids = context_ids
+
+    def __getitem__(self, token):
+        idx = self._model.token_to_id.get(token)
+        if idx is None or idx == self._model.bos_id:
+            raise KeyError(token)
+        return self._model.prob_ids(self._context_ids, idx)
+
+    def __iter__(self):
+        return (token for idx, token in enumerate(self._model.id_to_token) if idx != self._model.bos_id)
+
+    def __len__(self):
+        return len(self._model.id_to_token) - 1
+
+
+class KneserNeyModel:
+    """Interpolated Kneser-Ney model of order n.
+
+    Plugs into evaluate_model and generate like the nested-dict model: every
+    context is "in" the model and ``model[context][token]`` is the smoothed
+    probability. Contexts shorter than n-1 are left-padded with <s>.
+    """
+
+    def __init__(self, trie, n):
+        if n > trie.max_n:
+            raise ValueError(f"trie holds orders up to {trie.max_n}, can't build a {n}-gram model")
+        self.n = n
+        self.id_to_token = trie.id_to_token
+        self.token_to_id = {token: idx for idx, token in enumerate(self.id_to_token)}
+        self.bits = trie.bits
+        self.bos_id = self.token_to_id[BOS]
+        self.discounts = []
+
+        # unigrams: dense table over all ids, interpolated with a uniform distribution
+        unigram_ids, unigram_counts = self._order_counts(trie, 1)
+        discount = estimate_discount(unigram_counts)
+        self.discounts.append(discount)
+        total = float(unigram_counts.sum())
+        uniform = 1.0 / (len(self.id_to_token) - 1)
+        self.unigram = np.full(len(self.id_to_token), discount * len(unigram_counts) / total * uniform)
+        self.unigram[unigram_ids[:, 0]] += np.maximum(unigram_counts - discount, 0) / total
+        self.unigram[self.bos_id] = 0.0
+        self.unigram_order = rank_ids(self.unigram)
+
+        # higher orders: sorted n-gram keys with discounted probabilities,
+        # sorted context keys with backoff weights
+        self.ngram_keys, self.discounted = [], []
+        self.context_keys, self.context_starts, self.backoff = [], [], []
+        for k in range(2, n + 1):
+            ngrams, counts = self._order_counts(trie, k)
+            keys = pack_keys(ngrams, self.bits)
+            order = np.argsort(keys)
+            keys, counts = keys[order], counts[order]
+
+            context_of_key = drop_last(keys, k, self.bits)
+            boundary = np.ones(len(keys), dtype=bool)
+            boundary[1:] = context_of_key[1:] != context_of_key[:-1]
+            starts = np.flatnonzero(boundary)
+            totals = np.add.reduceat(counts, starts).astype(np.float64)
+            types = np.diff(np.append(starts, len(keys)))
+
+            discount = estimate_discount(counts)
+            self.discounts.append(discount)
+            self.ngram_keys.append(keys)
+            self.discounted.append(np.maximum(counts - discount, 0) / np.repeat(totals, types))
+            self.context_keys.append(context_of_key[starts])
+            self.context_starts.append(np.append(starts, len(keys)).astype(np.int64))
+            self.backoff.append(discount * types / totals)
+        self.ranked = [rank_continuations(discounted, starts)
+                       for discounted, starts in zip(self.discounted, self.context_starts)]
+
+    ORDER_ARRAYS = ('ngram_keys', 'discounted', 'context_keys', 'context_starts', 'backoff')
+    # ranked continuations, recomputed when a file saved before they were stored is loaded
+    RANK_ARRAYS = ('ranked',)
+
+    # metadata and arrays for model_io.save_model, per-order arrays are suffixed with their order
+    def to_arrays(self):
+        meta = {'n': self.n, 'id_to_token': self.id_to_token, 'discounts': self.discounts}
+        arrays = {'unigram': self.unigram, 'unigram_order': self.unigram_order}
+        for name in self.ORDER_ARRAYS + self.RANK_ARRAYS:
+            for k, array in enumerate(getattr(self, name), start=2):
+                arrays[f"{name}_{k}"] = array
+        return meta, arrays
+
+    # rebuild from to_arrays output without recomputing anything, arrays may be memory-mapped
+    @classmethod
+    def from_arrays(cls, meta, arrays):
+        model = cls.__new__(cls)
+        model.n = meta['n']
+        model.id_to_token = list(meta['id_to_token'])
+        model.token_to_id = {token: idx for idx, token in enumerate(model.id_to_token)}
+        model.bits = key_bits(len(model.id_to_token))
+        model.bos_id = model.token_to_id[BOS]
+        model.discounts = list(meta['discounts'])
+        model.unigram = arrays['unigram']
+        # files saved before the ranking was stored rank on load
+        model.unigram_order = arrays['unigram_order'] if 'unigram_order' in arrays else rank_ids(model.unigram)
+        for name in cls.ORDER_ARRAYS:
+            setattr(model, name, [arrays[f"{name}_{k}"] for k in range(2, model.n + 1)])
+        model.ranked = [arrays[f"ranked_{k}"] if f"ranked_{k}" in arrays
+                        else rank_continuations(model.discounted[k - 2], model.context_starts[k - 2])
+                        for k in range(2, model.n + 1)]
+        return model
+
+    # distinct k-grams with the count KN uses at order k: raw counts at the top
+    # order, number of distinct left extensions (trie children) below it
+    def _order_counts(self, trie, k):
+        ngrams, counts = trie.ngrams(k)
+        if k < self.n:
+            counts = np.diff(trie.child_starts[k - 1])
+        return ngrams, counts.astype(np.float64)
+
+    @classmethod
+    def from_corpus(cls, tokenized_code, n, vocab):
+        return cls(NGramTrie.from_corpus(tokenized_code, n, vocab), n)
+
+    @property
+    def nbytes(self):
+        arrays = ([self.unigram, self.unigram_order] + self.ngram_keys + self.discounted
+                  + self.context_keys + self.context_starts + self.backoff + self.ranked)
+        return sum(array.nbytes for array in arrays)
+
+    # ids of the last n-1 tokens of a context, left-padded with <s>, unknown tokens as <UNK>
+    def encode_context(self, context):
+        context = list(context)[max(0, len(context) - (self.n - 1)):] if self.n > 1 else []
+        ids = [self.token_to_id.get(token, 0) for token in context]
+        return [self.bos_id] * (self.n - 1 - len(ids)) + ids
+
+    # position of the order-k context ending the context ids, -1 when it was never seen
+    def _context_index(self, context_ids, k):
+        context_key = pack_keys(np.array(context_ids[len(context_ids) - (k - 1):]).reshape(1, k - 1), self.bits)[0]
+        contexts = self.context_keys[k - 2]
+        pos = int(np.searchsorted(contexts, context_key))
+        if pos < len(contexts) and contexts[pos] == context_key:
+            return pos
+        return -1
+
+    # (order, context position, start, end of its continuations) of every order whose context was seen
+    def _seen_contexts(self, context_ids):
+        seen = []
+        for k in range(2, self.n + 1):
+            pos = self._context_index(context_ids, k)
+            if pos < 0:
+                # a longer context containing this one can't have been seen either
+                break
+            seen.append((k, pos, self.context_starts[k - 2][pos], self.context_starts[k - 2][pos + 1]))
+        return seen
+
+    def prob_ids(self, context_ids, token_id):
+        p = self.unigram[token_id]
+        for k, pos, start, end in self._seen_contexts(context_ids):
+            tokens = last_ids(self.ngram_keys[k - 2][start:end], k, self.bits)
+            hit = int(np.searchsorted(tokens, token_id))
+            seen = self.discounted[k - 2][start + hit] if hit < len(tokens) and tokens[hit] == token_id else 0.0
+            p = seen + self.backoff[k - 2][pos] * p
+        return float(p)
+
+    # probability of the last column of every row of an (rows, n) id matrix
+    def probabilities(self, windows):
+        windows = np.asarray(windows)
+        p = self.unigram[windows[:, -1]]
+        active = np.ones(len(windows), dtype=bool)
+        for k in range(2, self.n + 1):
+            context_keys = pack_keys(windows[:, self.n - k:self.n - 1], self.bits)
+            contexts = self.context_keys[k - 2]
+            pos = np.minimum(np.searchsorted(contexts, context_keys), len(contexts) - 1)
+            active &= contexts[pos] == context_keys
+
+            ngram_keys = pack_keys(windows[:, self.n - k:], self.bits)
+            keys = self.ngram_keys[k - 2]
+            hit = np.minimum(np.searchsorted(keys, ngram_keys), len(keys) - 1)
+            seen = np.where(keys[hit] == ngram_keys, self.discounted[k - 2][hit], 0.0)
+            p = np.where(active, seen + self.backoff[k - 2][pos] * p, p)
+        return p
+
+    # smoothed distribution over every id for one context
+    def distribution(self, context):
+        p = self.unigram.copy()
+        for k, pos, start, end in self._seen_contexts(self.encode_context(context)):
+            p *= self.backoff[k - 2][pos]
+            p[last_ids(self.ngram_keys[k - 2][start:end], k, self.bits).astype(np.int64)] += self.discounted[k - 2][start:end]
+        return p
+
+    # k most likely next tokens as [(token, probability)], ties by id like a sort of distribution()
+    def top_k(self, context, k):
+        seen_contexts = self._seen_contexts(self.encode_context(context))
+        k = min(k, len(self.unigram))
+        # weight of every ranked list in P(w | h): the backoff weights of the orders above it
+        weights, weight = [], 1.0
+        for order, pos, _, _ in reversed(seen_contexts):
+            weights.append(weight)
+            weight *= self.backoff[order - 2][pos]
+        weights.reverse()
+        continuations = [last_ids(self.ngram_keys[order - 2][start:end], order, self.bits).astype(np.int64)
+                         for order, _, start, end in seen_contexts]
+
+        depth = k
+        while True:
+            # every id among the first depth entries of any ranked list, scored exactly
+            read = [self.unigram_order[:depth]]
+            bound = weight * self.unigram[self.unigram_order[depth]] if depth < len(self.unigram) else 0.0
+            for (order, _, start, end), list_weight in zip(seen_contexts, weights):
+                ranked = self.ranked[order - 2][start:start + min(depth, end - start)]
+                read.append(last_ids(self.ngram_keys[order - 2][ranked], order, self.bits).astype(np.int64))
+                if depth < end - start:
+                    bound += list_weight * self.discounted[order - 2][self.ranked[order - 2][start + depth]]
+            candidates = np.unique(np.concatenate(read))
+            p = self.unigram[candidates]
+            for (order, pos, start, _), tokens in zip(seen_contexts, continuations):
+                hit = np.minimum(np.searchsorted(tokens, candidates), len(tokens) - 1)
+                discounted = np.where(tokens[hit] == candidates, self.discounted[order - 2][start + hit], 0.0)
+                p = discounted + self.backoff[order - 2][pos] * p
+            best = np.lexsort((candidates, -p))[:k]
+            # an unread id scores at most bound, on a tie it could still come first by id
+            if bound == 0.0 or (len(best) == k and p[best[-1]] > bound):
+                return [(self.id_to_token[idx], float(prob))
+                        for idx, prob in zip(candidates[best].tolist(), p[best].tolist())]
+            depth *= 2
+
+    # most likely next token
+    def next_token(self, context):
+        return self.top_k(context, 1)[0][0]
+
+    def __contains__(self, context):
+        return True
+
+    def __getitem__(self, context):
+        return KneserNeyDistribution(self, self.encode_context(context))
+
+    def get(self, context, default=None):
+        return self[context]
@@ -1,15 +1,21 @@
 # file with all the function definitions
 
 import re
+import heapq
 import random
 import math
 from collections import defaultdict, Counter
+from itertools import chain
 from typing import List, Tuple, Dict, Set
 import javalang as jl
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
 
+from kneser_ney import KneserNeyModel
+from ngram_store import (NGramStore, NGramTrie, UNK, as_encoded, corpus_windows, key_bits, pack_keys,
+                         index_nested_model, lookup_probabilities)
+
 
 # tokenize the data with javalang : string -> list[string]
 def tokenize_java(code):
@@ -61,8 +67,8 @@ def unk_tokenize(tokenized_data, vocabulary, unknown_token = "<UNK>"):
     def replace_oov(tokens):
         return [token if token in vocabulary_set else unknown_token for token in tokens]
     
-    # Apply the function to each row of the DataFrame
-    new_tokenized_data = tokenized_data.applymap(replace_oov)
+    # Apply the function to each cell of the DataFrame
+    new_tokenized_data = tokenized_data.apply(lambda column: column.map(replace_oov))
     
     return new_tokenized_data
 
@@ -81,12 +87,50 @@ def cleansing(train_data, val_data, test_data, count_threshold=1):
     return new_train_data, new_val_data, new_test_data, vocabulary
 
 
+# vectorized alternative to cleansing: tokens are counted once with a hash table
+# (pd.factorize) and every split comes back int-encoded as an (ids, offsets) pair,
+# with <UNK> as id 0 and the vocabulary in the same order cleansing produces
+def encode_splits(train_data, val_data, test_data, count_threshold=1):
+    def flatten(tokenized_data):
+        token_lists = tokenized_data.iloc[:, 0].tolist()
+        lengths = np.fromiter((len(tokens) for tokens in token_lists), dtype=np.int64, count=len(token_lists))
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        flat = np.array(list(chain.from_iterable(token_lists)), dtype=object)
+        return flat, offsets
+
+    # codes follow first appearance, so the kept words keep cleansing's order
+    train_flat, train_offsets = flatten(train_data)
+    codes, uniques = pd.factorize(train_flat)
+    kept = np.bincount(codes, minlength=len(uniques)) >= count_threshold
+    vocabulary = [UNK] + uniques[kept].tolist()
+
+    # factorize code -> vocabulary id, dropped words become <UNK>
+    code_to_id = np.zeros(len(uniques), dtype=np.int32)
+    code_to_id[kept] = np.arange(1, kept.sum() + 1, dtype=np.int32)
+    new_train_data = (code_to_id[codes], train_offsets)
+
+    vocabulary_index = pd.Index(vocabulary)
+    def encode(tokenized_data):
+        flat, offsets = flatten(tokenized_data)
+        ids = vocabulary_index.get_indexer(flat).astype(np.int32)
+        ids[ids < 0] = 0
+        return ids, offsets
+
+    return new_train_data, encode(val_data), encode(test_data), vocabulary
+
+
 # define function to train the model
 
 def create_ngrams(tokens, n):
     return list(zip(*[tokens[i:] for i in range(n)]))
 
-def train_ngram_model(tokenized_code, n, vocab):
+# compact=True returns an integer-encoded NGramStore instead of the nested dict,
+# it accepts the same lookups and takes a fraction of the memory
+def train_ngram_model(tokenized_code, n, vocab, compact=False):
+    if compact:
+        return NGramStore.from_corpus(tokenized_code, n, vocab)
+
     cfdist = defaultdict(lambda: defaultdict(float))
     for tokens in tokenized_code:
         padded_tokens = ['<s>'] * (n-1) + tokens + ['</s>']
@@ -103,7 +147,29 @@ def train_ngram_model(tokenized_code, n, vocab):
     
     return cfdist
 
+# train every order from 1 to max_n in one pass over the corpus
+# returns {n: model}, each model is a view of one shared count trie
+# tokenized_code can be token lists or an (ids, offsets) pair from encode_splits
+# pass the NGramTrie of an earlier pass as trie to skip counting the corpus again
+def train_ngram_models(tokenized_code, max_n, vocab, trie=None):
+    if trie is None:
+        trie = NGramTrie.from_corpus(tokenized_code, max_n, vocab)
+    return {n: trie.model(n) for n in range(1, max_n + 1)}
+
+# Kneser-Ney models for every order from 1 to max_n, sharing one count trie
+def train_kneser_ney_models(tokenized_code, max_n, vocab, trie=None):
+    if trie is None:
+        trie = NGramTrie.from_corpus(tokenized_code, max_n, vocab)
+    return {n: KneserNeyModel(trie, n) for n in range(1, max_n + 1)}
+
 def predict_next_token(context, model, vocab):
+    # a smoothed model always has a distribution, no random fallback needed
+    if isinstance(model, KneserNeyModel):
+        return model.next_token(context)
+    # candidates are pre-ranked per context, the best one is the first
+    if isinstance(model, NGramStore):
+        best = model.top_k(context, 1)
+        return best[0][0] if best else random.choice(list(vocab))
     context = tuple(context)
     if context in model:
         probabilities = model[context]
@@ -119,8 +185,74 @@ def generate(context, n, model, vocab, max_length=100):
         generated.append(next_token)
     return generated
 
+# top-k completion: the k most likely next tokens after context as [(token, probability)]
+# NGramStore and KneserNeyModel answer from pre-ranked candidates, a nested dict is scanned
+def complete(context, n, model, vocab, k=5):
+    context = tuple(context)[max(0, len(context) - (n - 1)):] if n > 1 else ()
+    if isinstance(model, (NGramStore, KneserNeyModel)):
+        return model.top_k(context, k)
+    if context not in model:
+        return []
+    probabilities = model[context]
+    return heapq.nlargest(k, probabilities.items(), key=lambda item: item[1])
+
+# beam search over many prompts at once, returns the best completion of each prefix
+# (prefix included, </s> dropped, like generate); next-token candidates are looked up
+# once per distinct context and shared by every beam and prompt that reaches it
+def generate_batch(prefixes, n, model, vocab, beam_width=4, max_length=100):
+    candidates_of = {}
+    beams = [[(0.0, list(prefix), len(prefix) >= max_length)] for prefix in prefixes]
+
+    while any(not done for prompt_beams in beams for _, _, done in prompt_beams):
+        for i, prompt_beams in enumerate(beams):
+            # expansions keep a reference to their parent, only survivors get a new token list
+            expanded = []
+            for score, tokens, done in prompt_beams:
+                if done:
+                    expanded.append((score, tokens, None, True))
+                    continue
+
+                context = tuple(tokens[max(0, len(tokens) - (n - 1)):]) if n > 1 else ()
+                if context not in candidates_of:
+                    candidates_of[context] = complete(context, n, model, vocab, beam_width)
+                candidates = candidates_of[context]
+
+                # an unseen context can't be extended, the beam ends here
+                if not candidates:
+                    expanded.append((score, tokens, None, True))
+                for token, probability in candidates:
+                    next_score = score + math.log(probability)
+                    if token == '</s>':
+                        expanded.append((next_score, tokens, None, True))
+                    else:
+                        expanded.append((next_score, tokens, token, len(tokens) + 1 >= max_length))
+
+            expanded.sort(key=lambda beam: beam[0], reverse=True)
+            beams[i] = [(score, tokens if token is None else tokens + [token], done)
+                        for score, tokens, token, done in expanded[:beam_width]]
+
+    return [max(prompt_beams, key=lambda beam: beam[0])[1] for prompt_beams in beams]
+
+# fraction of generated tokens that match the reference continuation, over every
+# sequence of test_data completed from its first prefix_length tokens in one batch
+def completion_accuracy(test_data, n, model, vocab, prefix_length=3, beam_width=4, max_length=100):
+    completions = generate_batch([tokens[:prefix_length] for tokens in test_data], n, model, vocab,
+                                 beam_width=beam_width, max_length=max_length)
+    matches = total = 0
+    for tokens, completed in zip(test_data, completions):
+        reference = tokens[prefix_length:max_length]
+        predicted = completed[prefix_length:]
+        matches += sum(1 for expected, actual in zip(reference, predicted) if expected == actual)
+        total += len(reference)
+    return matches / total if total else 0.0
+
 # calculate perplexity
-def evaluate_model(n, eval_data, model, vocab):
+# batched=True scores the whole eval set at once against an indexed model,
+# int-encoded (ids, offsets) eval data is always scored that way
+def evaluate_model(n, eval_data, model, vocab, batched=False):
+    if batched or isinstance(eval_data, tuple):
+        return evaluate_model_batched(n, eval_data, model, vocab)
+
     log_likelihood = 0
     token_count = 0
     for tokens in eval_data:
@@ -133,16 +265,21 @@ def evaluate_model(n, eval_data, model, vocab):
             token_count += 1
     return np.exp(-log_likelihood / token_count)
 
+# vectorized perplexity: the eval set becomes one int32 token array with offsets,
+# every n-gram probability is looked up in one searchsorted call and the
+# log-likelihood is a single reduction
+# tokens outside vocab are scored as <UNK>, cleansing already maps them that way
+def evaluate_model_batched(n, eval_data, model, vocab):
+    ids, offsets = as_encoded(eval_data, vocab)
+    windows = corpus_windows(ids, offsets, n, len(vocab), len(vocab) + 1)
 
-
-
-
-
-
-
-
-
-
-
-
-
+    if isinstance(model, KneserNeyModel):
+        probabilities = model.probabilities(windows)
+    else:
+        if isinstance(model, NGramStore):
+            keys, probs = model.probability_table()
+        else:
+            keys, probs = index_nested_model(model, n, vocab)
+        probabilities = lookup_probabilities(keys, probs, pack_keys(windows, key_bits(len(vocab) + 2)))
+    probabilities[probabilities == 0] = 1e-10
+    return np.exp(-np.log(probabilities).sum() / len(probabilities))
@@ -1,5 +1,6 @@
 #
 
+import os
 import re
 import random
 import math
@@ -10,60 +11,74 @@ import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
 
-from main import tokenize_java, cleansing, train_ngram_model, evaluate_model, generate
+from main import (encode_splits, train_ngram_models, train_kneser_ney_models, evaluate_model, generate,
+                  completion_accuracy)
+from model_io import save_model
+from ngram_store import NGramTrie, decode_corpus
+from token_cache import tokenize_corpus
 
 
 
-java_data = pd.read_csv("java_class_data.csv")
+# guarded so the tokenization process pool can re-import this module on spawn platforms (macOS, Windows)
+if __name__ == "__main__":
+    java_data = pd.read_csv("java_class_data.csv")
 
-# filter out instances where code tokens exceed 100
-java_data = java_data[ java_data['code_tokens'] <= 100]
-# create a dataframe containing only java code 
-java_class = pd.DataFrame(java_data['clean_java_class'])
+    # filter out instances where code tokens exceed 100
+    java_data = java_data[ java_data['code_tokens'] <= 100]
+    # create a dataframe containing only java code 
+    java_class = pd.DataFrame(java_data['clean_java_class'])
 
-# tokenize the java code 
-java_class['tokenized_code'] = java_class['clean_java_class'].apply(tokenize_java)
-
-# split the data 
-tokenized_data = pd.DataFrame(java_class['tokenized_code'])
-
-## Obtain Train and Test Split : 641 test, 5760 training set
-train, test = train_test_split(tokenized_data, test_size=0.1, random_state=42)
-
-## Obtain Train and Validation Split : 1152 val, 4608 train set
-train, val = train_test_split(train, test_size=0.2, random_state=42)
-
-# create vocabulary, treat out-of-vocab instances, handle <UNK>
-min_freq = 7  # Set minimum frequency threshold
-final_train, final_val, final_test, vocabulary = cleansing(train, val, test, min_freq)
-
-# Update the vocabulary in our main code
-vocab = {word: idx for idx, word in enumerate(vocabulary)}
-
-# Train and evaluate models for n = 1 to 5
-for n in range(1, 6):
-    n_gram_counts = train_ngram_model(final_train.iloc[:, 0].tolist(), n, vocab)
-    
-    # Evaluate on validation data
-    val_perplexity = evaluate_model(n, final_val.iloc[:, 0].tolist(), n_gram_counts, vocab)
-    print(f"{n}-gram model validation perplexity: {val_perplexity:.2f}")
-
-    # Generate code completion
-    start_tokens = random.choice(final_test.iloc[:, 0].tolist())[:3]  # Randomly select 3 tokens to start
-    completed_code = generate(start_tokens, n, n_gram_counts, vocab)
-    print(f"\n{n}-gram model code completion:")
-    print(' '.join(completed_code))
-    print("\n" + "="*50 + "\n")
-    
+    # tokenize the java code across a process pool, classes tokenized by an earlier run come from ./token_cache
+    java_class['tokenized_code'] = tokenize_corpus(java_class['clean_java_class'])
 
+    # split the data 
+    tokenized_data = pd.DataFrame(java_class['tokenized_code'])
 
+    ## Obtain Train and Test Split : 641 test, 5760 training set
+    train, test = train_test_split(tokenized_data, test_size=0.1, random_state=42)
 
+    ## Obtain Train and Validation Split : 1152 val, 4608 train set
+    train, val = train_test_split(train, test_size=0.2, random_state=42)
 
+    # create vocabulary, treat out-of-vocab instances, handle <UNK>
+    # every split comes back as int-encoded (ids, offsets) arrays with <UNK> = 0
+    min_freq = 7  # Set minimum frequency threshold
+    final_train, final_val, final_test, vocabulary = encode_splits(train, val, test, min_freq)
 
+    # Update the vocabulary in our main code
+    vocab = {word: idx for idx, word in enumerate(vocabulary)}
 
+    # token lists of the test split for generation
+    test_tokens = decode_corpus(*final_test, vocabulary)
 
+    # Count n = 1 to 5 in a single pass over the training data, both model families share the counts
+    trie = NGramTrie.from_corpus(final_train, 5, vocab)
+    models = train_ngram_models(final_train, 5, vocab, trie)
+    kn_models = train_kneser_ney_models(final_train, 5, vocab, trie)
 
+    # Save the trained models, model_io.load_model memory-maps them back without retraining
+    os.makedirs('models', exist_ok=True)
+    for n in range(1, 6):
+        save_model(models[n], f'models/{n}gram.bin')
+        save_model(kn_models[n], f'models/{n}gram_kneser_ney.bin')
 
+    # Evaluate each order
+    for n in range(1, 6):
+        n_gram_counts = models[n]
 
+        # Evaluate on validation data
+        val_perplexity = evaluate_model(n, final_val, n_gram_counts, vocab, batched=True)
+        print(f"{n}-gram model validation perplexity: {val_perplexity:.2f}")
+        kn_perplexity = evaluate_model(n, final_val, kn_models[n], vocab, batched=True)
+        print(f"{n}-gram Kneser-Ney model validation perplexity: {kn_perplexity:.2f}")
 
+        # Beam-search completion of every test sequence from its first 3 tokens
+        accuracy = completion_accuracy(test_tokens, n, kn_models[n], vocab, beam_width=4)
+        print(f"{n}-gram Kneser-Ney model test completion accuracy: {accuracy:.2%}")
 
+        # Generate code completion
+        start_tokens = random.choice(test_tokens)[:3]  # Randomly select 3 tokens to start
+        completed_code = generate(start_tokens, n, n_gram_counts, vocab)
+        print(f"\n{n}-gram model code completion:")
+        print(' '.join(completed_code))
+        print("\n" + "="*50 + "\n")
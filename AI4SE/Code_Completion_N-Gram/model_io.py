@@ -0,0 +1,70 @@
+# single-file binary format for trained models
+#
+#   8 bytes   magic b'NGRAMv1\0'
+#   8 bytes   little-endian uint64 length of the JSON header
+#   header    {"kind", "meta" (order, token table, ...), "arrays": {name: [dtype, shape, offset]}}
+#   arrays    raw little-endian array data, each starting on a 64-byte boundary
+#
+# load_model maps the file once with numpy.memmap and hands out read-only views,
+# so loading costs a header parse and worker processes share the same pages
+
+import json
+
+import numpy as np
+
+from kneser_ney import KneserNeyModel
+from ngram_store import NGramStore
+
+
+MAGIC = b'NGRAMv1\0'
+ALIGNMENT = 64
+MODEL_KINDS = {'NGramStore': NGramStore, 'KneserNeyModel': KneserNeyModel}
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def save_model(model, path):
+    kind = type(model).__name__
+    if kind not in MODEL_KINDS:
+        raise TypeError(f"can't save a {kind}, train with compact=True or use train_ngram_models")
+    meta, arrays = model.to_arrays()
+    arrays = {name: np.ascontiguousarray(array, dtype=np.asarray(array).dtype.newbyteorder('<'))
+              for name, array in arrays.items()}
+
+    # array offsets depend on the header size, so lay out relative offsets first
+    layout, offset = {}, 0
+    for name, array in arrays.items():
+        offset = _aligned(offset)
+        layout[name] = [array.dtype.str, list(array.shape), offset]
+        offset += array.nbytes
+    header = {'kind': kind, 'meta': meta, 'arrays': layout}
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = _aligned(len(MAGIC) + 8 + len(header_bytes))
+
+    with open(path, 'wb') as file:
+        file.write(MAGIC)
+        file.write(np.uint64(len(header_bytes)).astype('<u8').tobytes())
+        file.write(header_bytes)
+        for name, array in arrays.items():
+            file.seek(data_start + layout[name][2])
+            file.write(array.tobytes())
+
+
+def load_model(path):
+    with open(path, 'rb') as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a saved n-gram model")
+        header_length = int(np.frombuffer(file.read(8), dtype='<u8')[0])
+        header = json.loads(file.read(header_length).decode('utf-8'))
+    data_start = _aligned(len(MAGIC) + 8 + header_length)
+
+    buffer = np.memmap(path, dtype=np.uint8, mode='r')
+    arrays = {}
+    for name, (dtype, shape, offset) in header['arrays'].items():
+        dtype = np.dtype(dtype)
+        start = data_start + offset
+        count = int(np.prod(shape))
+        arrays[name] = buffer[start:start + count * dtype.itemsize].view(dtype).reshape(shape)
+    return MODEL_KINDS[header['kind']].from_arrays(header['meta'], arrays)
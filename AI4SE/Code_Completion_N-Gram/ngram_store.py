@@ -0,0 +1,377 @@
+# compact n-gram count store
+# tokens are mapped to integer ids through the vocab dict, every n-gram is packed
+# into one fixed-width key and kept with its count in sorted NumPy arrays
+# keys are uint64 while the n ids fit in 64 bits; wider n-grams (5-grams over more than
+# 4094 tokens) become byte strings of big-endian uint32 ids, which sort like the id tuples
+
+from collections.abc import Mapping
+
+import numpy as np
+
+
+BOS = '<s>'
+EOS = '</s>'
+UNK = '<UNK>'
+
+
+# id -> token table for a {word: idx} vocabulary, <s> and </s> get the next two ids
+def build_id_table(vocab):
+    id_to_token = [None] * len(vocab)
+    for word, idx in vocab.items():
+        id_to_token[idx] = word
+    return id_to_token + [BOS, EOS]
+
+
+# encode a list of token lists into one int32 array plus row offsets
+def encode_corpus(tokenized_code, vocab):
+    lengths = np.fromiter((len(tokens) for tokens in tokenized_code), dtype=np.int64, count=len(tokenized_code))
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    unk_id = vocab.get(UNK, 0)
+    ids = np.fromiter((vocab.get(token, unk_id) for tokens in tokenized_code for token in tokens),
+                      dtype=np.int32, count=int(offsets[-1]))
+    return ids, offsets
+
+
+# (ids, offsets) for either a list of token lists or an already encoded pair
+def as_encoded(tokenized_code, vocab):
+    if isinstance(tokenized_code, tuple):
+        return tokenized_code
+    return encode_corpus(tokenized_code, vocab)
+
+
+# inverse of encode_corpus: token lists from ids and offsets
+def decode_corpus(ids, offsets, id_to_token):
+    tokens = np.asarray(id_to_token, dtype=object)[ids].tolist()
+    return [tokens[start:end] for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+# all padded n-gram windows of an encoded corpus as an (num_windows, n) int32 matrix
+# row i is padded exactly like train_ngram_model does: ['<s>'] * (n-1) + tokens + ['</s>']
+def corpus_windows(ids, offsets, n, bos_id, eos_id):
+    lengths = np.diff(offsets)
+    rows = len(lengths)
+    row_idx = np.arange(rows, dtype=np.int64)
+
+    # lay out every padded row back to back
+    padded = np.full(len(ids) + rows * n, bos_id, dtype=np.int32)
+    padded[np.repeat(row_idx * n, lengths) + np.arange(len(ids)) + (n - 1)] = ids
+    padded[offsets[1:] + row_idx * n + (n - 1)] = eos_id
+
+    # each row of length L yields L + 1 windows starting at its padded start
+    starts = np.arange(len(ids) + rows, dtype=np.int64) + np.repeat(row_idx * (n - 1), lengths + 1)
+    return np.lib.stride_tricks.sliding_window_view(padded, n)[starts]
+
+
+# bit width of one token id inside a packed key
+def key_bits(num_ids):
+    return max(1, int(num_ids - 1).bit_length())
+
+
+# True when width ids of bits bits don't fit a uint64 key
+def wide_keys(width, bits):
+    return width * bits > 64
+
+
+# pack an (rows, width) id matrix into keys, first column in the high bits (or first bytes)
+def pack_keys(matrix, bits):
+    matrix = np.asarray(matrix)
+    if wide_keys(matrix.shape[1], bits):
+        return np.ascontiguousarray(matrix, dtype='>u4').view(f'S{4 * matrix.shape[1]}').reshape(-1)
+    keys = np.zeros(matrix.shape[0], dtype=np.uint64)
+    for col in range(matrix.shape[1]):
+        keys <<= np.uint64(bits)
+        keys |= matrix[:, col].astype(np.uint64)
+    return keys
+
+
+# inverse of pack_keys
+def unpack_keys(keys, width, bits):
+    if wide_keys(width, bits):
+        # the dtype also restores the trailing zero bytes a scalar key loses
+        keys = np.ascontiguousarray(keys, dtype=f'S{4 * width}')
+        return keys.view('>u4').reshape(len(keys), width).astype(np.int32)
+    mask = np.uint64((1 << bits) - 1)
+    matrix = np.empty((len(keys), width), dtype=np.int32)
+    keys = np.asarray(keys, dtype=np.uint64)
+    for col in range(width - 1, -1, -1):
+        matrix[:, col] = keys & mask
+        keys = keys >> np.uint64(bits)
+    return matrix
+
+
+# keys of the first width - 1 ids of width-id keys, the context of an n-gram
+def drop_last(keys, width, bits):
+    if wide_keys(width, bits):
+        return pack_keys(unpack_keys(keys, width, bits)[:, :-1], bits)
+    return keys >> np.uint64(bits)
+
+
+# last id of every width-id key
+def last_ids(keys, width, bits):
+    if wide_keys(width, bits):
+        return unpack_keys(keys, width, bits)[:, -1]
+    return keys & np.uint64((1 << bits) - 1)
+
+
+# flatten a nested-dict model from train_ngram_model into sorted packed keys and probabilities
+def index_nested_model(model, n, vocab):
+    id_to_token = build_id_table(vocab)
+    token_to_id = {token: idx for idx, token in enumerate(id_to_token)}
+    rows, probs = [], []
+    for context, distribution in model.items():
+        context_ids = [token_to_id[token] for token in context]
+        for token, probability in distribution.items():
+            rows.append(context_ids + [token_to_id[token]])
+            probs.append(probability)
+    keys = pack_keys(np.array(rows, dtype=np.int32).reshape(len(rows), n), key_bits(len(id_to_token)))
+    order = np.argsort(keys)
+    return keys[order], np.array(probs, dtype=np.float64)[order]
+
+
+# probability of every query key in a sorted (keys, probs) table, 0.0 where it is missing
+def lookup_probabilities(keys, probs, query_keys):
+    if len(keys) == 0:
+        return np.zeros(len(query_keys))
+    pos = np.minimum(np.searchsorted(keys, query_keys), len(keys) - 1)
+    return np.where(keys[pos] == query_keys, probs[pos], 0.0)
+
+
+class ContextDistribution(Mapping):
+    """Read-only {token: probability} view of one context of an NGramStore."""
+
+    def __init__(self, store, pos):
+        self._store = store
+        self._start = int(store.context_starts[pos])
+        self._end = int(store.context_starts[pos + 1])
+        self._total = float(store.context_totals[pos])
+        self._context_ids = unpack_keys(store.context_keys[pos:pos + 1], store.n - 1, store.bits)[0]
+
+    def __getitem__(self, token):
+        idx = self._store.token_to_id.get(token)
+        if idx is not None:
+            key = pack_keys(np.append(self._context_ids, idx)[None], self._store.bits)[0]
+            keys = self._store.ngram_keys[self._start:self._end]
+            pos = int(np.searchsorted(keys, key))
+            if pos < len(keys) and keys[pos] == key:
+                return int(self._store.counts[self._start + pos]) / self._total
+        raise KeyError(token)
+
+    def __iter__(self):
+        store = self._store
+        for idx in last_ids(store.ngram_keys[self._start:self._end], store.n, store.bits).tolist():
+            yield store.id_to_token[idx]
+
+    def __len__(self):
+        return self._end - self._start
+
+
+class NGramStore:
+    """Conditional n-gram distribution over integer token ids.
+
+    Drop-in replacement for the nested dict returned by ``train_ngram_model``:
+    ``context in store`` and ``store[context][token]`` work on tuples of token strings.
+    """
+
+    def __init__(self, n, id_to_token, keys, counts):
+        self.n = n
+        self.id_to_token = list(id_to_token)
+        self.token_to_id = {token: idx for idx, token in enumerate(self.id_to_token)}
+        self.bits = key_bits(len(self.id_to_token))
+        self.ngram_keys = keys
+        self.counts = counts
+
+        # contexts are the keys without their last token; sorted keys keep them contiguous
+        context_of_key = drop_last(keys, n, self.bits)
+        boundary = np.ones(len(keys), dtype=bool)
+        boundary[1:] = context_of_key[1:] != context_of_key[:-1]
+        starts = np.flatnonzero(boundary)
+
+        self.context_keys = context_of_key[starts]
+        self.context_starts = np.append(starts, len(keys)).astype(np.int64)
+        self.context_totals = (np.add.reduceat(counts, starts, dtype=np.uint64) if len(keys)
+                               else np.zeros(0, dtype=np.uint64))
+
+        # n-gram indices ranked by count within each context, ties by token id,
+        # so the top-k candidates of a context are a slice
+        context_index = np.repeat(np.arange(len(starts)), np.diff(self.context_starts))
+        index_dtype = np.int32 if len(keys) < 2 ** 31 else np.int64
+        self.ranked = np.lexsort((-counts.astype(np.int64), context_index)).astype(index_dtype)
+
+    ARRAYS = ('ngram_keys', 'counts', 'context_keys', 'context_starts', 'context_totals', 'ranked')
+
+    # metadata and arrays for model_io.save_model
+    def to_arrays(self):
+        return {'n': self.n, 'id_to_token': self.id_to_token}, {name: getattr(self, name) for name in self.ARRAYS}
+
+    # rebuild from to_arrays output without recomputing anything, arrays may be memory-mapped
+    @classmethod
+    def from_arrays(cls, meta, arrays):
+        store = cls.__new__(cls)
+        store.n = meta['n']
+        store.id_to_token = list(meta['id_to_token'])
+        store.token_to_id = {token: idx for idx, token in enumerate(store.id_to_token)}
+        store.bits = key_bits(len(store.id_to_token))
+        for name in cls.ARRAYS:
+            setattr(store, name, arrays[name])
+        return store
+
+    # count every n-gram of a corpus given as token lists or as an encoded (ids, offsets) pair
+    @classmethod
+    def from_corpus(cls, tokenized_code, n, vocab):
+        id_to_token = build_id_table(vocab)
+        ids, offsets = as_encoded(tokenized_code, vocab)
+        windows = corpus_windows(ids, offsets, n, len(vocab), len(vocab) + 1)
+        return cls.from_windows(windows, n, id_to_token)
+
+    # count an (num_windows, n) id matrix
+    @classmethod
+    def from_windows(cls, windows, n, id_to_token):
+        keys = pack_keys(windows, key_bits(len(id_to_token)))
+        keys, counts = np.unique(keys, return_counts=True)
+        return cls(n, id_to_token, keys, counts.astype(np.uint32))
+
+    @property
+    def nbytes(self):
+        return (self.ngram_keys.nbytes + self.counts.nbytes + self.context_keys.nbytes
+                + self.context_starts.nbytes + self.context_totals.nbytes + self.ranked.nbytes)
+
+    @property
+    def num_ngrams(self):
+        return len(self.ngram_keys)
+
+    # sorted packed n-gram keys with their conditional probabilities
+    def probability_table(self):
+        totals = np.repeat(self.context_totals, np.diff(self.context_starts)).astype(np.float64)
+        return self.ngram_keys, self.counts / totals
+
+    # row index of a context key, or -1 when it was never seen
+    def _context_index(self, context_key):
+        pos = int(np.searchsorted(self.context_keys, context_key))
+        if pos < len(self.context_keys) and self.context_keys[pos] == context_key:
+            return pos
+        return -1
+
+    # packed key of a context given as token strings, None if it can't be in the model
+    def _encode_context(self, context):
+        if len(context) != self.n - 1:
+            return None
+        ids = [self.token_to_id.get(token) for token in context]
+        if None in ids:
+            return None
+        return pack_keys(np.array(ids, dtype=np.int64).reshape(1, len(ids)), self.bits)[0]
+
+    def _lookup(self, context):
+        context_key = self._encode_context(tuple(context))
+        if context_key is None:
+            return -1
+        return self._context_index(context_key)
+
+    # k most likely next tokens of a context as [(token, probability)], empty if it was never seen
+    def top_k(self, context, k):
+        pos = self._lookup(context)
+        if pos < 0:
+            return []
+        start, end = self.context_starts[pos], self.context_starts[pos + 1]
+        best = self.ranked[start:min(end, start + k)]
+        total = float(self.context_totals[pos])
+        return [(self.id_to_token[idx], count / total)
+                for idx, count in zip(last_ids(self.ngram_keys[best], self.n, self.bits).tolist(),
+                                      self.counts[best].tolist())]
+
+    def __contains__(self, context):
+        return self._lookup(context) >= 0
+
+    def __getitem__(self, context):
+        pos = self._lookup(context)
+        if pos < 0:
+            raise KeyError(context)
+        return ContextDistribution(self, pos)
+
+    def get(self, context, default=None):
+        try:
+            return self[context]
+        except KeyError:
+            return default
+
+    def __len__(self):
+        return len(self.context_keys)
+
+    def __iter__(self):
+        for row in unpack_keys(self.context_keys, self.n - 1, self.bits):
+            yield tuple(self.id_to_token[idx] for idx in row)
+
+    def items(self):
+        for context in self:
+            yield context, self[context]
+
+
+class NGramTrie:
+    """Counts of every order 1..max_n gathered in one pass over the corpus.
+
+    Each level holds the distinct n-grams of one order as packed keys of the
+    *reversed* n-gram (last token first), sorted. An n-gram's key shifted right by
+    one token is its parent, the (n-1)-gram sharing its suffix, so every level is a
+    run-length grouping of the level above and children of a node are contiguous.
+    """
+
+    def __init__(self, max_n, id_to_token, level_keys, level_counts):
+        self.max_n = max_n
+        self.id_to_token = list(id_to_token)
+        self.bits = key_bits(len(self.id_to_token))
+        self.level_keys = level_keys
+        self.level_counts = level_counts
+
+        # children of node i at level n are level n+1 nodes child_starts[n-1][i]:child_starts[n-1][i+1]
+        self.child_starts = []
+        for n in range(1, max_n):
+            parents = drop_last(level_keys[n], n + 1, self.bits)
+            starts = np.searchsorted(parents, level_keys[n - 1])
+            self.child_starts.append(np.append(starts, len(parents)).astype(np.int64))
+
+        self._models = {}
+
+    @classmethod
+    def from_corpus(cls, tokenized_code, max_n, vocab):
+        id_to_token = build_id_table(vocab)
+        ids, offsets = as_encoded(tokenized_code, vocab)
+        windows = corpus_windows(ids, offsets, max_n, len(vocab), len(vocab) + 1)
+        return cls.from_windows(windows, max_n, id_to_token)
+
+    # windows padded for max_n; the last n columns of each are exactly the
+    # n-grams train_ngram_model would produce for order n
+    @classmethod
+    def from_windows(cls, windows, max_n, id_to_token):
+        bits = key_bits(len(id_to_token))
+        keys, counts = np.unique(pack_keys(windows[:, ::-1], bits), return_counts=True)
+        level_keys, level_counts = [keys], [counts.astype(np.uint32)]
+
+        for n in range(max_n - 1, 0, -1):
+            prefix = drop_last(level_keys[0], n + 1, bits)
+            boundary = np.ones(len(prefix), dtype=bool)
+            boundary[1:] = prefix[1:] != prefix[:-1]
+            starts = np.flatnonzero(boundary)
+            level_keys.insert(0, prefix[starts])
+            level_counts.insert(0, np.add.reduceat(level_counts[0], starts, dtype=np.uint64).astype(np.uint32))
+
+        return cls(max_n, id_to_token, level_keys, level_counts)
+
+    @property
+    def nbytes(self):
+        return (sum(keys.nbytes for keys in self.level_keys) + sum(c.nbytes for c in self.level_counts)
+                + sum(starts.nbytes for starts in self.child_starts))
+
+    # distinct n-grams of one order as an (num_ngrams, n) id matrix in reading order, with counts
+    def ngrams(self, n):
+        reversed_ngrams = unpack_keys(self.level_keys[n - 1], n, self.bits)
+        return reversed_ngrams[:, ::-1], self.level_counts[n - 1]
+
+    # NGramStore view of one order, built on first use
+    def model(self, n):
+        if n not in self._models:
+            ngrams, counts = self.ngrams(n)
+            keys = pack_keys(ngrams, self.bits)
+            order = np.argsort(keys)
+            self._models[n] = NGramStore(n, self.id_to_token, keys[order], counts[order])
+        return self._models[n]
@@ -0,0 +1,147 @@
+# streaming n-gram training for corpora that don't fit in memory
+#
+# classes are read from the CSV in chunks and tokenized, each chunk is counted with
+# the same padded windows as train_ngram_model(compact=True). Partial counts are
+# buffered up to a memory cap, spilled to disk as sorted runs and finally merged
+# block by block, so RAM stays bounded by the cap rather than the corpus size.
+# One token cache is opened for the whole stream and appended to chunk by chunk, its
+# in-memory index counts against the cap too.
+
+import os
+import shutil
+import tempfile
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from ngram_store import NGramStore, UNK, build_id_table, corpus_windows, encode_corpus, key_bits, pack_keys
+from token_cache import TokenCache, tokenize_corpus
+
+
+# bytes per buffered (key, count) pair, keys are uint64 or wider byte strings (see pack_keys)
+def entry_bytes(key_dtype):
+    return np.dtype(key_dtype).itemsize + 8
+
+
+# token lists of every class in a java_class_data.csv style file, one chunk at a time
+# cache is an open TokenCache shared by all chunks, by default one is opened on cache_dir
+def iter_token_chunks(csv_path, chunksize=10000, max_code_tokens=100, column='clean_java_class',
+                      cache_dir='token_cache', workers=None, cache=None):
+    if cache is None and cache_dir:
+        cache = TokenCache(cache_dir)
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        if max_code_tokens is not None:
+            chunk = chunk[chunk['code_tokens'] <= max_code_tokens]
+        if len(chunk):
+            yield tokenize_corpus(chunk[column], cache_dir=None, workers=workers, cache=cache)
+
+
+# closed vocabulary in the same order cleansing builds it: <UNK> first, then words
+# with at least min_freq occurrences in first-seen order
+def streaming_vocabulary(token_chunks, min_freq=1):
+    word_counts = Counter()
+    for tokenized_code in token_chunks:
+        for tokens in tokenized_code:
+            word_counts.update(tokens)
+    vocabulary = [UNK] + [word for word, count in word_counts.items() if count >= min_freq]
+    return {word: idx for idx, word in enumerate(vocabulary)}
+
+
+# sum the counts of equal keys in an unsorted (keys, counts) pair
+def _reduce(keys, counts):
+    order = np.argsort(keys, kind='stable')
+    keys, counts = keys[order], counts[order]
+    boundary = np.ones(len(keys), dtype=bool)
+    boundary[1:] = keys[1:] != keys[:-1]
+    starts = np.flatnonzero(boundary)
+    return keys[starts], np.add.reduceat(counts, starts) if len(keys) else counts
+
+
+class _RunWriter:
+    def __init__(self, spill_dir):
+        self.spill_dir = spill_dir
+        self.runs = []
+
+    def spill(self, keys, counts):
+        path = os.path.join(self.spill_dir, f"run_{len(self.runs):05d}")
+        np.save(path + '.keys.npy', keys)
+        np.save(path + '.counts.npy', counts)
+        self.runs.append(path)
+
+
+# k-way merge of sorted runs: each round takes a block from every run, everything up to
+# the smallest block end is complete and gets reduced and written out
+def _merge_runs(runs, out_path, memory_limit):
+    keys_in = [np.load(run + '.keys.npy', mmap_mode='r') for run in runs]
+    counts_in = [np.load(run + '.counts.npy', mmap_mode='r') for run in runs]
+    cursors = [0] * len(runs)
+    key_dtype = keys_in[0].dtype
+    block = max(1, memory_limit // (2 * entry_bytes(key_dtype) * max(1, len(runs))))
+
+    with open(out_path + '.keys', 'wb') as keys_out, open(out_path + '.counts', 'wb') as counts_out:
+        while True:
+            live = [i for i in range(len(runs)) if cursors[i] < len(keys_in[i])]
+            if not live:
+                break
+            threshold = min(keys_in[i][min(cursors[i] + block, len(keys_in[i])) - 1] for i in live)
+
+            parts_keys, parts_counts = [], []
+            for i in live:
+                block_keys = keys_in[i][cursors[i]:cursors[i] + block]
+                take = int(np.searchsorted(block_keys, threshold, side='right'))
+                parts_keys.append(np.asarray(block_keys[:take]))
+                parts_counts.append(np.asarray(counts_in[i][cursors[i]:cursors[i] + take]))
+                cursors[i] += take
+
+            keys, counts = _reduce(np.concatenate(parts_keys), np.concatenate(parts_counts))
+            keys.tofile(keys_out)
+            counts.astype(np.uint32).tofile(counts_out)
+
+    return (np.fromfile(out_path + '.keys', dtype=key_dtype),
+            np.fromfile(out_path + '.counts', dtype=np.uint32))
+
+
+# train an n-gram NGramStore from a CSV too large to hold in memory
+# vocab=None builds it in a first pass with min_freq, like cleansing does;
+# memory_limit (bytes) caps the buffered partial counts plus the token cache index before
+# the counts are spilled
+def train_ngram_model_streaming(csv_path, n, vocab=None, min_freq=7, chunksize=10000,
+                                memory_limit=256 * 2 ** 20, spill_dir=None, cache_dir='token_cache',
+                                **chunk_options):
+    cache = TokenCache(cache_dir) if cache_dir else None
+    chunk_options.update(cache_dir=cache_dir, cache=cache)
+    if vocab is None:
+        vocab = streaming_vocabulary(iter_token_chunks(csv_path, chunksize, **chunk_options), min_freq)
+    id_to_token = build_id_table(vocab)
+    bits = key_bits(len(id_to_token))
+    key_dtype = pack_keys(np.zeros((0, n), dtype=np.int32), bits).dtype
+
+    work_dir = tempfile.mkdtemp(prefix='ngram_runs_', dir=spill_dir)
+    try:
+        writer = _RunWriter(work_dir)
+        buffered_keys, buffered_counts, buffered = [], [], 0
+
+        for tokenized_code in iter_token_chunks(csv_path, chunksize, **chunk_options):
+            ids, offsets = encode_corpus(tokenized_code, vocab)
+            windows = corpus_windows(ids, offsets, n, len(vocab), len(vocab) + 1)
+            keys, counts = np.unique(pack_keys(windows, bits), return_counts=True)
+            buffered_keys.append(keys)
+            buffered_counts.append(counts.astype(np.uint64))
+            buffered += len(keys) * entry_bytes(key_dtype)
+
+            if buffered + (cache.memory_bytes() if cache else 0) >= memory_limit:
+                writer.spill(*_reduce(np.concatenate(buffered_keys), np.concatenate(buffered_counts)))
+                buffered_keys, buffered_counts, buffered = [], [], 0
+
+        if buffered_keys:
+            writer.spill(*_reduce(np.concatenate(buffered_keys), np.concatenate(buffered_counts)))
+
+        if writer.runs:
+            keys, counts = _merge_runs(writer.runs, os.path.join(work_dir, 'merged'), memory_limit)
+        else:
+            keys, counts = np.zeros(0, dtype=key_dtype), np.zeros(0, dtype=np.uint32)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return NGramStore(n, id_to_token, keys, counts), vocab
@@ -0,0 +1,173 @@
+# parallel tokenization with a persistent token cache
+# every class is keyed by the sha1 of its source code, so re-runs only tokenize
+# classes that were never seen before
+#
+# cache layout, every file is append-only:
+#   tokens.jsonl  token strings, one JSON string per line, a token's id is its line number
+#   ids.bin       int32 token ids of every cached class back to back
+#   ends.bin      int64 end offset of each class in ids.bin
+#   hashes.bin    20-byte sha1 of each class, written last so it marks complete rows
+
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from main import tokenize_java
+
+DIGEST_SIZE = 20
+# memory of the in-memory index from sys.getsizeof of sample objects, a dict entry is the
+# amortized size of a 4096-entry dict per key
+# a cached class is a rows entry: its digest, its row number and the dict entry
+# a token is a tokens list slot, the str header and a token_ids entry (its id and the dict entry),
+# the token characters are counted from the tokens.jsonl size
+DICT_ENTRY_BYTES = sys.getsizeof(dict.fromkeys(range(4096))) // 4096
+ROW_BYTES = sys.getsizeof(bytes(DIGEST_SIZE)) + sys.getsizeof(2 ** 20) + DICT_ENTRY_BYTES
+TOKEN_BYTES = 8 + sys.getsizeof('') + sys.getsizeof(2 ** 20) + DICT_ENTRY_BYTES
+
+
+def content_hash(code):
+    return hashlib.sha1(code.encode('utf-8')).digest()
+
+
+def tokenize_many(codes):
+    return [tokenize_java(code) for code in codes]
+
+
+class TokenCache:
+    def __init__(self, cache_dir='token_cache'):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def _load(self):
+        tokens_path = self._path('tokens.jsonl')
+        self.tokens = []
+        # bytes of tokens.jsonl up to the last complete line, a crash can leave half a line after it
+        self.tokens_size = 0
+        if os.path.exists(tokens_path):
+            with open(tokens_path, 'rb') as file:
+                for line in file:
+                    if not line.endswith(b'\n'):
+                        break
+                    self.tokens.append(json.loads(line))
+                    self.tokens_size += len(line)
+        self.token_ids = {token: idx for idx, token in enumerate(self.tokens)}
+
+        # digests are read as raw bytes: a numpy 'S20' array would strip a digest's trailing zero bytes
+        # a crash can leave ids/ends longer than hashes, rows past the last hash are ignored
+        digests = b''
+        if os.path.exists(self._path('hashes.bin')):
+            with open(self._path('hashes.bin'), 'rb') as file:
+                digests = file.read()
+        # rows on disk, more than len(rows) when an older cache stored a class twice
+        self.num_rows = len(digests) // DIGEST_SIZE
+        self.rows = {digests[row * DIGEST_SIZE:(row + 1) * DIGEST_SIZE]: row for row in range(self.num_rows)}
+        self._map(self.num_rows)
+
+    # ends and ids of the first num_rows classes, memory-mapped
+    def _map(self, num_rows):
+        self.ends = (np.memmap(self._path('ends.bin'), dtype=np.int64, mode='r', shape=(num_rows,))
+                     if num_rows else np.zeros(0, dtype=np.int64))
+        num_ids = int(self.ends[-1]) if num_rows else 0
+        self.ids = (np.memmap(self._path('ids.bin'), dtype=np.int32, mode='r', shape=(num_ids,))
+                    if num_ids else np.zeros(0, dtype=np.int32))
+
+    def __len__(self):
+        return len(self.rows)
+
+    # estimated bytes the cache holds in memory, ids and ends are memory-mapped and not counted
+    def memory_bytes(self):
+        return len(self.rows) * ROW_BYTES + len(self.tokens) * TOKEN_BYTES + self.tokens_size
+
+    def __contains__(self, digest):
+        return digest in self.rows
+
+    def get(self, digest):
+        row = self.rows.get(digest)
+        if row is None:
+            return None
+        start = int(self.ends[row - 1]) if row else 0
+        return [self.tokens[idx] for idx in self.ids[start:int(self.ends[row])].tolist()]
+
+    # append {digest: tokens}, only the new rows and tokens are written
+    def add(self, entries):
+        entries = {digest: tokens for digest, tokens in entries.items() if digest not in self.rows}
+        if not entries:
+            return
+
+        # drop partial rows and token lines a previous crash may have left behind
+        num_rows = self.num_rows
+        num_ids = int(self.ends[-1]) if num_rows else 0
+        for name, size in (('tokens.jsonl', self.tokens_size), ('ids.bin', num_ids * 4),
+                           ('ends.bin', num_rows * 8), ('hashes.bin', num_rows * DIGEST_SIZE)):
+            if os.path.exists(self._path(name)):
+                os.truncate(self._path(name), size)
+
+        # extend the token table first so every id written below resolves
+        new_tokens = []
+        for tokens in entries.values():
+            for token in tokens:
+                if token not in self.token_ids:
+                    self.token_ids[token] = len(self.tokens)
+                    self.tokens.append(token)
+                    new_tokens.append(token)
+        if new_tokens:
+            lines = ''.join(json.dumps(token) + '\n' for token in new_tokens).encode('utf-8')
+            with open(self._path('tokens.jsonl'), 'ab') as file:
+                file.write(lines)
+            self.tokens_size += len(lines)
+
+        digests = list(entries)
+        ids = np.fromiter((self.token_ids[token] for digest in digests for token in entries[digest]),
+                          dtype=np.int32)
+        ends = num_ids + np.cumsum([len(entries[digest]) for digest in digests], dtype=np.int64)
+        with open(self._path('ids.bin'), 'ab') as file:
+            ids.tofile(file)
+        with open(self._path('ends.bin'), 'ab') as file:
+            ends.tofile(file)
+        with open(self._path('hashes.bin'), 'ab') as file:
+            file.write(b''.join(digests))
+
+        for row, digest in enumerate(digests, num_rows):
+            self.rows[digest] = row
+        self.num_rows += len(digests)
+        self._map(self.num_rows)
+
+
+# tokenize a sequence of java sources, serving repeats from the cache and
+# spreading the rest over a process pool; returns token lists in input order
+# callers tokenizing many batches pass one open TokenCache as cache instead of reopening cache_dir
+def tokenize_corpus(codes, cache_dir='token_cache', workers=None, chunksize=256, cache=None):
+    codes = list(codes)
+    if cache is None and cache_dir:
+        cache = TokenCache(cache_dir)
+    digests = [content_hash(code) for code in codes]
+
+    # one tokenization per distinct class that isn't cached yet
+    pending = {}
+    for digest, code in zip(digests, codes):
+        if digest not in pending and (cache is None or digest not in cache):
+            pending[digest] = code
+
+    tokenized = {}
+    if pending:
+        missing = list(pending.values())
+        chunks = [missing[i:i + chunksize] for i in range(0, len(missing), chunksize)]
+        if workers == 1 or len(chunks) == 1:
+            results = map(tokenize_many, chunks)
+            tokenized = dict(zip(pending, (tokens for chunk in results for tokens in chunk)))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(tokenize_many, chunks)
+                tokenized = dict(zip(pending, (tokens for chunk in results for tokens in chunk)))
+        if cache is not None:
+            cache.add(tokenized)
+
+    return [tokenized[digest] if digest in tokenized else cache.get(digest) for digest in digests]
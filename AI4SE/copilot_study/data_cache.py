@@ -0,0 +1,169 @@
+'''
+Author: Leyli (Aya) Garryyeva
+
+Shared data access for the copilot_study scripts.
+
+read_csv_cached and read_excel_cached are drop-in replacements for pd.read_csv and
+pd.read_excel. The first read of a source parses it as usual and stores the result as
+a zstd-compressed Parquet file in data_files/parquet_cache. Later reads load the Parquet
+file instead, with the same columns and dtypes as the parse. A frame Parquet can't store
+(e.g. an object column mixing numbers and text, which spreadsheets often have) is
+returned uncached.
+
+A cache entry is reused while the source keeps its mtime and size. If either changed,
+the source is hashed, and the entry is only rebuilt when the content really differs.
+Reader options are part of the cache key, so a read with different usecols or dtype
+gets its own entry.
+
+Benchmark of cold (parse + write Parquet) against warm (Parquet) loads:
+    python data_cache.py ./data_files/gh_popular_repo_data.csv ./data_files/copilot_repos_prs.xlsx
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import pandas as pd
+
+CACHE_DIR = './data_files/parquet_cache'
+
+# bump when the conversion below changes, so old entries are rebuilt
+CACHE_VERSION = 2
+
+# columns stored as categoricals, none by default: a categorical changes groupby results
+# (unobserved categories show up as empty groups), pass e.g. ('repository',) to opt in
+CATEGORICAL_COLUMNS = ()
+
+
+def file_sha1(path, block_size=2 ** 20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# cache file for a source read with the given options
+def cache_path(source, options, cache_dir=CACHE_DIR):
+    key = json.dumps([os.path.abspath(source), options, CACHE_VERSION], sort_keys=True, default=str)
+    name = os.path.splitext(os.path.basename(source))[0]
+    return os.path.join(cache_dir, f"{name}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]}.parquet")
+
+
+def _load_meta(path):
+    if not (os.path.exists(path) and os.path.exists(path + '.json')):
+        return None
+    with open(path + '.json', 'r') as file:
+        return json.load(file)
+
+
+def _save_meta(path, meta):
+    with open(path + '.json.tmp', 'w') as file:
+        json.dump(meta, file)
+    os.replace(path + '.json.tmp', path + '.json')
+
+
+# True when the cache entry at path still matches the source
+# mtime and size are checked first, the content hash only when they changed
+def is_fresh(source, path):
+    meta = _load_meta(path)
+    if meta is None:
+        return False
+    stat = os.stat(source)
+    if meta['mtime_ns'] == stat.st_mtime_ns and meta['size'] == stat.st_size:
+        return True
+    if meta['size'] != stat.st_size or meta['sha1'] != file_sha1(source):
+        return False
+    # touched but unchanged: remember the new mtime so the next check is cheap again
+    meta['mtime_ns'] = stat.st_mtime_ns
+    _save_meta(path, meta)
+    return True
+
+
+def to_categorical(data, columns=CATEGORICAL_COLUMNS):
+    for column in columns:
+        if column in data.columns and pd.api.types.is_string_dtype(data[column]):
+            data[column] = data[column].astype('category')
+    return data
+
+
+# read source with reader(source, **options), going through the Parquet cache
+def read_cached(source, reader, cache_dir=CACHE_DIR, categorical=CATEGORICAL_COLUMNS, **options):
+    path = cache_path(source, {'reader': reader.__name__, 'categorical': list(categorical), **options},
+                      cache_dir)
+    if is_fresh(source, path):
+        return pd.read_parquet(path)
+
+    stat = os.stat(source)
+    data = to_categorical(reader(source, **options), categorical)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # write under a temporary name so an interrupted run never leaves a truncated entry
+    try:
+        data.to_parquet(path + '.tmp', compression='zstd')
+    except (ValueError, TypeError) as e:
+        # pyarrow's ArrowInvalid/ArrowTypeError, raised for mixed-type object columns
+        print(f"Not caching {source}, Parquet can't store it: {e}")
+        if os.path.exists(path + '.tmp'):
+            os.remove(path + '.tmp')
+        return data
+    os.replace(path + '.tmp', path)
+    _save_meta(path, {'source': os.path.abspath(source), 'mtime_ns': stat.st_mtime_ns,
+                      'size': stat.st_size, 'sha1': file_sha1(source)})
+    return data
+
+
+def read_csv_cached(source, **options):
+    return read_cached(source, pd.read_csv, **options)
+
+
+def read_excel_cached(source, **options):
+    return read_cached(source, pd.read_excel, **options)
+
+
+def read_any_cached(source, **options):
+    if source.endswith(('.xlsx', '.xls')):
+        return read_excel_cached(source, **options)
+    return read_csv_cached(source, **options)
+
+
+# direct parse, cold cache and warm cache load times of every source
+def bench(sources, cache_dir=CACHE_DIR, repeat=3):
+    print(f"{'source':<40} {'rows':>9} {'parse s':>8} {'cold s':>8} {'warm s':>8} {'speedup':>8} {'csv MB':>7} {'parquet MB':>11}")
+    for source in sources:
+        reader = pd.read_excel if source.endswith(('.xlsx', '.xls')) else pd.read_csv
+
+        start = time.perf_counter()
+        data = reader(source)
+        parse = time.perf_counter() - start
+
+        # drop the entry so the first cached read is cold
+        path = cache_path(source, {'reader': reader.__name__, 'categorical': list(CATEGORICAL_COLUMNS)},
+                          cache_dir)
+        for name in (path, path + '.json'):
+            if os.path.exists(name):
+                os.remove(name)
+        start = time.perf_counter()
+        read_any_cached(source, cache_dir=cache_dir)
+        cold = time.perf_counter() - start
+
+        warm = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            read_any_cached(source, cache_dir=cache_dir)
+            warm = min(warm, time.perf_counter() - start)
+
+        print(f"{os.path.basename(source):<40} {len(data):>9} {parse:>8.3f} {cold:>8.3f} {warm:>8.3f} "
+              f"{parse / warm:>7.1f}x {os.path.getsize(source) / 2 ** 20:>7.1f} "
+              f"{os.path.getsize(path) / 2 ** 20:>11.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Cold and warm load times of the Parquet cache')
+    parser.add_argument('sources', nargs='+', help='csv or xlsx files')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    args = parser.parse_args()
+
+    bench(args.sources, args.cache_dir)
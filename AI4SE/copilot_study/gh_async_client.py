@@ -0,0 +1,280 @@
+"""
+Author: Leyli (Aya) Garryyeva
+
+Asynchronous GitHub collectors for gh_monthly_pr_code.py, over the REST or the GraphQL API.
+
+All repositories share one aiohttp session (a pooled connection per host) and a
+semaphore that bounds how many repositories are fetched at the same time. Issues and
+pull requests come from one bulk listing per repository (/issues?state=all, 100 per
+page): every item already carries created_at, closed_at and a pull_request marker, so
+no extra request per pull request is needed.
+
+The rate limit is tracked from the X-RateLimit-* headers of every response, per API
+resource, by the TokenBucket of keyword_search/rate_limit.py that also paces the keyword
+crawlers: requests are spread over the rest of the window once half the quota is used, and
+403/429 rate-limit responses (Retry-After, used-up quota, or a secondary rate limit without
+either) block the bucket before the retry. 5xx responses are retried with backoff.
+
+The GraphQL collector asks only for createdAt and closedAt, 100 issues and 100 pull
+requests per repository and page, and packs several repositories into one query with
+aliases (r0: repository(...) { ... }, r1: ...). A repository leaves the batch once both
+of its listings are done and the next one in the list takes its place.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+import aiohttp
+
+from keyword_search.rate_limit import BURST, TokenBucket, resource_of
+
+API_URL = 'https://api.github.com'
+
+
+def parse_timestamp(value):
+    if value is None:
+        return None
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
+
+
+class GitHubClient:
+    """Pooled aiohttp session with global rate-limit handling, use as an async context manager."""
+
+    def __init__(self, token, base_url=API_URL, connections=16, min_remaining=None, retries=5):
+        self.token = token
+        self.base_url = base_url.rstrip('/')
+        self.connections = connections
+        self.retries = retries
+        self.min_remaining = min_remaining if min_remaining is not None else max(10, connections)
+        # API resource (core, graphql) -> its quota
+        self.buckets = {}
+        self.requests = 0
+        self.session = None
+
+    async def __aenter__(self):
+        headers = {'Accept': 'application/vnd.github+json'}
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        self.session = aiohttp.ClientSession(
+            headers=headers, connector=aiohttp.TCPConnector(limit=self.connections),
+            timeout=aiohttp.ClientTimeout(total=60))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    def bucket(self, resource):
+        if resource not in self.buckets:
+            self.buckets[resource] = TokenBucket(max(BURST, self.connections), self.min_remaining)
+        return self.buckets[resource]
+
+    # wait until the resource's quota allows one more request; nothing awaits between the
+    # check and take(), so the coroutines of the event loop need no lock
+    async def acquire(self, resource):
+        bucket = self.bucket(resource)
+        while True:
+            delay = bucket.delay(time.time())
+            if delay <= 0:
+                bucket.take()
+                return bucket
+            await asyncio.sleep(min(delay, 60))
+
+    # (json body, url of the next page or None)
+    async def request(self, method, url, **kwargs):
+        if not url.startswith('http'):
+            url = self.base_url + url
+        for attempt in range(self.retries + 1):
+            bucket = await self.acquire(resource_of(url))
+            async with self.session.request(method, url, **kwargs) as response:
+                self.requests += 1
+                now = time.time()
+                bucket.update(response.headers, now)
+                if response.status in (403, 429) and bucket.rate_limited(
+                        response.headers, await response.text(), attempt, now):
+                    logging.info(f"Rate limited ({response.status}), retrying in "
+                                 f"{bucket.blocked_until - now:.0f}s")
+                    continue
+                if response.status >= 500 and attempt < self.retries:
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+                response.raise_for_status()
+                next_page = response.links.get('next', {}).get('url')
+                return await response.json(), (str(next_page) if next_page else None)
+        raise RuntimeError(f"Gave up on {url} after {self.retries + 1} attempts")
+
+    # every item of a paginated listing, following the Link: rel="next" headers
+    async def paginate(self, path, params=None):
+        url, params = path, dict(params or {}, per_page=100)
+        while url:
+            items, url = await self.request('GET', url, params=params)
+            # the next-page URL already carries the query string
+            params = None
+            for item in items:
+                yield item
+
+
+# (created_at, closed_at, is_pr) of every issue and pull request updated since start_date
+async def fetch_issue_items(client, repo, start_date):
+    params = {'state': 'all', 'since': start_date.strftime('%Y-%m-%dT%H:%M:%SZ')}
+    items = []
+    async for issue in client.paginate(f"/repos/{repo}/issues", params):
+        items.append((parse_timestamp(issue['created_at']), parse_timestamp(issue.get('closed_at')),
+                      'pull_request' in issue))
+    return items
+
+
+# (repo, items, error) of every repository in completion order, at most concurrency at a time
+async def collect_issue_items(repos, token, start_date, concurrency=8, base_url=API_URL):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with GitHubClient(token, base_url, connections=concurrency * 2) as client:
+        async def fetch(repo):
+            async with semaphore:
+                logging.info(f"Processing {repo}")
+                try:
+                    return repo, await fetch_issue_items(client, repo, start_date), None
+                except Exception as e:
+                    return repo, [], str(e)
+
+        for task in asyncio.as_completed([fetch(repo) for repo in repos]):
+            yield await task
+        logging.info(f"{client.requests} API requests")
+
+
+# GraphQL listings of a repository: (connection, arguments, extra node fields)
+# issues(filterBy: {since}) matches the REST since filter, pull requests have no such
+# filter and are read newest update first until one is older than since
+GRAPHQL_CONNECTIONS = [
+    ('issues', 'filterBy: {since: $since}', ''),
+    ('pullRequests', 'orderBy: {field: UPDATED_AT, direction: DESC}', ' updatedAt'),
+]
+
+
+class RepoPages:
+    """Paging state of one repository in a GraphQL batch."""
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.owner, _, self.name = repo.partition('/')
+        # connection -> cursor of the next page, missing once the listing is done
+        self.cursors = {connection: None for connection, _, _ in GRAPHQL_CONNECTIONS}
+        self.items = []
+        self.error = None
+
+    def done(self):
+        return self.error is not None or not self.cursors
+
+
+# query and variables for the next page of every repository of the batch
+def build_graphql_query(batch, since):
+    params = []
+    blocks = []
+    variables = {}
+    for i, pages in enumerate(batch):
+        params += [f"$o{i}: String!", f"$n{i}: String!"]
+        variables[f"o{i}"], variables[f"n{i}"] = pages.owner, pages.name
+        fields = []
+        for j, (connection, arguments, extra) in enumerate(GRAPHQL_CONNECTIONS):
+            if connection not in pages.cursors:
+                continue
+            params.append(f"$c{i}_{j}: String")
+            variables[f"c{i}_{j}"] = pages.cursors[connection]
+            if '$since' in arguments and 'since' not in variables:
+                variables['since'] = since
+            fields.append(f"{connection}(first: 100, after: $c{i}_{j}, {arguments}) "
+                          f"{{ pageInfo {{ hasNextPage endCursor }} nodes {{ createdAt closedAt{extra} }} }}")
+        blocks.append(f"r{i}: repository(owner: $o{i}, name: $n{i}) {{ {' '.join(fields)} }}")
+    # GitHub rejects the whole query when a declared variable isn't used, which $since isn't
+    # once every repository of the batch is through its issues
+    if 'since' in variables:
+        params.insert(0, '$since: DateTime')
+    return f"query({', '.join(params)}) {{ {' '.join(blocks)} }}", variables
+
+
+# add one page of results to every repository of the batch
+def read_graphql_page(batch, data, errors, since):
+    # errors of a single repository (NOT_FOUND, FORBIDDEN, ...) carry its alias in the path
+    failed = {}
+    for error in errors:
+        path = error.get('path') or ['']
+        failed.setdefault(path[0], error.get('message', 'GraphQL error'))
+
+    for i, pages in enumerate(batch):
+        alias = f"r{i}"
+        repository = (data or {}).get(alias)
+        if alias in failed or repository is None:
+            pages.error = failed.get(alias, 'Repository not found')
+            continue
+        for connection, _, _ in GRAPHQL_CONNECTIONS:
+            if connection not in pages.cursors:
+                continue
+            page = repository[connection]
+            finished = not page['pageInfo']['hasNextPage']
+            for node in page['nodes']:
+                if 'updatedAt' in node and node['updatedAt'] < since:
+                    finished = True
+                    continue
+                pages.items.append((parse_timestamp(node['createdAt']), parse_timestamp(node['closedAt']),
+                                    connection == 'pullRequests'))
+            if finished:
+                del pages.cursors[connection]
+            else:
+                pages.cursors[connection] = page['pageInfo']['endCursor']
+
+
+# one GraphQL query, retried while the budget is used up (GraphQL answers that with 200 and RATE_LIMITED)
+async def graphql_query(client, query, variables):
+    for attempt in range(client.retries + 1):
+        body, _ = await client.request('POST', '/graphql', json={'query': query, 'variables': variables})
+        errors = body.get('errors') or []
+        if any(error.get('type') == 'RATE_LIMITED' for error in errors):
+            bucket = client.bucket('graphql')
+            now = time.time()
+            bucket.block(max(bucket.reset + 1, now + 2 ** attempt))
+            logging.info(f"GraphQL rate limit used up, retrying in {bucket.blocked_until - now:.0f}s")
+            continue
+        # errors that don't belong to one repository fail the whole query
+        if body.get('data') is None or any(not error.get('path') for error in errors):
+            raise RuntimeError('; '.join(error.get('message', 'GraphQL error') for error in errors))
+        return body['data'], errors
+    raise RuntimeError(f"Gave up on a GraphQL query after {client.retries + 1} attempts")
+
+
+# (repo, items, error) of every repository in completion order, through GraphQL queries of
+# batch_size repositories each, with concurrency queries in flight
+async def collect_issue_items_graphql(repos, token, start_date, concurrency=2, batch_size=10, base_url=API_URL):
+    since = start_date.strftime('%Y-%m-%dT%H:%M:%SZ')
+    pending = deque(repos)
+    results = asyncio.Queue()
+
+    async with GitHubClient(token, base_url, connections=concurrency) as client:
+        async def run_batches():
+            batch = []
+            while pending or batch:
+                # refill the batch from the repositories nobody took yet
+                while pending and len(batch) < batch_size:
+                    batch.append(RepoPages(pending.popleft()))
+                query, variables = build_graphql_query(batch, since)
+                try:
+                    data, errors = await graphql_query(client, query, variables)
+                    read_graphql_page(batch, data, errors, since)
+                except Exception as e:
+                    for pages in batch:
+                        pages.error = str(e)
+                for pages in batch:
+                    if pages.done():
+                        results.put_nowait((pages.repo, pages.items if pages.error is None else [], pages.error))
+                batch = [pages for pages in batch if not pages.done()]
+
+        tasks = [asyncio.create_task(run_batches()) for _ in range(concurrency)]
+        try:
+            for _ in range(len(repos)):
+                yield await results.get()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        logging.info(f"{client.requests} API requests")
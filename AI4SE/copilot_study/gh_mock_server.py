@@ -0,0 +1,251 @@
+"""
+Author: Leyli (Aya) Garryyeva
+
+Local stand-in for the parts of the GitHub REST and GraphQL APIs the collectors use, so they
+can be run and timed without a token or quota (--api-url of gh_monthly_pr_code.py and
+keyword_search/Get_readme_files.py).
+
+Every repository exists and gets synthetic issues and pull requests, generated from its
+name, so the same repository always has the same items and the real repository list can
+be used. The server sends X-RateLimit-* headers for a quota of --limit requests per
+--reset-in seconds and answers 403 once it is used up, like GitHub. --fail-every N answers
+every Nth request with a 500, --secondary-every N with a secondary rate limit (403 with
+quota left and no Retry-After). The request count per endpoint is printed on exit.
+
+/graphql understands the queries of gh_async_client.build_graphql_query: aliased
+repository(owner:, name:) fields with issues(filterBy: {since:}) and
+pullRequests(orderBy: UPDATED_AT DESC) connections. Like GitHub it rejects a query that
+declares a variable it doesn't use, and answers a used-up quota with RATE_LIMITED.
+
+/repos/{owner}/{repo}/readme sends a synthetic README (raw with the
+application/vnd.github.raw Accept header, base64 JSON otherwise) with an ETag. A matching
+If-None-Match gets 304, which like /rate_limit doesn't count against the quota. One in ten
+repositories has no README (404).
+
+    python gh_mock_server.py --port 8765 --limit 5000 --reset-in 60
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+
+
+def format_timestamp(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ') if value else None
+
+
+# issues and pull requests of a repository, the same on every call
+def synthetic_items(repo):
+    rng = random.Random(zlib.crc32(repo.encode()))
+    items = []
+    for number in range(1, rng.randint(50, 400)):
+        created = datetime(2019, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=rng.randint(0, 5 * 365 * 86400))
+        closed = created + timedelta(seconds=rng.randint(0, 200 * 86400)) if rng.random() < 0.8 else None
+        is_pr = rng.random() < 0.5
+        item = {
+            'id': zlib.crc32(f"{repo}#{number}".encode()), 'number': number, 'title': f"Item {number}",
+            'state': 'closed' if closed else 'open',
+            'created_at': format_timestamp(created), 'closed_at': format_timestamp(closed),
+            'updated_at': format_timestamp(closed or created),
+            'html_url': f"https://github.com/{repo}/{'pull' if is_pr else 'issues'}/{number}",
+        }
+        if is_pr:
+            item['pull_request'] = {'html_url': item['html_url']}
+        items.append(item)
+    # newest first, the default order of the listing
+    return sorted(items, key=lambda item: item['created_at'], reverse=True)
+
+
+# README of a repository, the same on every call, or None for the ones without
+def synthetic_readme(repo):
+    rng = random.Random(zlib.crc32(repo.encode()) + 1)
+    if rng.random() < 0.1:
+        return None
+    words = ['install', 'run', 'build', 'usage', 'python', 'docker', 'license', 'example', 'test', 'api',
+             'ChatGPT', 'Copilot', 'GitHub Copilot', 'model', 'data']
+    lines = [f"# {repo.split('/')[1]}", '']
+    lines += [' '.join(rng.choice(words) for _ in range(rng.randint(5, 15))) for _ in range(rng.randint(5, 50))]
+    return '\n'.join(lines).encode('utf-8')
+
+
+class MockGitHub:
+    """Request handlers with a shared rate-limit window."""
+
+    def __init__(self, limit=5000, reset_in=3600, fail_every=0, secondary_every=0):
+        self.limit = limit
+        self.reset_in = reset_in
+        self.fail_every = fail_every
+        self.secondary_every = secondary_every
+        self.remaining = limit
+        self.reset_at = time.time() + reset_in
+        self.requests = Counter()
+        self.items = {}
+
+    def repo_items(self, repo):
+        if repo not in self.items:
+            self.items[repo] = synthetic_items(repo)
+        return self.items[repo]
+
+    def rate_headers(self):
+        if time.time() >= self.reset_at:
+            self.remaining, self.reset_at = self.limit, time.time() + self.reset_in
+        return {'X-RateLimit-Limit': str(self.limit), 'X-RateLimit-Remaining': str(self.remaining),
+                'X-RateLimit-Reset': str(int(self.reset_at) + 1)}
+
+    # every request counts against the quota, once it is used up the answer is 403 until the reset
+    @web.middleware
+    async def middleware(self, request, handler):
+        resource = request.match_info.route.resource
+        self.requests[resource.canonical if resource else request.path] += 1
+        if request.path == '/rate_limit':
+            return await handler(request)
+        if self.fail_every and sum(self.requests.values()) % self.fail_every == 0:
+            return web.json_response({'message': 'Server Error'}, status=500)
+        headers = self.rate_headers()
+        if self.secondary_every and sum(self.requests.values()) % self.secondary_every == 0:
+            return web.json_response({'message': 'You have exceeded a secondary rate limit. '
+                                                 'Please wait a few minutes before you try again.'},
+                                     status=403, headers=headers)
+        if self.remaining <= 0:
+            if request.path == '/graphql':
+                # GraphQL reports a used-up quota as an error of a 200 response
+                return web.json_response({'errors': [{'type': 'RATE_LIMITED', 'message': 'API rate limit exceeded'}]},
+                                         headers=headers)
+            return web.json_response({'message': 'API rate limit exceeded'}, status=403, headers=headers)
+        self.remaining -= 1
+        response = await handler(request)
+        if response.status == 304:
+            self.remaining += 1
+        response.headers.update(self.rate_headers())
+        return response
+
+    async def repository(self, request):
+        repo = f"{request.match_info['owner']}/{request.match_info['repo']}"
+        return web.json_response({'id': zlib.crc32(repo.encode()), 'full_name': repo,
+                                  'name': request.match_info['repo'], 'url': str(request.url)})
+
+    # /issues?state=all&since=...&per_page=...&page=..., with a Link header to the next page
+    async def issues(self, request):
+        items = self.repo_items(f"{request.match_info['owner']}/{request.match_info['repo']}")
+        since = request.query.get('since')
+        if since:
+            items = [item for item in items if item['updated_at'] >= since]
+        per_page = min(int(request.query.get('per_page', 30)), 100)
+        page = int(request.query.get('page', 1))
+        headers = {}
+        if page * per_page < len(items):
+            next_url = request.url.update_query({'page': str(page + 1)})
+            headers['Link'] = f'<{next_url}>; rel="next"'
+        await asyncio.sleep(0.01)
+        return web.json_response(items[(page - 1) * per_page:page * per_page], headers=headers)
+
+    async def rate_limit(self, request):
+        headers = self.rate_headers()
+        rate = {'limit': self.limit, 'remaining': self.remaining, 'reset': int(self.reset_at) + 1}
+        return web.json_response({'resources': {'core': rate}, 'rate': rate}, headers=headers)
+
+    async def readme(self, request):
+        content = synthetic_readme(f"{request.match_info['owner']}/{request.match_info['repo']}")
+        if content is None:
+            return web.json_response({'message': 'Not Found'}, status=404)
+        etag = f'"{hashlib.sha1(content).hexdigest()}"'
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={'ETag': etag})
+        await asyncio.sleep(0.01)
+        if request.headers.get('Accept') == 'application/vnd.github.raw':
+            return web.Response(body=content, headers={'ETag': etag})
+        return web.json_response({'encoding': 'base64', 'content': base64.b64encode(content).decode('ascii')},
+                                 headers={'ETag': etag})
+
+    # one page of a GraphQL connection: nodes with the requested fields, the cursor is the offset
+    @staticmethod
+    def connection_page(items, cursor, first, fields):
+        start = int(cursor or 0)
+        names = {'createdAt': 'created_at', 'closedAt': 'closed_at', 'updatedAt': 'updated_at'}
+        nodes = [{field: item[names[field]] for field in fields} for item in items[start:start + first]]
+        return {'pageInfo': {'hasNextPage': start + first < len(items), 'endCursor': str(start + first)},
+                'nodes': nodes}
+
+    async def graphql(self, request):
+        body = await request.json()
+        query, variables = body['query'], body.get('variables') or {}
+        header, _, selection = query.partition('{')
+        unused = [name for name in re.findall(r'\$(\w+):', header) if not re.search(rf'\${name}\b', selection)]
+        if unused:
+            return web.json_response({'errors': [{'message': f"Variable ${unused[0]} is declared by anonymous "
+                                                             f"query but not used"}]})
+
+        data = {}
+        repositories = list(re.finditer(r'(\w+): repository\(owner: \$(\w+), name: \$(\w+)\)', selection))
+        for k, match in enumerate(repositories):
+            alias, owner, name = match.groups()
+            items = self.repo_items(f"{variables[owner]}/{variables[name]}")
+            block = selection[match.end():repositories[k + 1].start() if k + 1 < len(repositories) else None]
+            data[alias] = {}
+            for connection, first, cursor, arguments, fields in re.findall(
+                    r'(issues|pullRequests)\(first: (\d+), after: \$(\w+)(.*?)\) .*?nodes \{ ([\w ]+) \}', block):
+                if connection == 'issues':
+                    nodes = [item for item in items if 'pull_request' not in item]
+                    if '$since' in arguments:
+                        nodes = [item for item in nodes if item['updated_at'] >= variables['since']]
+                else:
+                    nodes = sorted((item for item in items if 'pull_request' in item),
+                                   key=lambda item: item['updated_at'], reverse=True)
+                data[alias][connection] = self.connection_page(nodes, variables[cursor], int(first), fields.split())
+        await asyncio.sleep(0.02)
+        return web.json_response({'data': data})
+
+    def app(self):
+        app = web.Application(middlewares=[self.middleware])
+        app.router.add_get('/repos/{owner}/{repo}', self.repository)
+        app.router.add_get('/repos/{owner}/{repo}/issues', self.issues)
+        app.router.add_get('/repos/{owner}/{repo}/readme', self.readme)
+        app.router.add_get('/rate_limit', self.rate_limit)
+        app.router.add_post('/graphql', self.graphql)
+        return app
+
+
+# serve mock on a free local port from a background thread, for tests: (base url, stop function)
+def serve_in_thread(mock):
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(mock.app())
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.TCPSite(runner, '127.0.0.1', 0).start())
+    host, port = runner.addresses[0][:2]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+
+    return f"http://{host}:{port}", stop
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve a local mock of the GitHub API')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--limit', type=int, default=5000, help='requests per rate-limit window')
+    parser.add_argument('--reset-in', type=int, default=3600, help='seconds per rate-limit window')
+    parser.add_argument('--fail-every', type=int, default=0, help='answer every Nth request with a 500')
+    parser.add_argument('--secondary-every', type=int, default=0,
+                        help='answer every Nth request with a secondary rate limit')
+    args = parser.parse_args()
+
+    mock = MockGitHub(args.limit, args.reset_in, args.fail_every, args.secondary_every)
+    try:
+        web.run_app(mock.app(), host='127.0.0.1', port=args.port)
+    finally:
+        for endpoint, count in sorted(mock.requests.items()):
+            print(f"{count:>8} {endpoint}")
@@ -13,6 +13,16 @@ It generates a CSV file containing the following information for each repository
 
 Note: Ensure you have a 'token.txt' file containing your GitHub token in the same directory.
 
+Collectors:
+  - pygithub (default): one repository at a time through PyGithub
+  - async: gh_async_client.py, many repositories at once over one pooled aiohttp session
+  - graphql: gh_async_client.py, GraphQL queries over several repositories each (aliases),
+    only createdAt/closedAt of 100 issues and pull requests per page
+
+--api-url points every collector at another API, e.g. the local mock of gh_mock_server.py:
+    python gh_mock_server.py --port 8765
+    python gh_monthly_pr_code.py --collector async --api-url http://127.0.0.1:8765
+
 Output:
 - gh_monthly_pr_data_.csv
 
@@ -20,6 +30,7 @@ Output:
 
 
 import pandas as pd
+from data_cache import read_excel_cached
 from datetime import datetime, timezone
 import csv
 from tqdm import tqdm
@@ -27,20 +38,25 @@ from github import Github
 from statistics import mean
 import logging
 import sys
+import argparse
+import asyncio
+
+from gh_async_client import API_URL, collect_issue_items, collect_issue_items_graphql
 
 
-# Load gh data files into pandas dataframes
-copilot_pr_list = pd.read_excel('./data_files/copilot_repos_prs.xlsx')
-copilot_commit_list = pd.read_excel('./data_files/copilot_repos_commits.xlsx')
+# Load gh data files into pandas dataframes and get the list of repositories
+def load_repository_list():
+    copilot_pr_list = read_excel_cached('./data_files/copilot_repos_prs.xlsx')
+    copilot_commit_list = read_excel_cached('./data_files/copilot_repos_commits.xlsx')
 
-# get the list of repositories
-clean_data = pd.DataFrame(
-    pd.concat([copilot_pr_list['Repository'], 
-               copilot_commit_list['Repository']]).unique(),
-    columns=['name'])
+    clean_data = pd.DataFrame(
+        pd.concat([copilot_pr_list['Repository'], 
+                   copilot_commit_list['Repository']]).unique(),
+        columns=['name'])
 
-# test on two repos
-#clean_data = clean_data.sample(21)
+    # test on two repos
+    #clean_data = clean_data.sample(21)
+    return clean_data
 
 
 # Set up logging
@@ -54,7 +70,87 @@ def read_github_token(file_path):
         logging.error(f"Token file not found: {file_path}")
         return None
 
-def process_repositories():
+FIELDNAMES = [
+    "repository", "month", "issues_opened", "issues_closed", 
+    "prs_opened", "prs_closed", "mean_pr_latency", 
+    "mean_issue_latency", "tests_per_build"
+]
+
+
+def new_month():
+    return {
+        "issues_opened": 0, "issues_closed": 0,
+        "prs_opened": 0, "prs_closed": 0,
+        "pr_latencies": [], "issue_latencies": [],
+        # Process builds and tests (this is a placeholder, as actual build data might require additional API calls)
+        "tests_executed": 0, "build_count": 0
+    }
+
+
+# monthly_data of a repository from its (created_at, closed_at, is_pr) items
+# every pull request also counts as an issue, like in the GitHub issues listing
+def aggregate_items(items, end_date):
+    monthly_data = {}
+    for created, closed, is_pr in items:
+        issue_month = created.strftime("%Y-%m")
+        if issue_month not in monthly_data:
+            monthly_data[issue_month] = new_month()
+        monthly_data[issue_month]["issues_opened"] += 1
+        if is_pr:
+            monthly_data[issue_month]["prs_opened"] += 1
+
+        if closed and closed <= end_date:
+            closed_month = closed.strftime("%Y-%m")
+            if closed_month not in monthly_data:
+                monthly_data[closed_month] = new_month()
+            latency = (closed - created).days
+            monthly_data[closed_month]["issues_closed"] += 1
+            monthly_data[closed_month]["issue_latencies"].append(latency)
+            if is_pr:
+                monthly_data[closed_month]["prs_closed"] += 1
+                monthly_data[closed_month]["pr_latencies"].append(latency)
+    return monthly_data
+
+
+def monthly_rows(repo, monthly_data):
+    rows = []
+    for month, data in monthly_data.items():
+        rows.append({
+            "repository": repo,
+            "month": month,
+            "issues_opened": data["issues_opened"],
+            "issues_closed": data["issues_closed"],
+            "prs_opened": data["prs_opened"],
+            "prs_closed": data["prs_closed"],
+            "mean_pr_latency": mean(data["pr_latencies"]) if data["pr_latencies"] else 0,
+            "mean_issue_latency": mean(data["issue_latencies"]) if data["issue_latencies"] else 0,
+            "tests_per_build": (data["tests_executed"] / data["build_count"]) if data["build_count"] > 0 else 0
+        })
+    return rows
+
+
+# (repo, items, error) through PyGithub, one blocking request per page
+# created_at and closed_at of a pull request are those of its issue, so
+# issue.as_pull_request() isn't needed; issue.pull_request is missing from plain issues in
+# the listing and reading it costs one more request per issue, html_url tells them apart
+def fetch_items_pygithub(g, repo, start_date):
+    logging.info(f"Processing {repo}")
+    try:
+        github_repo = g.get_repo(repo)
+        logging.info(f"Successfully accessed repo: {repo}")
+
+        items = []
+        for issue in github_repo.get_issues(state='all', since=start_date):
+            items.append((issue.created_at.replace(tzinfo=timezone.utc),
+                          issue.closed_at.replace(tzinfo=timezone.utc) if issue.closed_at else None,
+                          '/pull/' in issue.html_url))
+        return repo, items, None
+    except Exception as e:
+        return repo, [], str(e)
+
+
+def process_repositories(collector='pygithub', concurrency=8, output_file='./data_files/gh_monthly_pr_data_.csv',
+                         batch_size=10, api_url=API_URL):
     token_file_path = 'token.txt'
     GITHUB_TOKEN = read_github_token(token_file_path)
 
@@ -67,130 +163,52 @@ def process_repositories():
     start_date = datetime(2019, 7, 1, tzinfo=timezone.utc)
     end_date = datetime(2023, 7, 1, tzinfo=timezone.utc)
 
-    output_file = './data_files/gh_monthly_pr_data_.csv'
-    
-    fieldnames = [
-        "repository", "month", "issues_opened", "issues_closed", 
-        "prs_opened", "prs_closed", "mean_pr_latency", 
-        "mean_issue_latency", "tests_per_build"
-    ]
+    repos = list(load_repository_list()['name'])
 
     # Create the CSV file and write the header
     with open(output_file, 'w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
         writer.writeheader()
-
-    dataset = []
-    row_count = 0
-
-    g = Github(GITHUB_TOKEN)
-
-    for repo in tqdm(clean_data['name'], desc="Processing repositories"):
-        logging.info(f"Processing {repo}")
-
-        monthly_data = {}
-
-        try:
-            github_repo = g.get_repo(repo)
-            logging.info(f"Successfully accessed repo: {repo}")
-
-            # Process issues and pull requests
-            issues_count = 0
-            for issue in github_repo.get_issues(state='all', since=start_date):
-                issues_count += 1
-                issue_created = issue.created_at.replace(tzinfo=timezone.utc)
-                issue_month = issue_created.strftime("%Y-%m")
-                if issue_month not in monthly_data:
-                    monthly_data[issue_month] = {
-                        "issues_opened": 0, "issues_closed": 0,
-                        "prs_opened": 0, "prs_closed": 0,
-                        "pr_latencies": [], "issue_latencies": [],
-                        "tests_executed": 0, "build_count": 0
-                    }
-
-                monthly_data[issue_month]["issues_opened"] += 1
-                if issue.closed_at:
-                    issue_closed = issue.closed_at.replace(tzinfo=timezone.utc)
-                    if issue_closed <= end_date:
-                        closed_month = issue_closed.strftime("%Y-%m")
-                        if closed_month not in monthly_data:
-                            monthly_data[closed_month] = {
-                                "issues_opened": 0, "issues_closed": 0,
-                                "prs_opened": 0, "prs_closed": 0,
-                                "pr_latencies": [], "issue_latencies": [],
-                                "tests_executed": 0, "build_count": 0
-                            }
-                        monthly_data[closed_month]["issues_closed"] += 1
-                        latency = (issue_closed - issue_created).days
-                        monthly_data[closed_month]["issue_latencies"].append(latency)
-
-                if issue.pull_request:
-                    pr = issue.as_pull_request()
-                    pr_created = pr.created_at.replace(tzinfo=timezone.utc)
-                    pr_month = pr_created.strftime("%Y-%m")
-                    monthly_data[pr_month]["prs_opened"] += 1
-                    if pr.closed_at:
-                        pr_closed = pr.closed_at.replace(tzinfo=timezone.utc)
-                        if pr_closed <= end_date:
-                            closed_month = pr_closed.strftime("%Y-%m")
-                            if closed_month not in monthly_data:
-                                monthly_data[closed_month] = {
-                                    "issues_opened": 0, "issues_closed": 0,
-                                    "prs_opened": 0, "prs_closed": 0,
-                                    "pr_latencies": [], "issue_latencies": [],
-                                    "tests_executed": 0, "build_count": 0
-                                }
-                            monthly_data[closed_month]["prs_closed"] += 1
-                            latency = (pr_closed - pr_created).days
-                            monthly_data[closed_month]["pr_latencies"].append(latency)
-
-            logging.info(f"Processed {issues_count} issues for {repo}")
-
-            # Process builds and tests (this is a placeholder, as actual build data might require additional API calls)
-            for month in monthly_data:
-                monthly_data[month]["tests_executed"] = 0  # Placeholder value
-                monthly_data[month]["build_count"] = 0  # Placeholder value
-
-            logging.info(f"Completed processing {repo}")
-
-        except Exception as e:
-            logging.error(f"Failed to process {repo}: {str(e)}")
-            continue
-
-        for month, data in monthly_data.items():
-            row = {
-                "repository": repo,
-                "month": month,
-                "issues_opened": data["issues_opened"],
-                "issues_closed": data["issues_closed"],
-                "prs_opened": data["prs_opened"],
-                "prs_closed": data["prs_closed"],
-                "mean_pr_latency": mean(data["pr_latencies"]) if data["pr_latencies"] else 0,
-                "mean_issue_latency": mean(data["issue_latencies"]) if data["issue_latencies"] else 0,
-                "tests_per_build": (data["tests_executed"] / data["build_count"]) if data["build_count"] > 0 else 0
-            }
-            dataset.append(row)
-            row_count += 1
-
-            if row_count >= 100:
-                with open(output_file, 'a', newline='') as csvfile:
-                    writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                    writer.writerows(dataset)
-                logging.info(f"Wrote {row_count} rows to {output_file}")
-                dataset = []
-                row_count = 0
-
-    # Write any remaining rows
-    if dataset:
-        with open(output_file, 'a', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writerows(dataset)
-        logging.info(f"Wrote final {len(dataset)} rows to {output_file}")
+        progress = tqdm(total=len(repos), desc="Processing repositories")
+
+        # rows of every repository are written as soon as it is done
+        def write(repo, items, error):
+            progress.update(1)
+            if error is not None:
+                logging.error(f"Failed to process {repo}: {error}")
+                return
+            logging.info(f"Processed {len(items)} issues for {repo}")
+            writer.writerows(monthly_rows(repo, aggregate_items(items, end_date)))
+            csvfile.flush()
+
+        if collector in ('async', 'graphql'):
+            async def collect():
+                if collector == 'async':
+                    results = collect_issue_items(repos, GITHUB_TOKEN, start_date, concurrency, api_url)
+                else:
+                    results = collect_issue_items_graphql(repos, GITHUB_TOKEN, start_date, concurrency, batch_size,
+                                                          api_url)
+                async for result in results:
+                    write(*result)
+            asyncio.run(collect())
+        else:
+            g = Github(GITHUB_TOKEN, base_url=api_url)
+            for repo in repos:
+                write(*fetch_items_pygithub(g, repo, start_date))
+        progress.close()
 
     logging.info("Script completed.")
 
 if __name__ == "__main__":
-    process_repositories()
-
-
-    
+    parser = argparse.ArgumentParser(description='Collect monthly issue and pull request metrics')
+    parser.add_argument('--collector', choices=['pygithub', 'async', 'graphql'], default='pygithub',
+                        help='async fetches many repositories at once over one pooled aiohttp session, '
+                             'graphql fetches several repositories per query')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='repositories (async) or queries (graphql) in flight at the same time')
+    parser.add_argument('--batch-size', type=int, default=10, help='repositories per GraphQL query')
+    parser.add_argument('--output', default='./data_files/gh_monthly_pr_data_.csv')
+    parser.add_argument('--api-url', default=API_URL, help='GitHub API base URL, e.g. of gh_mock_server.py')
+    args = parser.parse_args()
+
+    process_repositories(args.collector, args.concurrency, args.output, args.batch_size, args.api_url)
@@ -20,14 +20,15 @@ def preprocess_data():
     import pandas as pd 
     import numpy as np
     import datetime as Dt
+    from data_cache import read_csv_cached
 
 
     # load the data
     # popular repo data from github
-    repo_data = pd.read_csv('data_files/gh_popular_repo_data.csv')
+    repo_data = read_csv_cached('data_files/gh_popular_repo_data.csv')
     
     # monthly commit data from github
-    monthly_commits = pd.read_csv('data_files/gh_monthly_commit_data.csv')
+    monthly_commits = read_csv_cached('data_files/gh_monthly_commit_data.csv')
     
     # remove duplicates from monthly_commits
     monthly_commits = monthly_commits.drop_duplicates()
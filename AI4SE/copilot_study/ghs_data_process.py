@@ -6,7 +6,8 @@ and extracts the top 50th percentile of repositories based on stargazers count.
 to a CSV file.
 
 Steps:
-1. Load GitHub repository data from CSV files into pandas DataFrames.
+1. Load GitHub repository data from CSV files into pandas DataFrames (concurrently, through the Parquet cache in
+    data_cache.py; with --columns minimal only the columns in COLUMNS and COUNT_COLUMNS).
 2. Merge all the datasets into a single DataFrame.
 3. Filter the data based on various conditions such as homepage URL, repository status, creation and last commit dates, 
     repository name, default branch, and number of contributors.
@@ -16,25 +17,45 @@ Steps:
 
 Output:
 - A CSV file named 'gh_popular_repo_data.csv' containing the filtered repository data.
+- Wall time (and with --trace-memory peak memory) of every stage, printed at the end.
+
+Usage:
+    python ghs_data_process.py                     # every GHS column
+    python ghs_data_process.py --columns minimal   # only the columns used for filtering and by the later steps
+    python ghs_data_process.py --trace-memory      # also report peak memory per stage
 """
 
+import argparse
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
 import pandas as pd
-# Load ghs data files into pandas dataframes
-c_plus_data = pd.read_csv('./data_files/ghs_c_plus_plus.csv').set_index('id')
-c_sharp_data = pd.read_csv('./data_files/ghs_c_sharp.csv').set_index('id')
-go_data = pd.read_csv('./data_files/ghs_go.csv').set_index('id')
-java_data = pd.read_csv('./data_files/ghs_java.csv').set_index('id')
-python_data = pd.read_csv('./data_files/ghs_python.csv').set_index('id')
-ruby_data = pd.read_csv('./data_files/ghs_ruby.csv').set_index('id')
-typescript_data = pd.read_csv('./data_files/ghs_typescript.csv').set_index('id')
-javascript_data = pd.read_csv('./data_files/ghs_javascript.csv').set_index('id')
-
-# Merge all the datasets into one dataset
-all_data = pd.concat([c_plus_data, c_sharp_data, go_data, java_data, 
-                      python_data, ruby_data, typescript_data, javascript_data])
-
-# print the number of rows in the dataset
-print("Total number of repositories in the original GHS data: ", all_data.shape[0])
+
+from data_cache import read_csv_cached
+
+LANGUAGE_FILES = ['ghs_c_plus_plus.csv', 'ghs_c_sharp.csv', 'ghs_go.csv', 'ghs_java.csv',
+                  'ghs_python.csv', 'ghs_ruby.csv', 'ghs_typescript.csv', 'ghs_javascript.csv']
+
+# columns read from the GHS files: the ones the filters use and the ones later steps read
+COLUMNS = {
+    'id': 'int64',
+    'name': 'str',
+    'mainLanguage': 'category',
+    'homepage': 'str',
+    'isArchived': 'bool',
+    'isDisabled': 'bool',
+    'isLocked': 'bool',
+    'createdAt': 'str',
+    'lastCommit': 'str',
+    'defaultBranch': 'str',
+    'license': 'str',
+}
+# counts become nullable integers so a missing value doesn't turn them into floats,
+# converting after parsing is several times faster than read_csv(dtype='Int64')
+COUNT_COLUMNS = ['contributors', 'commits', 'stargazers', 'watchers', 'forks', 'totalPullRequests']
 
 #  Filter data based on selected criteria
 #valid_licenses = {'Apache License 2.0', 'MIT License', 'Other'}
@@ -45,69 +66,122 @@ comp_names = {'microsoft',
               'aws', 'amazon', #awslabs, amazonwebservices
               'jetbrains', 'vscode'              
               }
-clean_data = all_data.copy()
-
-# filter the data based on the following conditions
-  # Filter for defaultBranch
-clean_data = clean_data[
-    #(clean_data['license'].isin(valid_licenses)) &  
-    (~clean_data['homepage'].str.contains('youtube.com', na=False)) &  
-    # Filter out instances where isArchived, isDisabled, or isLocked are True
-    (~(clean_data['isArchived'] | clean_data['isDisabled'] | clean_data['isLocked'])) &
-    (pd.to_datetime(clean_data['createdAt']) <= pd.to_datetime('2020-06-30')) &  
-    (pd.to_datetime(clean_data['lastCommit']) >= pd.to_datetime('2022-07-31')) &      
-    (~clean_data['name'].str.lower().str.startswith(tuple(comp_names), na=False))& 
-    (clean_data['defaultBranch'].isin(['main', 'master']))  &
-    (clean_data['contributors'] > 10)
-] # 20569
-
-print("Total number of repositories after filtering the data: " ,clean_data.shape[0])
-
-
-# Identify top repo cutoff values based on watchers, stargazers, and forks for each language
-top_n_percentile_repos = clean_data.groupby('mainLanguage').apply(
-    lambda x: x[
-        #(x['watchers'] >= x['watchers'].quantile(0.5)) &
-        (x['stargazers'] >= x['stargazers'].quantile(0.5)) 
-        #(x['forks'] >= x['forks'].quantile(0.5)) &
-        #(x['totalPullRequests'] >= x['totalPullRequests'].quantile(0.5))
-    ]
-).reset_index(drop=True)
-
-# Filter out the top 50% of repos: 
-clean_data = clean_data[clean_data['name'].isin(top_n_percentile_repos['name'])]
-
-# Remove redundant features that only have a single value across all rows
-redundant_features = [col for col in clean_data.columns if clean_data[col].nunique() == 1]
-clean_data = clean_data.drop(columns=redundant_features)
-
-
-print("Total number of repositories after extracting top 50-th percentile: " ,clean_data.shape[0]) # 10290
-
-# write full popular repo data to csv
-clean_data.to_csv('./data_files/gh_popular_repo_data.csv', index=False)
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
 
 
+# record wall time and peak memory of a block as (name, seconds, peak bytes)
+# peak memory comes from tracemalloc and is None when it isn't tracing
+@contextmanager
+def stage(name, report):
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    yield
+    peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+    report.append((name, time.perf_counter() - start, peak))
 
 
+def print_report(report):
+    print(f"{'stage':<12} {'seconds':>8} {'peak MB':>8}")
+    for name, seconds, peak in report:
+        peak = f"{peak / 2 ** 20:>8.1f}" if peak is not None else f"{'-':>8}"
+        print(f"{name:<12} {seconds:>8.2f} {peak}")
 
 
+# columns is 'all' or 'minimal' (COLUMNS and COUNT_COLUMNS only)
+def read_language_file(path, columns='all'):
+    usecols = list(COLUMNS) + COUNT_COLUMNS if columns == 'minimal' else None
+    cache_dir = os.path.join(os.path.dirname(path), 'parquet_cache')
+    data = read_csv_cached(path, cache_dir=cache_dir, usecols=usecols, dtype=COLUMNS)
+    return data.astype({column: 'Int64' for column in COUNT_COLUMNS})
 
 
+# Load ghs data files into pandas dataframes on a thread pool (the csv parser releases the GIL)
+# and merge them into one dataset
+def load_ghs_data(data_dir='./data_files', columns='all', workers=None):
+    paths = [f"{data_dir}/{file_name}" for file_name in LANGUAGE_FILES]
+    with ThreadPoolExecutor(max_workers=workers or min(len(paths), os.cpu_count() or 1)) as executor:
+        frames = list(executor.map(lambda path: read_language_file(path, columns), paths))
+    # union of the per-file categories, so the concatenated column stays categorical
+    languages = pd.api.types.union_categoricals([frame['mainLanguage'] for frame in frames]).categories
+    for frame in frames:
+        frame['mainLanguage'] = frame['mainLanguage'].cat.set_categories(languages)
+    return pd.concat(frames).set_index('id')
 
 
+# filter the data based on the following conditions
+# the cheap numeric and boolean conditions go first, dates are parsed once and
+# the string matching only runs on the rows that are still left
+def filter_repositories(clean_data):
+    clean_data = clean_data[
+        # Filter out instances where isArchived, isDisabled, or isLocked are True
+        (~(clean_data['isArchived'] | clean_data['isDisabled'] | clean_data['isLocked'])) &
+        (clean_data['contributors'] > 10).fillna(False) &
+        # Filter for defaultBranch
+        (clean_data['defaultBranch'].isin(['main', 'master']))
+    ]
+    clean_data = clean_data[
+        (pd.to_datetime(clean_data['createdAt']) <= pd.Timestamp('2020-06-30')) &  
+        (pd.to_datetime(clean_data['lastCommit']) >= pd.Timestamp('2022-07-31'))
+    ]
+    return clean_data[
+        #(clean_data['license'].isin(valid_licenses)) &  
+        (~clean_data['homepage'].str.contains('youtube.com', na=False)) &  
+        (~clean_data['name'].str.lower().str.startswith(tuple(comp_names), na=False))
+    ] # 20569
+
+
+# Identify top repo cutoff values based on stargazers for each language
+# the per-language median is broadcast back to every row in one groupby pass
+def top_percentile(clean_data, quantile=0.5):
+    cutoff = clean_data.groupby('mainLanguage', observed=True)['stargazers'].transform('quantile', quantile)
+    top_names = clean_data.loc[(clean_data['stargazers'] >= cutoff).fillna(False), 'name']
+    # Filter out the top 50% of repos: 
+    return clean_data[clean_data['name'].isin(top_names)]
+
+
+# trace_memory reports peak memory per stage, tracing slows read_csv down a lot so timings
+# are only comparable between runs with the same setting
+def process_ghs_data(data_dir='./data_files', output_csv='./data_files/gh_popular_repo_data.csv',
+                     columns='all', workers=None, trace_memory=False):
+    report = []
+    if trace_memory:
+        tracemalloc.start()
+
+    with stage('load', report):
+        all_data = load_ghs_data(data_dir, columns, workers)
+    # print the number of rows in the dataset
+    print("Total number of repositories in the original GHS data: ", all_data.shape[0])
+
+    with stage('filter', report):
+        clean_data = filter_repositories(all_data)
+    print("Total number of repositories after filtering the data: " ,clean_data.shape[0])
+
+    with stage('percentile', report):
+        clean_data = top_percentile(clean_data)
+
+        # Remove redundant features that only have a single value across all rows
+        redundant_features = [col for col in clean_data.columns if clean_data[col].nunique() == 1]
+        clean_data = clean_data.drop(columns=redundant_features)
+    print("Total number of repositories after extracting top 50-th percentile: " ,clean_data.shape[0]) # 10290
+
+    # write full popular repo data to csv
+    with stage('write', report):
+        clean_data.to_csv(output_csv, index=False)
+
+    if trace_memory:
+        tracemalloc.stop()
+    print_report(report)
+    return clean_data
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Select popular repositories from the GHS data')
+    parser.add_argument('--data-dir', default='./data_files')
+    parser.add_argument('--output', default='./data_files/gh_popular_repo_data.csv')
+    parser.add_argument('--columns', choices=['all', 'minimal'], default='all',
+                        help='read every GHS column or only the ones the filters and later steps use')
+    parser.add_argument('--workers', type=int, default=None, help='threads loading the language files')
+    parser.add_argument('--trace-memory', action='store_true', help='report peak memory of every stage')
+    args = parser.parse_args()
+
+    process_ghs_data(args.data_dir, args.output, args.columns, args.workers, args.trace_memory)
@@ -1,21 +1,47 @@
 '''
 Author Mostafa Ahmed
+
+Downloads the README of every repository in repos.csv into readmes/.
+
+  - Repositories whose README is already on disk (or known to have none) are skipped
+    before any request is made, so a restarted run picks up where it stopped.
+  - READMEs are fetched concurrently by a thread pool, paced by the shared rate-limit
+    scheduler, as raw content (application/vnd.github.raw) instead of base64 JSON.
+  - The ETag of every README is kept in readmes/readme_state.json. With --refresh the
+    existing READMEs are revalidated with If-None-Match, unchanged ones answer 304, which
+    doesn't count against the rate limit.
+
+    python Get_readme_files.py --workers 8
+    python Get_readme_files.py --refresh
+    python Get_readme_files.py --api-url http://127.0.0.1:8765   # against ../gh_mock_server.py
 '''
 import requests
 import csv
 import os
-import base64
+import json
 import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
+from rate_limit import RateLimitScheduler, tokens_from_env
+
 GITHUB_TOKEN = '##'
-GITHUB_REPO_CONTENT_URL = "https://api.github.com/repos/{owner}/{repo}/readme"
-RATE_LIMIT_URL = "https://api.github.com/rate_limit"
+API_URL = "https://api.github.com"
+GITHUB_REPO_CONTENT_URL = "{api_url}/repos/{owner}/{repo}/readme"
+RATE_LIMIT_URL = "{api_url}/rate_limit"
+RAW_ACCEPT = "application/vnd.github.raw"
+REPOS_FILE = 'repos.csv'
+README_DIR = 'readmes'
+STATE_FILE = os.path.join(README_DIR, 'readme_state.json')
+WORKERS = 8
 
 class DownloadStats:
     def __init__(self):
         self.total_repos = 0
+        self.total_repos_count = 0
         self.downloaded = 0
+        self.not_modified = 0
         self.skipped_existing = 0
         self.failed = 0
         self.start_time = time.time()
@@ -25,29 +51,29 @@ class DownloadStats:
         print(f"\nProgress Report:")
         print(f"Total repositories processed: {self.total_repos}")
         print(f"Successfully downloaded: {self.downloaded}")
+        print(f"Unchanged since the last run (304): {self.not_modified}")
         print(f"Skipped (already existing): {self.skipped_existing}")
         print(f"Failed downloads: {self.failed}")
         print(f"Time elapsed: {elapsed_time:.2f} seconds")
-        
-        if self.total_repos > 0:
+
+        if self.total_repos_count > 0:
             completion_percentage = (self.total_repos / self.total_repos_count) * 100
             print(f"Overall progress: {completion_percentage:.2f}%")
 
-def check_rate_limit():
-    headers = {
-        "Authorization": f"token {GITHUB_TOKEN}" if GITHUB_TOKEN else None,
-    }
+# /rate_limit itself doesn't count against the quota, it is only printed once at the start,
+# the scheduler paces the downloads from the headers of every response
+def check_rate_limit(scheduler, api_url=API_URL):
     try:
-        response = requests.get(RATE_LIMIT_URL, headers=headers)
+        response = scheduler.get(RATE_LIMIT_URL.format(api_url=api_url))
         if response.status_code == 200:
             rate_data = response.json()['rate']
             remaining = rate_data['remaining']
             reset_time = rate_data['reset']
-            
+
             print(f"API Rate Limit Status:")
             print(f"Remaining requests: {remaining}")
             print(f"Reset time: {datetime.fromtimestamp(reset_time)}")
-            
+
             return remaining, reset_time
         else:
             print(f"Failed to check rate limit. Status code: {response.status_code}")
@@ -56,100 +82,133 @@ def check_rate_limit():
         print(f"Error checking rate limit: {e}")
         return 0, None
 
-def download_readme(owner, repo):
-    headers = {
-        "Authorization": f"token {GITHUB_TOKEN}" if GITHUB_TOKEN else None,
-        "Accept": "application/vnd.github.v3+json"
-    }
+def readme_path(repo_full_name):
+    return os.path.join(README_DIR, f"{repo_full_name.replace('/', '_')}_README.md")
+
+# repository -> {'status': last HTTP status, 'etag': ETag of the saved README}
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+    with open(STATE_FILE, 'r', encoding='utf-8') as state_file:
+        return json.load(state_file)
+
+def save_state(state):
+    with open(STATE_FILE + '.tmp', 'w', encoding='utf-8') as state_file:
+        json.dump(state, state_file)
+    os.replace(STATE_FILE + '.tmp', STATE_FILE)
+
+# (status, raw README bytes or None, etag), status is None when the request itself failed
+def download_readme(scheduler, owner, repo, etag=None, api_url=API_URL):
+    headers = {"Accept": RAW_ACCEPT}
+    if etag:
+        headers["If-None-Match"] = etag
     try:
-        url = GITHUB_REPO_CONTENT_URL.format(owner=owner, repo=repo)
-        response = requests.get(url, headers=headers)
-        
-        if response.status_code == 404:
+        url = GITHUB_REPO_CONTENT_URL.format(api_url=api_url, owner=owner, repo=repo)
+        response = scheduler.get(url, headers=headers)
+
+        if response.status_code == 304:
+            return 304, None, etag
+        elif response.status_code == 404:
             print(f"README not found for {owner}/{repo}")
-            return None
         elif response.status_code == 403:
-            print(f"Rate limit exceeded or authentication required for {owner}/{repo}")
-            return None
+            print(f"Access denied for {owner}/{repo}")
         elif response.status_code != 200:
             print(f"Error downloading README for {owner}/{repo}. Status code: {response.status_code}")
-            return None
-            
-        readme_data = response.json()
-        if 'content' in readme_data:
-            return base64.b64decode(readme_data['content']).decode('utf-8')
-        return None
+        else:
+            return 200, response.content, response.headers.get('ETag')
+        return response.status_code, None, None
     except requests.exceptions.RequestException as e:
         print(f"Error downloading README for {owner}/{repo}: {e}")
-        return None
-    except UnicodeDecodeError as e:
-        print(f"Error decoding README content for {owner}/{repo}: {e}")
-        return None
+        return None, None, None
 
+# the README is written as downloaded, under a temporary name first so an interrupted
+# run never leaves a truncated file that the next run would skip
 def save_readme_to_file(repo_full_name, readme_content):
-    os.makedirs('readmes', exist_ok=True)
-    filename = f"readmes/{repo_full_name.replace('/', '_')}_README.md"
-    
+    filename = readme_path(repo_full_name)
     try:
-        if os.path.exists(filename):
-            return False
-            
-        with open(filename, 'w', encoding='utf-8') as readme_file:
+        with open(filename + '.tmp', 'wb') as readme_file:
             readme_file.write(readme_content)
+        os.replace(filename + '.tmp', filename)
         return True
     except IOError as e:
         print(f"Error saving README for {repo_full_name}: {e}")
         return False
 
-def download_readmes_from_csv():
+# (status, etag) of one repository, runs on the pool
+def fetch_readme(scheduler, repo_full_name, etag, api_url=API_URL):
+    owner, repo = repo_full_name.split('/')
+    status, readme_content, etag = download_readme(scheduler, owner, repo, etag, api_url)
+    if status == 200 and not save_readme_to_file(repo_full_name, readme_content):
+        status = None
+    return status, etag
+
+def download_readmes_from_csv(repos_file=REPOS_FILE, workers=WORKERS, refresh=False, api_url=API_URL):
+    api_url = api_url.rstrip('/')
     stats = DownloadStats()
-    
+    scheduler = RateLimitScheduler(tokens_from_env(GITHUB_TOKEN))
+    os.makedirs(README_DIR, exist_ok=True)
+    state = load_state()
+    executor = ThreadPoolExecutor(max_workers=workers)
+
     try:
-        # Count total repositories first
-        with open('repos.csv', 'r') as csvfile:
-            stats.total_repos_count = sum(1 for row in csv.DictReader(csvfile))
-        
-        with open('repos.csv', 'r') as csvfile:
-            reader = csv.DictReader(csvfile)
-            
-            for row in reader:
-                repo_full_name = row['name']
-                owner, repo = repo_full_name.split('/')
+        check_rate_limit(scheduler, api_url)
+
+        with open(repos_file, 'r') as csvfile:
+            repos = [row['name'] for row in csv.DictReader(csvfile)]
+        stats.total_repos_count = len(repos)
+
+        # decide what to fetch before any request is made
+        todo = []
+        for repo_full_name in repos:
+            known = state.get(repo_full_name, {})
+            exists = os.path.exists(readme_path(repo_full_name))
+            if not refresh and (exists or known.get('status') == 404):
+                stats.skipped_existing += 1
                 stats.total_repos += 1
-                
-                print(f"\nProcessing {stats.total_repos}/{stats.total_repos_count}: {repo_full_name}")
-                
-                remaining_requests, reset_time = check_rate_limit()
-                if remaining_requests < 1:
-                    sleep_duration = reset_time - int(time.time())
-                    print(f"Rate limit exceeded. Sleeping for {sleep_duration} seconds...")
-                    time.sleep(max(0, sleep_duration + 1))  # Add 1 second buffer
-                    continue
-                
-                readme_content = download_readme(owner, repo)
-                if readme_content:
-                    if save_readme_to_file(repo_full_name, readme_content):
-                        stats.downloaded += 1
-                        print(f"Successfully downloaded README for {repo_full_name}")
-                    else:
-                        stats.skipped_existing += 1
-                        print(f"Skipped {repo_full_name} (README already exists)")
-                else:
-                    stats.failed += 1
-                
-                # Print progress every 100 repositories
-                if stats.total_repos % 100 == 0:
-                    stats.print_progress()
-                
-                time.sleep(0.5)  # Pause between requests
-                
+                continue
+            todo.append((repo_full_name, known.get('etag') if exists else None))
+        print(f"{len(todo)} of {len(repos)} repositories to fetch")
+
+        futures = {executor.submit(fetch_readme, scheduler, repo_full_name, etag, api_url): repo_full_name
+                   for repo_full_name, etag in todo}
+        for future in as_completed(futures):
+            repo_full_name = futures[future]
+            status, etag = future.result()
+            stats.total_repos += 1
+            if status == 200:
+                stats.downloaded += 1
+                print(f"Successfully downloaded README for {repo_full_name}")
+            elif status == 304:
+                stats.not_modified += 1
+            else:
+                stats.failed += 1
+            # failed requests aren't recorded, so the next run tries them again
+            if status in (200, 304, 404):
+                state[repo_full_name] = {'status': status, 'etag': etag}
+
+            # Print progress and save the state every 100 repositories
+            if stats.total_repos % 100 == 0:
+                save_state(state)
+                stats.print_progress()
+
     except KeyboardInterrupt:
         print("\nDownload interrupted by user.")
     except Exception as e:
         print(f"\nAn error occurred: {e}")
     finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        save_state(state)
         stats.print_progress()
+        print(f"Total API requests: {scheduler.requests}")
         print("\nDownload process completed.")
 
 if __name__ == "__main__":
-    download_readmes_from_csv()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Download the README of every repository in repos.csv')
+    parser.add_argument('--repos', default=REPOS_FILE, help='csv file with a name column of owner/repo')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='READMEs downloaded at the same time')
+    parser.add_argument('--refresh', action='store_true',
+                        help='revalidate the READMEs already on disk with their ETags')
+    parser.add_argument('--api-url', default=API_URL, help='GitHub API base URL, e.g. of ../gh_mock_server.py')
+    args = parser.parse_args()
+
+    download_readmes_from_csv(args.repos, args.workers, args.refresh, args.api_url)
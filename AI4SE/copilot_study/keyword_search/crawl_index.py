@@ -0,0 +1,306 @@
+'''
+Full-text index over the crawl output, so a new keyword question is a query instead of
+another crawl or another pass over readmes/.
+
+The commits of github_commit_results.csv, the issue/PR mentions of
+github_search_results.csv and the READMEs go into one SQLite database with an FTS5 table
+over their text. Repository, date and author are ordinary indexed columns, so phrase and
+boolean queries (FTS5 syntax: "github copilot", copilot AND NOT chatgpt, copil*) combine
+with filters on them and come back in milliseconds.
+
+Updates are incremental: the offset up to which every CSV was indexed and a hash of the
+bytes before it are kept, and a run only reads what the crawlers appended since. A CSV
+that was started over (the crawlers rewrite it on every run, usually with the same first
+rows) no longer has the same bytes before the offset and is read again from the top, rows
+already indexed are skipped. A row the crawler is still writing is left for the next run.
+READMEs are re-indexed only when their size or modification time changed.
+
+    python crawl_index.py update
+    python crawl_index.py search '"github copilot" NOT chatgpt' --since 2023-01-01 --kind commit
+    python crawl_index.py search 'copilot' --repo owner/repo --author "Jane Doe"
+    python crawl_index.py search --phrase 'gpt-4'
+
+The words are those of SQLite's unicode61 tokenizer: a query for copilot finds "Copilot,"
+but not "copilotx", where the README keyword search matches substrings (copil* does).
+'''
+
+import argparse
+import csv
+import hashlib
+import io
+import os
+import sqlite3
+import time
+
+from readme_index import read_text
+from search_llm_phrases import get_repo_name, list_readmes
+
+INDEX_DB = 'crawl_index.db'
+COMMITS_FILE = 'github_commit_results.csv'
+ISSUES_FILE = 'github_search_results.csv'
+READMES_DIR = 'readmes'
+SCHEMA_VERSION = 2
+HASH_BLOCK = 1 << 20
+
+COMMIT_COLUMNS = ['query', 'Commit Message', 'Repository', 'URL', 'Date', 'Author']
+ISSUE_COLUMNS = ['Phrase', 'Issue/PR Title', 'State', 'Repository', 'URL', 'Context']
+
+SCHEMA = '''
+CREATE TABLE documents (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    repository TEXT,
+    date TEXT,
+    author TEXT,
+    url TEXT,
+    keyword TEXT,
+    state TEXT,
+    title TEXT,
+    body TEXT
+);
+CREATE INDEX documents_repository ON documents (repository);
+CREATE INDEX documents_date ON documents (date);
+CREATE INDEX documents_author ON documents (author COLLATE NOCASE);
+
+CREATE VIRTUAL TABLE documents_fts USING fts5 (title, body, content='documents', content_rowid='id');
+CREATE TRIGGER documents_insert AFTER INSERT ON documents BEGIN
+    INSERT INTO documents_fts (rowid, title, body) VALUES (new.id, new.title, new.body);
+END;
+CREATE TRIGGER documents_delete AFTER DELETE ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+END;
+
+-- how far every CSV was indexed with the sha1 of the bytes before, and the stat of every README at indexing time
+CREATE TABLE sources (
+    path TEXT PRIMARY KEY,
+    indexed_bytes INTEGER,
+    prefix TEXT,
+    size INTEGER,
+    mtime_ns INTEGER
+);
+'''
+
+INSERT = ('INSERT OR IGNORE INTO documents (key, kind, repository, date, author, url, keyword, state, title, body) '
+          'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)')
+
+
+def commit_document(row):
+    keyword, message, repository, url, date, author = row
+    return (f"commit:{url}", 'commit', repository, date, author, url, keyword, None,
+            message.split('\n', 1)[0], message)
+
+
+# one row per phrase an issue mentions, the CSV has the context around the mention, not the whole body
+def issue_document(row):
+    phrase, title, state, repository, url, context = row
+    return (f"issue:{url}:{phrase}", 'issue', repository, None, None, url, phrase, state, title, context)
+
+
+# hash of the first length bytes of a file, tells whether a CSV still starts with what was indexed
+def prefix_hash(path, length):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while length > 0:
+            block = f.read(min(length, HASH_BLOCK))
+            if not block:
+                break
+            digest.update(block)
+            length -= len(block)
+    return digest.hexdigest()
+
+
+# length of data up to the end of its last complete CSV record: the last line break outside quotes
+# (quotes inside a field are doubled, so an even number of quotes before it means it is outside)
+def complete_length(data):
+    end = data.rfind(b'\n')
+    while end >= 0 and data.count(b'"', 0, end) % 2:
+        end = data.rfind(b'\n', 0, end)
+    return end + 1
+
+
+# query as one FTS5 phrase, for keywords like gpt-4 that aren't valid query syntax themselves
+def phrase_query(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+class CrawlIndex:
+    """SQLite FTS5 index of the crawled commits, issues and READMEs."""
+
+    def __init__(self, path=INDEX_DB):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        if version == 0:
+            with self.db:
+                self.db.executescript(SCHEMA)
+                self.db.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+        elif version != SCHEMA_VERSION:
+            raise ValueError(f"{path} was built by another version, delete it and run update again")
+
+    def close(self):
+        self.db.close()
+
+    def count(self):
+        return self.db.execute('SELECT count(*) FROM documents').fetchone()[0]
+
+    # index the rows appended to a crawler CSV since the last update, returns the number of new documents
+    def update_csv(self, path, columns, to_document):
+        if not os.path.exists(path):
+            print(f"{path} not found, skipped.")
+            return 0
+        size = os.path.getsize(path)
+        known = self.db.execute('SELECT indexed_bytes, prefix FROM sources WHERE path = ?', (path,)).fetchone()
+        offset = 0
+        if known:
+            offset, prefix = known
+            if size < offset or prefix_hash(path, offset) != prefix:
+                # the crawler started the file over, read it again; rows seen before are ignored
+                offset = 0
+
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        # a row still being written is read on the next update
+        data = data[:complete_length(data)]
+        rows = csv.reader(io.StringIO(data.decode('utf-8', errors='replace'), newline=''))
+        documents = [to_document(row) for row in rows if len(row) == len(columns) and row != columns]
+
+        end = offset + len(data)
+        with self.db:
+            before = self.count()
+            self.db.executemany(INSERT, documents)
+            added = self.count() - before
+            self.db.execute('INSERT OR REPLACE INTO sources (path, indexed_bytes, prefix) VALUES (?, ?, ?)',
+                            (path, end, prefix_hash(path, end)))
+        return added
+
+    # index new and changed READMEs and drop deleted ones, returns the number of READMEs (re)indexed
+    def update_readmes(self, readmes_dir=READMES_DIR):
+        if not os.path.isdir(readmes_dir):
+            print(f"{readmes_dir} not found, skipped.")
+            return 0
+        indexed = {path: (size, mtime_ns) for path, size, mtime_ns in self.db.execute(
+            'SELECT path, size, mtime_ns FROM sources WHERE path LIKE ?', (os.path.join(readmes_dir, '%'),))}
+        updated = 0
+        with self.db:
+            for name in list_readmes(readmes_dir):
+                path = os.path.join(readmes_dir, name)
+                stat = os.stat(path)
+                if indexed.pop(path, None) == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                self.db.execute('DELETE FROM documents WHERE key = ?', (f"readme:{name}",))
+                repository = get_repo_name(name)
+                self.db.execute(INSERT, (f"readme:{name}", 'readme', repository, None, None,
+                                         f"https://github.com/{repository}", None, None, name, read_text(path)))
+                self.db.execute('INSERT OR REPLACE INTO sources (path, size, mtime_ns) VALUES (?, ?, ?)',
+                                (path, stat.st_size, stat.st_mtime_ns))
+                updated += 1
+            # what is left was deleted from the folder
+            for path in indexed:
+                self.db.execute('DELETE FROM documents WHERE key = ?', (f"readme:{os.path.basename(path)}",))
+                self.db.execute('DELETE FROM sources WHERE path = ?', (path,))
+        return updated
+
+    def update(self, commits_file=COMMITS_FILE, issues_file=ISSUES_FILE, readmes_dir=READMES_DIR):
+        print(f"Commits: {self.update_csv(commits_file, COMMIT_COLUMNS, commit_document)} new")
+        print(f"Issues/PRs: {self.update_csv(issues_file, ISSUE_COLUMNS, issue_document)} new")
+        print(f"READMEs: {self.update_readmes(readmes_dir)} new or changed")
+        print(f"{self.count()} documents in '{self.path}'.")
+
+    # documents matching an FTS5 query and the filters, the last indexed first, or the best match
+    # first with rank; ranking scores every match before the limit applies, so it is the slower order
+    def search(self, query=None, repositories=None, author=None, since=None, until=None, kinds=None,
+               limit=50, rank=False):
+        conditions, params = [], []
+        if query:
+            conditions.append('documents_fts MATCH ?')
+            params.append(query)
+        if repositories:
+            conditions.append(f"d.repository IN ({', '.join('?' * len(repositories))})")
+            params += repositories
+        if author:
+            conditions.append('d.author = ? COLLATE NOCASE')
+            params.append(author)
+        if since:
+            conditions.append('d.date >= ?')
+            params.append(since)
+        if until:
+            # dates are ISO timestamps, an --until day includes the whole day
+            conditions.append('d.date <= ?')
+            params.append(until + '\uffff')
+        if kinds:
+            conditions.append(f"d.kind IN ({', '.join('?' * len(kinds))})")
+            params += kinds
+
+        if query:
+            sql = ("SELECT d.kind, d.repository, d.date, d.author, d.url, d.keyword, "
+                   "snippet(documents_fts, 1, '[', ']', '...', 16) "
+                   "FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid")
+            order = 'rank' if rank else 'documents_fts.rowid DESC'
+        else:
+            sql = "SELECT d.kind, d.repository, d.date, d.author, d.url, d.keyword, substr(d.body, 1, 100) FROM documents d"
+            order = 'd.id DESC'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += f' ORDER BY {order} LIMIT ?'
+        return self.db.execute(sql, params + [limit]).fetchall()
+
+
+def print_results(results, output_file=None):
+    header = ['Kind', 'Repository', 'Date', 'Author', 'URL', 'Keyword', 'Snippet']
+    if output_file:
+        with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile, quoting=csv.QUOTE_ALL)
+            writer.writerow(header)
+            writer.writerows(results)
+        return
+    for kind, repository, date, author, url, keyword, snippet in results:
+        snippet = ' '.join((snippet or '').split())
+        print(f"{kind:<7} {repository or '':<40} {(date or '')[:10]:<10} {author or '':<20} {url}\n        {snippet}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Full-text index over the crawled commits, issues and READMEs')
+    parser.add_argument('--db', default=INDEX_DB)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    update_parser = commands.add_parser('update', help='index what the crawlers added since the last update')
+    update_parser.add_argument('--commits', default=COMMITS_FILE)
+    update_parser.add_argument('--issues', default=ISSUES_FILE)
+    update_parser.add_argument('--readmes', default=READMES_DIR)
+
+    search_parser = commands.add_parser('search', help='query the index')
+    search_parser.add_argument('query', nargs='?', help='FTS5 query, e.g. \'"github copilot" OR chatgpt\'')
+    search_parser.add_argument('--phrase', action='store_true', help='search the query text as one phrase')
+    search_parser.add_argument('--repo', nargs='+', help='owner/repo')
+    search_parser.add_argument('--author')
+    search_parser.add_argument('--since', help='YYYY-MM-DD')
+    search_parser.add_argument('--until', help='YYYY-MM-DD, inclusive')
+    search_parser.add_argument('--kind', nargs='+', choices=['commit', 'issue', 'readme'])
+    search_parser.add_argument('--limit', type=int, default=50)
+    search_parser.add_argument('--rank', action='store_true', help='best match first instead of the last indexed')
+    search_parser.add_argument('--output', help='write the results to this CSV instead of printing them')
+    args = parser.parse_args()
+
+    index = CrawlIndex(args.db)
+    try:
+        if args.command == 'update':
+            index.update(args.commits, args.issues, args.readmes)
+        else:
+            query = phrase_query(args.query) if args.phrase and args.query else args.query
+            start = time.perf_counter()
+            try:
+                results = index.search(query, args.repo, args.author, args.since, args.until, args.kind,
+                                       args.limit, args.rank)
+            except sqlite3.OperationalError as e:
+                # FTS5 reads gpt-4 as column gpt minus 4, quoting makes it a phrase
+                parser.exit(2, f"Invalid FTS5 query {query!r}: {e}. Quote keywords with punctuation "
+                               f"('\"gpt-4\"') or use --phrase.\n")
+            elapsed = (time.perf_counter() - start) * 1000
+            print_results(results, args.output)
+            print(f"{len(results)} results in {elapsed:.1f} ms")
+    finally:
+        index.close()
@@ -7,25 +7,21 @@ commits containing specific keywords ('copilot', 'chatgpt')
 import requests
 import csv
 import os
-import time
 from datetime import datetime
 
+from rate_limit import RateLimitScheduler, tokens_from_env
+from keyword_matcher import get_matcher
+
 GITHUB_TOKEN = '##'
 REPOS_FILE = 'repos.csv'
 RESULTS_FILE = 'github_commit_results.csv'
 ERROR_LOG_FILE = 'commit_error_log.csv'
 KEYWORDS = ['copilot', 'chatgpt']
 MAX_PAGES = 5                      # Maximum number of pages to check per repository
-COOLDOWN_PERIOD = 60    # 1 minute for 403 errors
 
-#Sets up authenticated GitHub API session
+#Sets up the rate-limit scheduler shared by every request (set GITHUB_TOKENS to spread over several tokens)
 def create_session():
-    session = requests.Session()
-    session.headers.update({
-        "Authorization": f"token {GITHUB_TOKEN}",
-        "Accept": "application/vnd.github.v3+json"
-    })
-    return session
+    return RateLimitScheduler(tokens_from_env(GITHUB_TOKEN))
 
 #Reads repository list from CSV file
 def read_repos_from_csv():
@@ -46,6 +42,7 @@ def search_commits(session, repo):
     params = {"per_page": 100}
     results = []
     total_requests = 0
+    matcher = get_matcher(tuple(KEYWORDS))
     
     for page in range(MAX_PAGES):
         try:
@@ -55,38 +52,27 @@ def search_commits(session, repo):
             
             commits = response.json()
             for commit in commits:
-                commit_message = commit['commit']['message'].lower()
-                for keyword in KEYWORDS:
-                    if keyword in commit_message:
-                        results.append([
-                            keyword,
-                            commit['commit']['message'],
-                            repo,
-                            commit['html_url'],
-                            commit['commit']['author']['date'],
-                            commit['commit']['author']['name']
-                        ])
-                        break
+                # the first of KEYWORDS the message mentions, one scan for all of them
+                keyword = matcher.first_keyword(commit['commit']['message'])
+                if keyword:
+                    results.append([
+                        keyword,
+                        commit['commit']['message'],
+                        repo,
+                        commit['html_url'],
+                        commit['commit']['author']['date'],
+                        commit['commit']['author']['name']
+                    ])
 
             if 'next' not in response.links:
                 break
             
             url = response.links['next']['url']
             
-            remaining = int(response.headers.get('X-RateLimit-Remaining', 0))
-            if remaining < 100:
-                reset_time = int(response.headers.get('X-RateLimit-Reset', 0))
-                sleep_time = max(reset_time - time.time(), 0) + 1
-                print(f"Rate limit low. Sleeping for {sleep_time:.2f} seconds.")
-                time.sleep(sleep_time)
-            
         except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 403:
-                print(f"403 Forbidden error for repo: {repo}. Cooling down...")
-                time.sleep(COOLDOWN_PERIOD)
-            else:
-                print(f"HTTP error {e.response.status_code} for repo: {repo}")
-                log_error(repo, f'HTTP error {e.response.status_code}', str(e))
+            # rate limits are waited out by the scheduler, what gets here is a real error
+            print(f"HTTP error {e.response.status_code} for repo: {repo}")
+            log_error(repo, f'HTTP error {e.response.status_code}', str(e))
             break
         except requests.exceptions.RequestException as e:
             print(f"Error for repo {repo}: {str(e)}")
@@ -7,9 +7,9 @@ issues and pull requests containing AI-related keywords ('copilot', 'chatgpt')
 import requests
 import csv
 import os
-import time
-import re
-from datetime import datetime
+
+from rate_limit import RateLimitScheduler, tokens_from_env
+from keyword_matcher import get_matcher
 
 GITHUB_TOKEN = '##'
 GITHUB_API_URL = "https://api.github.com/search/issues"
@@ -17,16 +17,12 @@ REPOS_FILE = 'repos.csv'
 RESULTS_FILE = 'github_search_results.csv'
 ERROR_LOG_FILE = 'error_log.csv'
 CONTEXT_CHARS = 100
-INITIAL_DELAY = 2  # seconds
-MAX_RETRIES = 3
+PHRASES = ['copilot', 'chatgpt']
 
+# the search API has its own quota (30 requests a minute), the scheduler paces against it
+# from the response headers and retries rate-limited requests (set GITHUB_TOKENS to spread over several tokens)
 def create_session():
-    session = requests.Session()
-    session.headers.update({
-        "Authorization": f"token {GITHUB_TOKEN}",
-        "Accept": "application/vnd.github.v3+json"
-    })
-    return session
+    return RateLimitScheduler(tokens_from_env(GITHUB_TOKEN))
 
 def read_repos_from_csv():
     if not os.path.exists(REPOS_FILE):
@@ -44,13 +40,22 @@ def read_repos_from_csv():
                     repositories.append(repo)
     return repositories
 
-def extract_context(text, phrase):
-    pattern = re.compile(f"(.{{0,{CONTEXT_CHARS}}}){re.escape(phrase)}(.{{0,{CONTEXT_CHARS}}})", re.IGNORECASE | re.DOTALL)
-    match = pattern.search(text)
-    if match:
-        before, after = match.groups()
-        return f"{before}{phrase}{after}"
-    return ""
+# (phrase, context) of every phrase the text mentions, in phrase order, from one scan of the text
+# the mention is the one the former per-phrase regex (.{0,100})phrase(.{0,100}) picked:
+# the last one starting within the first CONTEXT_CHARS characters, otherwise the first one
+def extract_contexts(text, phrases):
+    matcher = get_matcher(tuple(phrases))
+    chosen = {}
+    for phrase, start, end in matcher.finditer(text):
+        if phrase not in chosen or start <= CONTEXT_CHARS:
+            chosen[phrase] = (start, end)
+
+    contexts = []
+    for phrase in matcher.keywords:
+        if phrase in chosen:
+            start, end = chosen[phrase]
+            contexts.append((phrase, f"{text[max(0, start - CONTEXT_CHARS):start]}{phrase}{text[end:end + CONTEXT_CHARS]}"))
+    return contexts
 
 def search_repository(session, repo):
     query = f"copilot OR chatgpt repo:{repo}"
@@ -66,8 +71,6 @@ def search_repository(session, repo):
     seen_issues = set()
     page = 1
     total_requests = 0
-    retry_count = 0
-    delay = INITIAL_DELAY
     
     while True:
         try:
@@ -81,54 +84,28 @@ def search_repository(session, repo):
                     if issue['id'] not in seen_issues:
                         seen_issues.add(issue['id'])
                         body = issue['body'] or ""
-                        for phrase in ['copilot', 'chatgpt']:
-                            context = extract_context(body, phrase)
-                            if context:
-                                results.append([
-                                    phrase,
-                                    issue['title'],
-                                    issue['state'],
-                                    repo,
-                                    issue['html_url'],
-                                    context
-                                ])
-                if 'Link' not in response.headers:
+                        for phrase, context in extract_contexts(body, PHRASES):
+                            results.append([
+                                phrase,
+                                issue['title'],
+                                issue['state'],
+                                repo,
+                                issue['html_url'],
+                                context
+                            ])
+                # the last page still has a Link header (prev, first), only 'next' means more
+                if 'next' not in response.links:
                     break
                 page += 1
                 params['page'] = page
             
-            remaining = int(response.headers.get('X-RateLimit-Remaining', 0))
-            reset_time = int(response.headers.get('X-RateLimit-Reset', 0))
-            print(f"Rate limit: {remaining} remaining, resets at {datetime.fromtimestamp(reset_time)}")
-            
-            if remaining < 5:
-                sleep_time = max(reset_time - time.time(), 0) + 1
-                print(f"Rate limit low. Sleeping for {sleep_time:.2f} seconds.")
-                time.sleep(sleep_time)
-            else:
-                time.sleep(delay)
-            
-            retry_count = 0
-            delay = INITIAL_DELAY
-            
         except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 403:
-                retry_count += 1
-                if retry_count > MAX_RETRIES:
-                    print(f"Max retries reached for repo: {repo}. Skipping...")
-                    with open(ERROR_LOG_FILE, 'a', newline='', encoding='utf-8') as error_file:
-                        error_writer = csv.writer(error_file)
-                        error_writer.writerow([repo, '403 Forbidden (Max Retries)', str(e)])
-                    break
-                print(f"403 Forbidden error for repo: {repo}. Retrying in {delay} seconds...")
-                time.sleep(delay)
-                delay *= 2  # Exponential backoff
-            else:
-                print(f"HTTP error {e.response.status_code} for repo: {repo}")
-                with open(ERROR_LOG_FILE, 'a', newline='', encoding='utf-8') as error_file:
-                    error_writer = csv.writer(error_file)
-                    error_writer.writerow([repo, f'HTTP error {e.response.status_code}', str(e)])
-                break
+            # rate limits are waited out and retried by the scheduler, what gets here is a real error
+            print(f"HTTP error {e.response.status_code} for repo: {repo}")
+            with open(ERROR_LOG_FILE, 'a', newline='', encoding='utf-8') as error_file:
+                error_writer = csv.writer(error_file)
+                error_writer.writerow([repo, f'HTTP error {e.response.status_code}', str(e)])
+            break
         except requests.exceptions.RequestException as e:
             print(f"Error for query '{query}': {str(e)}")
             with open(ERROR_LOG_FILE, 'a', newline='', encoding='utf-8') as error_file:
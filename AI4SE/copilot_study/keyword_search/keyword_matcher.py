@@ -0,0 +1,255 @@
+'''
+Keyword matching shared by the README, commit and issue searches.
+
+All keywords are compiled into one case-insensitive regular expression, an alternation
+factored like a trie (chatgpt, copilot, copilot chat -> c(?:hatgpt|opilot(?: chat)?)),
+so a text is scanned once however many keywords there are, instead of once per keyword.
+The hits are the same as re.finditer(re.escape(keyword), text, re.IGNORECASE) for every
+keyword: keywords that overlap each other ('copilot' in 'github copilot') are all
+reported, hits of a single keyword don't overlap.
+
+    matcher = KeywordMatcher(['chatgpt', 'copilot'])
+    for keyword, start, end in matcher.finditer(text):
+        print(keyword, matcher.context(text, start, end, 30))
+
+Benchmark against the per-keyword finditer loop on a synthetic README corpus:
+    python keyword_matcher.py --keywords 2 50 200 500
+'''
+
+import argparse
+import random
+import re
+import time
+from functools import lru_cache
+
+
+# lowercase characters IGNORECASE matches to another lowercase character that lower() doesn't map
+# them to (i ~ \u0131, s ~ \u017f, \u03c3 ~ \u03c2, ...): characters sharing an upper() with different lower()
+FOLD_PARTNERS = ('is\xb5\u0131\u017f\u0345\u03b2\u03b5\u03b8\u03b9\u03ba\u03bc\u03c0\u03c1\u03c2\u03c3'
+                 '\u03c6\u03d0\u03d1\u03d5\u03d6\u03f0\u03f1\u03f5\u0432\u0434\u043e\u0441\u0442\u044a'
+                 '\u0463\u1c80\u1c81\u1c82\u1c83\u1c84\u1c85\u1c86\u1c87\u1c88\u1e61\u1e9b\u1fbe\ua64b')
+
+
+# one representative of every set of characters IGNORECASE treats as equal
+@lru_cache(maxsize=None)
+def _canonical(char):
+    lowered = char.lower()
+    candidates = [lowered] if len(lowered) == 1 else [char]
+    candidates += [other for other in FOLD_PARTNERS if re.fullmatch(re.escape(other), char, re.IGNORECASE)]
+    return min(candidates)
+
+
+# the canonical character with every lowercase character IGNORECASE matches it to, for the lowercased scan
+@lru_cache(maxsize=None)
+def _char_pattern(char):
+    partners = [other for other in FOLD_PARTNERS
+                if other != char and re.fullmatch(re.escape(char), other, re.IGNORECASE)]
+    if not partners:
+        return re.escape(char)
+    return '[' + ''.join(re.escape(other) for other in [char] + partners) + ']'
+
+
+def _canonical_text(text):
+    return ''.join(map(_canonical, text))
+
+
+# the only character whose lower() is longer than itself (\u0130 -> i + combining dot), IGNORECASE matches it to i
+_PRE_FOLD = {0x130: 'i'}
+
+
+@lru_cache(maxsize=1)
+def _post_fold():
+    return {ord(char): _canonical(char) for char in FOLD_PARTNERS if _canonical(char) != char}
+
+
+# text with every character replaced by the representative the matcher compares it as
+def fold_case(text):
+    return text.translate(_PRE_FOLD).lower().translate(_post_fold())
+
+
+# non-ASCII characters IGNORECASE matches to ASCII letters
+NON_ASCII_FOLDS = {'i': '\u0130\u0131', 'k': '\u212a', 's': '\u017f'}
+
+
+# an ASCII character of a bytes pattern, written as latin-1 text: both cases and the UTF-8
+# bytes of the non-ASCII characters it also matches
+def _bytes_char_pattern(char):
+    options = sorted({char, char.upper()})
+    pattern = '[' + ''.join(map(re.escape, options)) + ']' if len(options) > 1 else re.escape(char)
+    extra = [re.escape(other.encode('utf-8').decode('latin-1')) for other in NON_ASCII_FOLDS.get(char, '')]
+    return '(?:' + '|'.join([pattern] + extra) + ')' if extra else pattern
+
+
+# regex for a trie of canonical words, longest match first at every position
+def _trie_pattern(node, char_pattern=_char_pattern):
+    branches = [char_pattern(char) + _trie_pattern(child, char_pattern)
+                for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    # a word ends here: the rest is optional, greedy so longer keywords win
+    return f'(?:{pattern})?' if '' in node else pattern
+
+
+class KeywordMatcher:
+    """Every keyword hit of a text in one scan."""
+
+    def __init__(self, keywords):
+        self.keywords = [keyword for keyword in keywords if keyword]
+        canonical = [_canonical_text(keyword) for keyword in self.keywords]
+
+        trie = {}
+        for word in canonical:
+            node = trie
+            for char in word:
+                node = node.setdefault(char, {})
+            node[''] = {}
+        pattern = _trie_pattern(trie)
+        # the text is lowercased and scanned case-sensitively, which is several times faster;
+        # the rare text whose length lower() changes is scanned with IGNORECASE instead
+        self.regex = re.compile(pattern, re.DOTALL)
+        self.regex_ignore_case = re.compile(pattern, re.IGNORECASE | re.DOTALL)
+        # bytes pattern that finds every hit in the undecoded UTF-8 text, so files without a hit
+        # needn't be decoded; only for ASCII keywords without line breaks, None otherwise
+        self.bytes_regex = None
+        if all(word.isascii() and '\r' not in word and '\n' not in word for word in canonical):
+            self.bytes_regex = re.compile(_trie_pattern(trie, _bytes_char_pattern).encode('latin-1'))
+
+        # the longest keyword matched at a position -> index of every keyword that matches there
+        self.matched_at = {word: [i for i, prefix in enumerate(canonical) if word.startswith(prefix)]
+                           for word in set(canonical)}
+
+    # (keyword index, start, end) of every hit in text order
+    def _hits(self, text):
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            text, search = lowered, self.regex.search
+        else:
+            search = self.regex_ignore_case.search
+        last_end = {}
+        pos = 0
+        while True:
+            match = search(text, pos)
+            if match is None:
+                return
+            start = match.start()
+            for i in self.matched_at.get(_canonical_text(match.group()), ()):
+                # like re.finditer, hits of one keyword don't overlap
+                if start >= last_end.get(i, 0):
+                    end = start + len(self.keywords[i])
+                    last_end[i] = end
+                    yield i, start, end
+            # the next scan starts one character on, so overlapping keywords are found too
+            pos = start + 1
+
+    # (keyword, start, end) of every hit in text order
+    def finditer(self, text):
+        for i, start, end in self._hits(text):
+            yield self.keywords[i], start, end
+
+    # hits ordered by keyword and then position, the order of one finditer per keyword
+    def findall_by_keyword(self, text):
+        return [(self.keywords[i], start, end) for i, start, end in sorted(self._hits(text))]
+
+    # keywords found in text, in keyword order
+    def keywords_in(self, text):
+        return [self.keywords[i] for i in sorted({i for i, _, _ in self._hits(text)})]
+
+    # the first keyword of the list found in text, or None
+    def first_keyword(self, text):
+        found = self.keywords_in(text)
+        return found[0] if found else None
+
+    @staticmethod
+    def context(text, start, end, before, after=None):
+        after = before if after is None else after
+        return text[max(0, start - before):end + after]
+
+
+# one matcher per keyword list, built on first use
+@lru_cache(maxsize=32)
+def get_matcher(keywords):
+    return KeywordMatcher(list(keywords))
+
+
+# the per-keyword loop the matcher replaces, as the benchmark baseline
+def finditer_per_keyword(text, keywords):
+    hits = []
+    for keyword in keywords:
+        for match in re.finditer(re.escape(keyword), text, re.IGNORECASE):
+            hits.append((keyword, match.start(), match.end()))
+    return hits
+
+
+# num_keywords phrases like the model and tool names the searches look for
+def synthetic_keywords(num_keywords, seed=0):
+    rng = random.Random(seed)
+    base = ['chatgpt', 'copilot', 'github copilot', 'gpt-4', 'gpt-3.5', 'claude', 'gemini', 'llama',
+            'codex', 'tabnine', 'codewhisperer', 'cursor ai', 'bard', 'mistral', 'starcoder']
+    keywords = base[:num_keywords]
+    while len(keywords) < num_keywords:
+        word = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(4, 9)))
+        keywords.append(rng.choice([word, f"{word}-{rng.randint(1, 9)}", f"{word} assistant", f"{word}gpt"]))
+    return list(dict.fromkeys(keywords))
+
+
+# characters IGNORECASE matches to a letter that lower() doesn't give (long s, dotless i, Kelvin sign, ...)
+CASE_VARIANTS = {'s': '\u017f', 'i': '\u0131\u0130', 'k': '\u212a', '\u03c3': '\u03c2\u03a3'}
+
+
+# keyword as a README might spell it: random case per character, now and then a non-ASCII case variant
+def spell_like(keyword, rng):
+    chars = []
+    for char in keyword:
+        if char in CASE_VARIANTS and rng.random() < 0.2:
+            chars.append(rng.choice(CASE_VARIANTS[char]))
+        else:
+            chars.append(char.upper() if rng.random() < 0.3 else char)
+    return ''.join(chars)
+
+
+# README-like markdown texts with a keyword in about a third of them
+def synthetic_readmes(num_readmes, keywords, mean_words=600, seed=0):
+    rng = random.Random(seed)
+    vocabulary = ['the', 'install', 'run', 'build', 'config', 'usage', 'api', 'python', 'npm', 'docker',
+                  'license', 'MIT', 'example', 'test', 'server', 'client', 'data', 'model', 'support',
+                  '##', '```', '-', 'README', 'GitHub', 'code', 'pilot', 'chat', 'generate', 'fast']
+    readmes = []
+    for _ in range(num_readmes):
+        words = [rng.choice(vocabulary) for _ in range(rng.randint(mean_words // 2, mean_words * 3 // 2))]
+        if rng.random() < 0.3:
+            for _ in range(rng.randint(1, 3)):
+                keyword = rng.choice(keywords)
+                words.insert(rng.randrange(len(words)), spell_like(keyword, rng))
+        readmes.append(' '.join(words) + '\n')
+    return readmes
+
+
+def bench(keyword_counts=(2, 50, 200, 500), num_readmes=2000):
+    print(f"{'keywords':>8} {'MB':>6} {'per keyword s':>14} {'matcher s':>10} {'speedup':>8} {'hits':>7} {'same':>5}")
+    for num_keywords in keyword_counts:
+        # a case-equivalent duplicate must be reported too, as the per-keyword loop does
+        keywords = synthetic_keywords(num_keywords) + ['Copilot']
+        readmes = synthetic_readmes(num_readmes, keywords)
+        size = sum(len(readme) for readme in readmes) / 2 ** 20
+
+        start = time.perf_counter()
+        expected = [finditer_per_keyword(readme, keywords) for readme in readmes]
+        looped = time.perf_counter() - start
+
+        start = time.perf_counter()
+        matcher = KeywordMatcher(keywords)
+        actual = [matcher.findall_by_keyword(readme) for readme in readmes]
+        matched = time.perf_counter() - start
+
+        print(f"{num_keywords:>8} {size:>6.1f} {looped:>14.3f} {matched:>10.3f} {looped / matched:>7.1f}x "
+              f"{sum(map(len, actual)):>7} {str(actual == expected):>5}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the keyword matcher on synthetic READMEs')
+    parser.add_argument('--keywords', type=int, nargs='+', default=[2, 50, 200, 500])
+    parser.add_argument('--readmes', type=int, default=2000)
+    args = parser.parse_args()
+
+    bench(args.keywords, args.readmes)
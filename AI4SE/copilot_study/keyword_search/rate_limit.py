@@ -0,0 +1,225 @@
+'''
+Shared GitHub API rate-limit scheduler for the keyword_search crawlers.
+
+Every response carries the quota of the token it was sent with (X-RateLimit-Remaining,
+X-RateLimit-Reset). The scheduler keeps one token bucket per token and API resource
+(core, search, graphql). Requests go out freely during the first half of a window's
+quota, the second half is refilled at the rate the remaining quota allows until the
+reset, so requests from any number of threads are spread over the window instead of
+bursting into 403s. A request goes out on whichever token can send it first.
+
+Rate-limit responses (403/429) wait for Retry-After or the reset of that token. A secondary
+rate limit without either (its message says so) waits a minute, doubling with every retry,
+as GitHub asks. 5xx and connection errors are retried with jittered exponential backoff. The crawlers only see
+the final response.
+
+    scheduler = RateLimitScheduler(tokens_from_env(GITHUB_TOKEN))
+    response = scheduler.get("https://api.github.com/repos/owner/repo/commits", params={...})
+
+The asyncio collectors of ../gh_async_client.py pace their requests with the same TokenBucket.
+'''
+
+import os
+import random
+import threading
+import time
+
+import requests
+
+# requests kept in reserve per token and resource, so other tools sharing a token still get through
+MIN_REMAINING = 5
+# requests a bucket may send back to back once pacing kicks in
+BURST = 10
+# share of the window's quota below which requests are paced
+PACE_BELOW = 0.5
+# first wait after a secondary rate limit that names no Retry-After, GitHub asks for at least a minute
+SECONDARY_LIMIT_WAIT = 60.0
+
+
+# comma separated tokens from GITHUB_TOKENS, or the single default token
+def tokens_from_env(default=None):
+    tokens = [token.strip() for token in os.environ.get('GITHUB_TOKENS', '').split(',') if token.strip()]
+    if not tokens and default:
+        tokens = [default]
+    return tokens
+
+
+# API resource a url is counted against
+def resource_of(url):
+    if '/search/' in url:
+        return 'search'
+    if url.rstrip('/').endswith('/graphql'):
+        return 'graphql'
+    return 'core'
+
+
+class TokenBucket:
+    """Quota of one token for one resource, as a token bucket refilled from the response headers.
+
+    While more than PACE_BELOW of the window's quota is left requests go out freely; below
+    that they are spread evenly over the rest of the window.
+    """
+
+    def __init__(self, burst=BURST, min_remaining=MIN_REMAINING):
+        self.burst = burst
+        self.min_remaining = min_remaining
+        self.tokens = float(burst)
+        # unknown until the first response, until then only the burst is sent
+        self.remaining = None
+        self.limit = None
+        self.rate = 0.0
+        self.reset = 0.0
+        self.blocked_until = 0.0
+        self.updated = time.time()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # seconds until this bucket can send a request, 0 when it can send now
+    def delay(self, now):
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.remaining is not None and now >= self.reset:
+            # a new window: the quota is back, the next response tells how much
+            self.remaining, self.rate, self.tokens = None, 0.0, float(self.burst)
+        if self.remaining is None:
+            # wait for the first response before sending more than the burst
+            return 0.0 if self.tokens >= 1 else 0.5
+        if self.remaining <= self.min_remaining:
+            return self.reset - now
+        if self.remaining > self.limit * PACE_BELOW:
+            # the bucket stays full, pacing starts with a whole burst
+            self.tokens, self.updated = float(self.burst), now
+            return 0.0
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        if not self.rate:
+            return self.reset - now
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens = max(self.tokens - 1, -self.burst)
+        if self.remaining is not None:
+            self.remaining -= 1
+
+    def update(self, headers, now):
+        if 'X-RateLimit-Remaining' not in headers or 'X-RateLimit-Reset' not in headers:
+            return
+        self._refill(now)
+        remaining = int(headers['X-RateLimit-Remaining'])
+        reset = float(headers['X-RateLimit-Reset'])
+        if self.remaining is not None and reset == self.reset:
+            # responses of the same window come back out of order, and requests still in
+            # flight were already taken off, the lower count is the right one
+            remaining = min(remaining, self.remaining)
+        self.remaining, self.reset = remaining, reset
+        self.limit = int(headers.get('X-RateLimit-Limit', max(self.limit or 0, self.remaining)))
+        # spread what is left of the quota evenly over the rest of the window
+        self.rate = max(self.remaining - self.min_remaining, 0) / max(self.reset - now, 1.0)
+
+    # no request until until, after a rate-limit response
+    def block(self, until):
+        self.blocked_until = max(self.blocked_until, until)
+        self.tokens = min(self.tokens, 0.0)
+
+    # after a 403/429 response: block until a retry may go out and return True, or return False
+    # when it isn't about a rate limit (no access, blocked repository) and is the caller's to handle
+    def rate_limited(self, headers, text, attempt, now):
+        retry_after = headers.get('Retry-After')
+        if retry_after is not None:
+            # secondary rate limit
+            self.block(now + float(retry_after))
+        elif headers.get('X-RateLimit-Remaining') == '0':
+            self.block(self.reset + 1)
+        elif 'rate limit' in text.lower():
+            # secondary rate limit with quota left and no Retry-After
+            self.block(now + SECONDARY_LIMIT_WAIT * 2 ** attempt)
+        else:
+            return False
+        return True
+
+
+class RateLimitScheduler:
+    """Thread-safe request scheduler over one or more GitHub tokens."""
+
+    def __init__(self, tokens, accept="application/vnd.github.v3+json", max_retries=5,
+                 base_delay=1.0, max_delay=60.0, burst=BURST, min_remaining=MIN_REMAINING):
+        # an anonymous client still gets the unauthenticated quota
+        self.tokens = list(tokens) or [None]
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.burst = burst
+        self.min_remaining = min_remaining
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.session = requests.Session()
+        self.session.headers.update({"Accept": accept})
+
+    def _bucket(self, token, resource):
+        key = (token, resource)
+        if key not in self.buckets:
+            self.buckets[key] = TokenBucket(self.burst, self.min_remaining)
+        return self.buckets[key]
+
+    # block until one of the tokens may send a request to resource, returns that token
+    def acquire(self, resource='core'):
+        while True:
+            with self.lock:
+                now = time.time()
+                delay, token = None, None
+                for candidate in self.tokens:
+                    candidate_delay = self._bucket(candidate, resource).delay(now)
+                    if delay is None or candidate_delay < delay:
+                        delay, token = candidate_delay, candidate
+                if delay <= 0:
+                    self._bucket(token, resource).take()
+                    self.requests += 1
+                    return token
+            time.sleep(min(delay, self.max_delay))
+
+    def _backoff(self, attempt):
+        # full jitter, so workers that failed together don't retry together
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def request(self, method, url, headers=None, **kwargs):
+        resource = resource_of(url)
+        response = None
+        for attempt in range(self.max_retries + 1):
+            token = self.acquire(resource)
+            request_headers = dict(headers or {})
+            if token:
+                request_headers["Authorization"] = f"token {token}"
+            try:
+                response = self.session.request(method, url, headers=request_headers, **kwargs)
+            except requests.exceptions.RequestException:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+
+            now = time.time()
+            with self.lock:
+                bucket = self._bucket(token, resource)
+                bucket.update(response.headers, now)
+                if response.status_code in (403, 429):
+                    if not bucket.rate_limited(response.headers, response.text, attempt, now):
+                        return response
+                    continue
+            if response.status_code >= 500 and attempt < self.max_retries:
+                time.sleep(self._backoff(attempt))
+                continue
+            return response
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    # remaining quota per token and resource, as of the last responses
+    def status(self):
+        with self.lock:
+            return {(token[-4:] if token else None, resource): bucket.remaining
+                    for (token, resource), bucket in self.buckets.items()}
@@ -0,0 +1,165 @@
+'''
+Inverted index over the downloaded READMEs, so a search with new keywords only reads the
+READMEs that can contain them instead of the whole readmes folder.
+
+Every README is folded the way the keyword matcher compares text and split into words;
+the index maps each word to the READMEs it occurs in. A keyword can only occur in a
+README that has, for every word of the keyword, a word containing it (keywords are
+matched as substrings, 'copilot' also hits 'copilotx'), so the candidates are the
+intersection of those postings. The candidates are then scanned as usual, the index
+never decides a hit on its own.
+
+Substring lookups go through a trigram index of the indexed words, built and saved with the
+index: a keyword word of three or more characters only checks the words that share all of
+its trigrams. Shorter keyword words still scan every indexed word, once per keyword word.
+
+READMEs added or changed after the index was built are always scanned.
+
+    python search_llm_phrases.py --build-index
+    python search_llm_phrases.py --index --keywords claude gemini "github copilot"
+'''
+
+import os
+import pickle
+import re
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from keyword_matcher import fold_case
+
+INDEX_FILE = 'readme_index.pkl'
+INDEX_VERSION = 2
+WORD = re.compile(r'\w+')
+GRAM = 3
+
+
+def read_text(file_path):
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+
+def file_stat(file_path):
+    stat = os.stat(file_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+# folded words of every file, runs on the pool
+def index_chunk(readmes_dir, file_names):
+    return [(name, file_stat(os.path.join(readmes_dir, name)),
+             set(WORD.findall(fold_case(read_text(os.path.join(readmes_dir, name))))))
+            for name in file_names]
+
+
+class ReadmeIndex:
+    """Word -> README postings, with the stat of every README at indexing time."""
+
+    def __init__(self, readmes_dir):
+        self.readmes_dir = readmes_dir
+        self.files = []
+        self.stats = {}
+        # word -> ids of the files it occurs in, ascending
+        self.postings = {}
+        # the words of postings and trigram -> ids of the words containing it, see _word_grams
+        self._words = None
+        self._grams = None
+
+    @classmethod
+    def build(cls, readmes_dir, file_names, workers=1, chunk_size=256):
+        index = cls(readmes_dir)
+        chunks = [file_names[i:i + chunk_size] for i in range(0, len(file_names), chunk_size)]
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(index_chunk, [readmes_dir] * len(chunks), chunks)
+                index._add(results)
+        else:
+            index._add(index_chunk(readmes_dir, chunk) for chunk in chunks)
+        index._word_grams()
+        return index
+
+    def _add(self, chunk_results):
+        self._words = self._grams = None
+        for results in chunk_results:
+            for name, stat, words in results:
+                file_id = len(self.files)
+                self.files.append(name)
+                self.stats[name] = stat
+                for word in words:
+                    if word not in self.postings:
+                        self.postings[word] = array('I')
+                    self.postings[word].append(file_id)
+
+    def save(self, path=INDEX_FILE):
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump((INDEX_VERSION, self.readmes_dir, self.files, self.stats, self.postings,
+                         self._words, self._grams), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path=INDEX_FILE):
+        with open(path, 'rb') as f:
+            version, readmes_dir, *data = pickle.load(f)
+        if version != INDEX_VERSION:
+            raise ValueError(f"{path} was built by another version, rebuild it with --build-index")
+        index = cls(readmes_dir)
+        index.files, index.stats, index.postings, index._words, index._grams = data
+        return index
+
+    # trigram index of the indexed words, built with the index (or on the first lookup of one
+    # that was just added to)
+    def _word_grams(self):
+        if self._grams is None:
+            self._words = list(self.postings)
+            grams = {}
+            for word_id, word in enumerate(self._words):
+                for gram in {word[i:i + GRAM] for i in range(len(word) - GRAM + 1)}:
+                    grams.setdefault(gram, array('I')).append(word_id)
+            self._grams = grams
+        return self._grams
+
+    # indexed words containing keyword_word
+    def _matching_words(self, keyword_word):
+        grams = self._word_grams()
+        if len(keyword_word) < GRAM:
+            return [word for word in self._words if keyword_word in word]
+        # a word containing keyword_word contains all of its trigrams, rarest first
+        keyword_grams = {keyword_word[i:i + GRAM] for i in range(len(keyword_word) - GRAM + 1)}
+        word_ids = None
+        for gram in sorted(keyword_grams, key=lambda gram: len(grams.get(gram, ()))):
+            word_ids = set(grams.get(gram, ())) if word_ids is None else word_ids.intersection(grams.get(gram, ()))
+            if not word_ids:
+                return []
+        # the trigrams can occur in another order, check the whole keyword word
+        return [self._words[word_id] for word_id in word_ids if keyword_word in self._words[word_id]]
+
+    # ids of the files that have, for every word of keyword, a word containing it
+    def _keyword_candidates(self, keyword):
+        words = WORD.findall(fold_case(keyword))
+        if not words:
+            return None
+        candidates = None
+        for keyword_word in words:
+            found = set()
+            for word in self._matching_words(keyword_word):
+                found.update(self.postings[word])
+            candidates = found if candidates is None else candidates & found
+            if not candidates:
+                break
+        return candidates
+
+    # the names among file_names that may contain one of keywords
+    def candidates(self, keywords, file_names):
+        ids = set()
+        for keyword in keywords:
+            keyword_ids = self._keyword_candidates(keyword)
+            if keyword_ids is None:
+                # a keyword without word characters can't be looked up
+                return list(file_names)
+            ids |= keyword_ids
+        indexed = {self.files[file_id] for file_id in ids}
+
+        selected = []
+        for name in file_names:
+            # new or changed since the index was built: scan it anyway
+            if name in indexed or self.stats.get(name) != file_stat(os.path.join(self.readmes_dir, name)):
+                selected.append(name)
+        return selected
@@ -1,31 +1,47 @@
 '''
 Author Mostafa Ahmed
 
-This code snippet is from the script that searches for 
-specific keywords in the README files of GitHub repositories. 
-The script reads the content of the README files and searches 
-for specific keywords. If the keywords are found, the script 
-writes the repository name, matching keywords, keyword snippets, 
+This code snippet is from the script that searches for
+specific keywords in the README files of GitHub repositories.
+The script reads the content of the README files and searches
+for specific keywords. If the keywords are found, the script
+writes the repository name, matching keywords, keyword snippets,
 and the repository URL to a CSV file.
+
+The READMEs are split into chunks that worker processes scan (--workers); results come
+back in file order to the one CSV writer. READMEs of MMAP_THRESHOLD bytes and more are
+memory-mapped and searched undecoded first, only those with a hit are decoded.
+With --build-index a word index of the READMEs is saved once (readme_index.py), and
+--index makes later searches, e.g. with new --keywords, scan only the READMEs the index
+says can contain them.
+
+    python search_llm_phrases.py --workers 8
+    python search_llm_phrases.py --build-index --workers 8
+    python search_llm_phrases.py --index --keywords claude gemini "github copilot"
 '''
 import os
 import csv
-import re
+import mmap
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from keyword_matcher import get_matcher
+from readme_index import INDEX_FILE, ReadmeIndex
 
 readmes_dir = 'readmes'
 keywords = ['chatgpt', 'copilot']
+MMAP_THRESHOLD = 1 << 20
+CHUNK_SIZE = 256
 
+# one scan over the README for all keywords, hits in keyword order like one search per keyword
 def search_keywords_in_readme(readme_content, keywords):
+    matcher = get_matcher(tuple(keywords))
     found_keywords = []
     snippets = []
-    for keyword in keywords:
-        matches = re.finditer(re.escape(keyword), readme_content, re.IGNORECASE)
-        for match in matches:
-            found_keywords.append(keyword)
-            start = max(0, match.start() - 30)
-            end = min(len(readme_content), match.end() + 30)
-            snippet = readme_content[start:end].replace('\n', ' ').strip()
-            snippets.append(f"...{snippet}...")
+    for keyword, start, end in matcher.findall_by_keyword(readme_content):
+        found_keywords.append(keyword)
+        snippet = matcher.context(readme_content, start, end, 30).replace('\n', ' ').strip()
+        snippets.append(f"...{snippet}...")
     return found_keywords, snippets
 
 def get_repo_name(filename):
@@ -34,25 +50,86 @@ def get_repo_name(filename):
         return f"{parts[0]}/{parts[1]}"
     return filename
 
-def search_in_readmes():
-    with open('search_results.csv', 'w', newline='', encoding='utf-8') as csvfile:
+# README files only, the downloader also keeps its state file in the folder
+def list_readmes(readmes_dir):
+    return sorted(name for name in os.listdir(readmes_dir) if name.endswith('_README.md'))
+
+# README text, or None when a memory-mapped README has no hit of the matcher's keywords
+# undecodable bytes are replaced, the downloader saves READMEs as they come
+def read_readme(file_path, matcher, mmap_threshold=MMAP_THRESHOLD):
+    size = os.path.getsize(file_path)
+    if size < mmap_threshold or matcher.bytes_regex is None:
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read()
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        if matcher.bytes_regex.search(mapped) is None:
+            return None
+        # universal newlines, like reading in text mode
+        return mapped[:].decode('utf-8', errors='replace').replace('\r\n', '\n').replace('\r', '\n')
+
+# result rows of a chunk of READMEs in file order, runs on the pool
+def scan_chunk(readmes_dir, file_names, keywords, mmap_threshold=MMAP_THRESHOLD):
+    matcher = get_matcher(tuple(keywords))
+    rows = []
+    for readme_file in file_names:
+        readme_content = read_readme(os.path.join(readmes_dir, readme_file), matcher, mmap_threshold)
+        if readme_content is None:
+            continue
+        matching_keywords, snippets = search_keywords_in_readme(readme_content, keywords)
+        if matching_keywords:
+            owner_repo = get_repo_name(readme_file)
+            rows.append([
+                owner_repo,
+                ', '.join(matching_keywords),
+                '\n'.join(snippets),
+                f"https://github.com/{owner_repo}"
+            ])
+    return rows
+
+def build_index(readmes_dir=readmes_dir, index_file=INDEX_FILE, workers=1):
+    file_names = list_readmes(readmes_dir)
+    index = ReadmeIndex.build(readmes_dir, file_names, workers)
+    index.save(index_file)
+    print(f"Indexed {len(file_names)} READMEs, {len(index.postings)} words, saved to '{index_file}'.")
+
+def search_in_readmes(readmes_dir=readmes_dir, keywords=keywords, output_file='search_results.csv',
+                      workers=1, index_file=None, mmap_threshold=MMAP_THRESHOLD):
+    file_names = list_readmes(readmes_dir)
+    if index_file:
+        total = len(file_names)
+        file_names = ReadmeIndex.load(index_file).candidates(keywords, file_names)
+        print(f"Index: scanning {len(file_names)} of {total} READMEs")
+    chunks = [file_names[i:i + CHUNK_SIZE] for i in range(0, len(file_names), CHUNK_SIZE)]
+
+    with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
         writer = csv.writer(csvfile, quoting=csv.QUOTE_ALL)
         writer.writerow(['Repository', 'Matching Keywords', 'Keyword Snippets', 'URL'])
-        
-        for readme_file in os.listdir(readmes_dir):
-            owner_repo = get_repo_name(readme_file)
-            file_path = os.path.join(readmes_dir, readme_file)
-            with open(file_path, 'r', encoding='utf-8') as f:
-                readme_content = f.read()
-            matching_keywords, snippets = search_keywords_in_readme(readme_content, keywords)
-            if matching_keywords:
-                repo_url = f"https://github.com/{owner_repo}"
-                writer.writerow([
-                    owner_repo,
-                    ', '.join(matching_keywords),
-                    '\n'.join(snippets),
-                    repo_url
-                ])
+
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # map hands the chunks back in order, whichever worker finishes first
+                for rows in executor.map(scan_chunk, [readmes_dir] * len(chunks), chunks,
+                                         [keywords] * len(chunks), [mmap_threshold] * len(chunks)):
+                    writer.writerows(rows)
+        else:
+            for chunk in chunks:
+                writer.writerows(scan_chunk(readmes_dir, chunk, keywords, mmap_threshold))
 
 if __name__ == "__main__":
-    search_in_readmes()
+    parser = argparse.ArgumentParser(description='Search the downloaded READMEs for keywords')
+    parser.add_argument('--readmes', default=readmes_dir)
+    parser.add_argument('--keywords', nargs='+', default=keywords)
+    parser.add_argument('--output', default='search_results.csv')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--mmap-threshold', type=int, default=MMAP_THRESHOLD,
+                        help='READMEs of this many bytes and more are memory-mapped')
+    parser.add_argument('--build-index', action='store_true', help=f"build {INDEX_FILE} and exit")
+    parser.add_argument('--index', action='store_true', help=f"scan only the READMEs {INDEX_FILE} selects")
+    parser.add_argument('--index-file', default=INDEX_FILE)
+    args = parser.parse_args()
+
+    if args.build_index:
+        build_index(args.readmes, args.index_file, args.workers)
+    else:
+        search_in_readmes(args.readmes, args.keywords, args.output, args.workers,
+                          args.index_file if args.index else None, args.mmap_threshold)
@@ -0,0 +1,212 @@
+'''
+Author: Leyli (Aya) Garryyeva
+
+Blank / code / comment line counts of the files a commit touches, read straight from git.
+
+  - The blobs a commit adds or modifies come from `git diff-tree`, no patches are built.
+  - Blob contents are read through one long-running `git cat-file --batch` process, and
+    only for blobs that aren't cached yet. Results are cached by blob SHA, since the same
+    blob shows up again in later commits (reverts, renames, branches merged back).
+  - Lines are classified in one pass over the raw bytes with the comment syntax of the
+    file's language (// and /* */ for Java, C#, Go, TypeScript, ..., # for Python, Ruby, ...).
+  - In diff mode only the lines a commit adds are counted, from a zero-context patch.
+
+Merge commits count nothing, like pydriller's modified_files.
+'''
+
+import os
+import subprocess
+
+# (line comment prefixes, (block start, block end) pairs) per comment style
+C_STYLE = ((b'//',), ((b'/*', b'*/'),))
+HASH_STYLE = ((b'#',), ())
+RUBY_STYLE = ((b'#',), ((b'=begin', b'=end'),))
+SQL_STYLE = ((b'--',), ((b'/*', b'*/'),))
+MARKUP_STYLE = ((), ((b'<!--', b'-->'),))
+NO_COMMENTS = ((), ())
+
+COMMENT_SYNTAX = {}
+for extensions, syntax in [
+    (('.java', '.kt', '.kts', '.scala', '.groovy', '.gradle', '.cs', '.go', '.js', '.jsx', '.mjs', '.cjs',
+      '.ts', '.tsx', '.c', '.h', '.cc', '.cpp', '.cxx', '.hpp', '.hh', '.m', '.mm', '.swift', '.rs',
+      '.dart', '.php', '.css', '.scss', '.less', '.proto'), C_STYLE),
+    (('.py', '.pyi', '.sh', '.bash', '.zsh', '.ps1', '.r', '.pl', '.pm', '.yml', '.yaml', '.toml', '.cfg',
+      '.ini', '.conf', '.mk', '.cmake', '.tf', '.dockerfile'), HASH_STYLE),
+    (('.rb', '.rake', '.gemspec'), RUBY_STYLE),
+    (('.sql', '.lua', '.hs'), SQL_STYLE),
+    (('.html', '.htm', '.xml', '.xaml', '.csproj', '.vue', '.svg'), MARKUP_STYLE),
+]:
+    for extension in extensions:
+        COMMENT_SYNTAX[extension] = syntax
+
+# extension-less files known by name
+FILENAME_SYNTAX = {'makefile': HASH_STYLE, 'dockerfile': HASH_STYLE, 'gemfile': RUBY_STYLE,
+                   'rakefile': RUBY_STYLE, 'cmakelists.txt': HASH_STYLE}
+
+
+def comment_syntax(path):
+    name = os.path.basename(path).lower()
+    if name in FILENAME_SYNTAX:
+        return FILENAME_SYNTAX[name]
+    return COMMENT_SYNTAX.get(os.path.splitext(name)[1], NO_COMMENTS)
+
+
+# (blank, code, comment) of an iterable of byte lines in one pass
+# a line is a comment when it only holds comment text; code followed by a comment is code
+def classify_lines(lines, syntax):
+    line_prefixes, blocks = syntax
+    blank = code = comment = 0
+    block_end = None
+    for line in lines:
+        line = line.strip()
+        if not line:
+            blank += 1
+            continue
+
+        if block_end is not None:
+            # inside a block comment: the line is code only if code follows the block end
+            end = line.find(block_end)
+            if end < 0:
+                comment += 1
+                continue
+            line = line[end + len(block_end):].strip()
+            block_end = None
+            if not line:
+                comment += 1
+                continue
+
+        if line.startswith(line_prefixes):
+            comment += 1
+            continue
+
+        is_comment = False
+        for start, end in blocks:
+            if line.startswith(start):
+                is_comment = True
+                close = line.find(end, len(start))
+                if close < 0:
+                    block_end = end
+                elif line[close + len(end):].strip():
+                    # /* ... */ code
+                    is_comment = False
+                break
+            # code /* block that runs on
+            opened = line.rfind(start)
+            if opened > 0 and line.find(end, opened + len(start)) < 0:
+                block_end = end
+                break
+
+        if is_comment:
+            comment += 1
+        else:
+            code += 1
+    return blank, code, comment
+
+
+# a NUL byte in the first 8000 bytes marks a binary blob, the same rule git uses
+def is_binary(data):
+    return b'\0' in data[:8000]
+
+
+class LineCounter:
+    """Per-commit line counts of one repository with a blob SHA cache.
+
+    diff_only counts the lines each commit adds instead of the full files it touches.
+    """
+
+    def __init__(self, repo_path, diff_only=False):
+        self.repo_path = repo_path
+        self.diff_only = diff_only
+        self.cache = {}
+        self.blobs_read = 0
+        self._cat_file = None
+
+    def _git(self, *args):
+        return subprocess.run(['git', '-C', self.repo_path, *args], check=True,
+                              capture_output=True).stdout
+
+    def read_blob(self, sha):
+        if self._cat_file is None:
+            self._cat_file = subprocess.Popen(['git', '-C', self.repo_path, 'cat-file', '--batch'],
+                                              stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self._cat_file.stdin.write(sha.encode('ascii') + b'\n')
+        self._cat_file.stdin.flush()
+        header = self._cat_file.stdout.readline().split()
+        if len(header) < 3 or header[1] != b'blob':
+            return None
+        data = self._cat_file.stdout.read(int(header[2]) + 1)[:-1]
+        self.blobs_read += 1
+        return data
+
+    def blob_stats(self, sha, path):
+        syntax = comment_syntax(path)
+        key = (sha, syntax)
+        if key not in self.cache:
+            data = self.read_blob(sha)
+            if data is None or is_binary(data):
+                self.cache[key] = (0, 0, 0)
+            else:
+                self.cache[key] = classify_lines(data.splitlines(), syntax)
+        return self.cache[key]
+
+    def _diff_tree_args(self, commit_sha, parents):
+        if parents:
+            return [parents[0], commit_sha]
+        return ['--root', commit_sha]
+
+    # (blank, code, comment) summed over every file the commit adds or modifies
+    def commit_stats(self, commit_sha, parents):
+        if len(parents) > 1:
+            return 0, 0, 0
+        if self.diff_only:
+            return self.diff_stats(commit_sha, parents)
+
+        output = self._git('diff-tree', '-r', '-z', '--no-commit-id', '--no-renames',
+                           *self._diff_tree_args(commit_sha, parents))
+        fields = output.split(b'\0')
+        blank = code = comment = 0
+        # -z output: ":old_mode new_mode old_sha new_sha status" NUL path NUL
+        for meta, path in zip(fields[0::2], fields[1::2]):
+            _, new_mode, _, new_sha, status = meta.split()
+            # skip deletions and submodules
+            if status == b'D' or new_mode == b'160000':
+                continue
+            b, c, m = self.blob_stats(new_sha.decode('ascii'), path.decode('utf-8', 'replace'))
+            blank += b
+            code += c
+            comment += m
+        return blank, code, comment
+
+    # (blank, code, comment) of the lines the commit adds
+    def diff_stats(self, commit_sha, parents):
+        output = self._git('diff-tree', '-p', '-U0', '--no-color', '--no-renames', '--no-commit-id',
+                           *self._diff_tree_args(commit_sha, parents))
+        # added lines of every file, keyed by the path after the commit
+        files = []
+        in_header = False
+        for line in output.split(b'\n'):
+            if line.startswith(b'diff --git '):
+                files.append([None, []])
+                in_header = True
+            elif in_header:
+                if line.startswith(b'+++ ') and line != b'+++ /dev/null':
+                    files[-1][0] = line[6:].decode('utf-8', 'replace')
+                elif line.startswith(b'@@'):
+                    in_header = False
+            elif line.startswith(b'+'):
+                files[-1][1].append(line[1:])
+
+        blank = code = comment = 0
+        for path, added in files:
+            if path is not None and added:
+                b, c, m = classify_lines(added, comment_syntax(path))
+                blank += b
+                code += c
+                comment += m
+        return blank, code, comment
+
+    def close(self):
+        if self._cat_file is not None:
+            self._cat_file.stdin.close()
+            self._cat_file.wait()
+            self._cat_file = None
@@ -0,0 +1,28 @@
+# the scripts of copilot_study and keyword_search import each other as top-level modules
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+for path in (os.path.dirname(HERE), os.path.join(os.path.dirname(HERE), 'keyword_search')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+# factory for gh_mock_server.MockGitHub instances served on free ports: mock_github(**options) -> (mock, url)
+@pytest.fixture
+def mock_github():
+    from gh_mock_server import MockGitHub, serve_in_thread
+
+    stops = []
+
+    def start(**options):
+        mock = MockGitHub(**options)
+        url, stop = serve_in_thread(mock)
+        stops.append(stop)
+        return mock, url
+
+    yield start
+    for stop in stops:
+        stop()
@@ -0,0 +1,95 @@
+# gh_monthly_commit_code.mine_repository on a small local repository: mining a mirror
+# incrementally, commit by commit, must give the same monthly rows as one full mining run
+
+import os
+import subprocess
+from datetime import datetime
+
+import pytest
+
+from gh_monthly_commit_code import mine_repository
+
+START, END = datetime(2019, 7, 1), datetime(2023, 7, 1)
+
+FILES = {
+    'Main.java': 'public class Main {{\n    // entry point {0}\n    int x = {0};\n\n}}\n',
+    'tool.py': '# helper {0}\n"""doc"""\nvalue = {0}\n\n',
+    'README.md': 'notes {0}\n',
+}
+
+
+def git(path, *args, date=None):
+    env = dict(os.environ, GIT_AUTHOR_NAME='dev', GIT_AUTHOR_EMAIL='dev@example.com',
+               GIT_COMMITTER_NAME='dev', GIT_COMMITTER_EMAIL='dev@example.com')
+    if date:
+        env['GIT_AUTHOR_DATE'] = env['GIT_COMMITTER_DATE'] = date
+    return subprocess.run(['git', '-C', path, *args], check=True, capture_output=True, text=True,
+                          env=env).stdout.strip()
+
+
+# commit i changes one file, in a month of its own every third commit
+def commit(path, i, author='dev'):
+    name = sorted(FILES)[i % len(FILES)]
+    with open(os.path.join(path, name), 'w') as file:
+        file.write(FILES[name].format(i) * (i % 4 + 1))
+    git(path, 'add', name)
+    date = f"2020-{i // 3 % 12 + 1:02d}-{i % 28 + 1:02d}T12:00:00"
+    git(path, '-c', f'user.name={author}', 'commit', '-q', '--author', f'{author} <{author}@example.com>',
+        '-m', f'commit {i}', date=date)
+
+
+@pytest.fixture
+def origin(tmp_path):
+    path = str(tmp_path / 'origin')
+    os.makedirs(path)
+    git(path, 'init', '-q', '-b', 'main')
+    return path
+
+
+def full_rows(repo_path, diff_only):
+    repo, rows, error = mine_repository('owner/repo', repo_path, START, END, diff_only=diff_only)
+    assert error is None
+    return rows
+
+
+@pytest.mark.parametrize('diff_only', [False, True])
+def test_incremental_mining_matches_full_mining(origin, tmp_path, diff_only):
+    mirror_dir = str(tmp_path / 'mirrors')
+    for i in range(4):
+        commit(origin, i, author=f'dev{i % 2}')
+
+    for i in range(4, 16):
+        commit(origin, i, author=f'dev{i % 3}')
+        if i == 9:
+            # a merged branch brings a merge commit
+            git(origin, 'checkout', '-q', '-b', 'topic', 'HEAD~2')
+            commit(origin, 100)
+            git(origin, 'checkout', '-q', 'main')
+            git(origin, 'merge', '-q', '--no-ff', '-m', 'merge topic', 'topic', date='2020-04-20T12:00:00')
+        if i % 4 == 0:
+            _, rows, error = mine_repository('owner/repo', origin, START, END, mirror_dir, diff_only)
+            assert error is None
+            assert rows == full_rows(origin, diff_only)
+
+    _, rows, error = mine_repository('owner/repo', origin, START, END, mirror_dir, diff_only)
+    assert error is None
+    assert rows == full_rows(origin, diff_only)
+    assert sum(row['merge_commits'] for row in rows) == 1
+    assert len(rows) > 3 and all(row['code_lines'] > 0 for row in rows)
+    # nothing new: the saved state answers
+    assert mine_repository('owner/repo', origin, START, END, mirror_dir, diff_only)[1] == rows
+
+
+def test_rewritten_history_is_mined_again(origin, tmp_path):
+    mirror_dir = str(tmp_path / 'mirrors')
+    for i in range(6):
+        commit(origin, i)
+    assert mine_repository('owner/repo', origin, START, END, mirror_dir)[2] is None
+
+    # a force push drops the last two commits and adds others
+    git(origin, 'reset', '-q', '--hard', 'HEAD~2')
+    for i in range(20, 23):
+        commit(origin, i)
+    _, rows, error = mine_repository('owner/repo', origin, START, END, mirror_dir)
+    assert error is None
+    assert rows == full_rows(origin, False)
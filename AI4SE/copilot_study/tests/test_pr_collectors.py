@@ -0,0 +1,74 @@
+# the collectors of gh_monthly_pr_code.py against the local mock of gh_mock_server.py:
+# every collector must write the same monthly aggregates
+
+import pandas as pd
+import pytest
+
+import gh_monthly_pr_code
+import keyword_search.rate_limit
+
+REPOS = [f"owner{i}/repo{i}" for i in range(6)]
+
+
+@pytest.fixture(autouse=True)
+def repository_list(monkeypatch):
+    monkeypatch.setattr(gh_monthly_pr_code, 'load_repository_list', lambda: pd.DataFrame({'name': REPOS}))
+    monkeypatch.setattr(gh_monthly_pr_code, 'read_github_token', lambda path: 'token')
+    # secondary rate limits wait a minute and more by default
+    monkeypatch.setattr(keyword_search.rate_limit, 'SECONDARY_LIMIT_WAIT', 0.1)
+
+
+def collect(collector, url, tmp_path, concurrency=3, batch_size=2):
+    output = tmp_path / f"{collector}.csv"
+    gh_monthly_pr_code.process_repositories(collector, concurrency, str(output), batch_size, url)
+    return pd.read_csv(output).sort_values(['repository', 'month']).reset_index(drop=True)
+
+
+def test_async_collector_matches_pygithub(mock_github, tmp_path):
+    _, url = mock_github()
+    expected = collect('pygithub', url, tmp_path)
+    assert sorted(expected['repository'].unique()) == sorted(REPOS)
+    pd.testing.assert_frame_equal(collect('async', url, tmp_path), expected)
+
+
+def test_async_collector_one_listing_per_repository(mock_github, tmp_path):
+    mock, url = mock_github()
+    collect('async', url, tmp_path)
+    assert set(mock.requests) == {'/repos/{owner}/{repo}/issues'}
+
+
+def test_async_collector_retries_rate_limits_and_errors(mock_github, tmp_path):
+    _, url = mock_github()
+    expected = collect('async', url, tmp_path)
+    _, url = mock_github(limit=15, reset_in=1, fail_every=11, secondary_every=7)
+    pd.testing.assert_frame_equal(collect('async', url, tmp_path), expected)
+
+
+@pytest.mark.parametrize('batch_size', [1, 4, 10])
+def test_graphql_collector_matches_async(mock_github, tmp_path, batch_size):
+    mock, url = mock_github()
+    expected = collect('async', url, tmp_path)
+    pd.testing.assert_frame_equal(collect('graphql', url, tmp_path, concurrency=2, batch_size=batch_size), expected)
+    assert mock.requests['/graphql'] > 0
+
+
+def test_graphql_collector_waits_for_the_quota(mock_github, tmp_path):
+    _, url = mock_github()
+    expected = collect('async', url, tmp_path)
+    # 3 requests per 1s window: most queries have to wait for a reset
+    _, url = mock_github(limit=3, reset_in=1)
+    pd.testing.assert_frame_equal(collect('graphql', url, tmp_path, concurrency=2, batch_size=2), expected)
+
+
+# a batch whose repositories are through their issues must not declare $since, GitHub rejects unused variables
+def test_graphql_query_declares_only_used_variables():
+    from gh_async_client import RepoPages, build_graphql_query
+
+    pages = [RepoPages('owner0/repo0'), RepoPages('owner1/repo1')]
+    query, variables = build_graphql_query(pages, '2019-07-01T00:00:00Z')
+    assert '$since: DateTime' in query and variables['since'] == '2019-07-01T00:00:00Z'
+
+    for repository in pages:
+        del repository.cursors['issues']
+    query, variables = build_graphql_query(pages, '2019-07-01T00:00:00Z')
+    assert '$since' not in query and 'since' not in variables
@@ -0,0 +1,74 @@
+# keyword_search/Get_readme_files.py against the local mock of gh_mock_server.py:
+# resumed runs skip what is on disk, --refresh revalidates with ETags and gets 304s
+
+import csv
+import json
+import os
+
+import pytest
+
+import Get_readme_files
+import gh_mock_server
+
+REPOS = [f"owner{i}/repo{i}" for i in range(20)]
+README_REQUESTS = '/repos/{owner}/{repo}/readme'
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open('repos.csv', 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['name'])
+        writer.writerows([repo] for repo in REPOS)
+    return tmp_path
+
+
+def download(url, refresh=False):
+    Get_readme_files.download_readmes_from_csv('repos.csv', workers=4, refresh=refresh, api_url=url)
+    with open(Get_readme_files.STATE_FILE) as file:
+        return json.load(file)
+
+
+def saved_readme(repo):
+    with open(Get_readme_files.readme_path(repo), 'rb') as file:
+        return file.read()
+
+
+def test_download_resume_and_refresh(mock_github, workdir):
+    mock, url = mock_github()
+    missing = [repo for repo in REPOS if gh_mock_server.synthetic_readme(repo) is None]
+    assert missing, 'the mock should have repositories without a README'
+
+    state = download(url)
+    assert {repo for repo in REPOS if state[repo]['status'] == 404} == set(missing)
+    for repo in set(REPOS) - set(missing):
+        assert state[repo]['status'] == 200 and state[repo]['etag']
+        assert saved_readme(repo) == gh_mock_server.synthetic_readme(repo)
+    assert mock.requests[README_REQUESTS] == len(REPOS)
+
+    # a restarted run makes no README request at all
+    download(url)
+    assert mock.requests[README_REQUESTS] == len(REPOS)
+
+    # --refresh: unchanged READMEs answer 304 and don't use up the quota, only the 404s do
+    remaining = mock.remaining
+    state = download(url, refresh=True)
+    assert mock.requests[README_REQUESTS] == 2 * len(REPOS)
+    assert all(state[repo]['status'] == 304 for repo in set(REPOS) - set(missing))
+    assert mock.remaining == remaining - len(missing)
+
+
+def test_refresh_downloads_changed_readmes(mock_github, workdir, monkeypatch):
+    _, url = mock_github()
+    download(url)
+    changed = next(repo for repo in REPOS if gh_mock_server.synthetic_readme(repo) is not None)
+
+    synthetic_readme = gh_mock_server.synthetic_readme
+    monkeypatch.setattr(gh_mock_server, 'synthetic_readme',
+                        lambda repo: b'# changed\n' if repo == changed else synthetic_readme(repo))
+    state = download(url, refresh=True)
+    assert state[changed]['status'] == 200
+    assert saved_readme(changed) == b'# changed\n'
+    assert sum(entry['status'] == 304 for entry in state.values()) == sum(
+        synthetic_readme(repo) is not None for repo in REPOS) - 1